@@ -0,0 +1,259 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+from .metrics import metrics
+from .resilience import UpstreamError, parse_overrides
+from .retrieval import estimate_tokens
+
+# --- Admission Control Configuration ---
+# 업스트림 계정 한도 (tokens/requests per minute). 0이면 그 축은 제한하지 않고, 둘 다 0이면 입장 제어를 끈다.
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))
+# 한도의 이 비율까지만 쓴다 (재시도/헤지, 같은 키를 쓰는 다른 프로세스 몫)
+ADMISSION_HEADROOM = float(os.getenv("ADMISSION_HEADROOM", "0.9"))
+# 예상 대기 시간이 이보다 길면 줄 세우지 않고 바로 429 + Retry-After (우선순위별, 초)
+ADMISSION_MAX_WAIT = os.getenv("ADMISSION_MAX_WAIT", "interactive=10,bulk=60,speculative=0")
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "512"))
+# 클라이언트 하나가 대기열에 올릴 수 있는 요청 수
+ADMISSION_CLIENT_QUEUE = int(os.getenv("ADMISSION_CLIENT_QUEUE", "32"))
+# operation별 예상 출력 토큰 (입력은 프롬프트 크기로 추정)
+ADMISSION_OUTPUT_TOKENS = os.getenv("ADMISSION_OUTPUT_TOKENS", "analyze=700,analyze-extract=350,analyze-suggest=150,analyze-connect=150,chat-to-nodes=600,chat=300,summary=300")
+DEFAULT_OUTPUT_TOKENS = 500
+
+# 높은 것부터. speculative(추측 생성)는 기다리지 않고 여유가 있을 때만 들어간다.
+PRIORITIES = ("interactive", "bulk", "speculative")
+
+# 현재 요청을 보낸 클라이언트와 우선순위 (미들웨어/잡 워커가 정한다)
+_client: ContextVar[str] = ContextVar("admission_client", default="anonymous")
+_priority: ContextVar[str] = ContextVar("admission_priority", default="interactive")
+
+
+def bind(client: Optional[str] = None, priority: Optional[str] = None) -> None:
+    """이후 이 컨텍스트에서 나가는 LLM 호출의 클라이언트/우선순위"""
+    if client is not None:
+        _client.set(client)
+    if priority is not None:
+        _priority.set(priority)
+
+
+def current_client() -> str:
+    return _client.get()
+
+
+def estimate_cost(messages: List[Dict[str, str]], operation: str, output_tokens: Dict[str, float]) -> int:
+    """입력(프롬프트에 실린 히스토리/대화 포함) + 예상 출력 토큰"""
+    prompt = sum(estimate_tokens(m["content"]) for m in messages)
+    return prompt + int(output_tokens.get(operation, DEFAULT_OUTPUT_TOKENS))
+
+
+class AdmissionRejected(UpstreamError):
+    """한도 안에서 제때 처리할 수 없어 업스트림에 보내기 전에 거절한 요청"""
+    status_code = 429
+
+
+class TokenBucket:
+    """분당 한도를 초당 보충 속도로. 용량은 1분치라 한도만큼의 순간 버스트를 허용한다."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float, ahead: float = 0.0) -> float:
+        """ahead만큼 먼저 나간 뒤 cost를 낼 수 있을 때까지 걸리는 시간"""
+        self.refill(now)
+        return max(0.0, (ahead + cost - self.tokens) / self.rate)
+
+    def take(self, cost: float) -> None:
+        self.tokens -= cost
+
+
+class Waiter:
+    __slots__ = ("cost", "client", "priority", "future", "enqueued")
+
+    def __init__(self, cost: int, client: str, priority: str, future: asyncio.Future):
+        self.cost = cost
+        self.client = client
+        self.priority = priority
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class AdmissionController:
+    """
+    업스트림 TPM/RPM 한도에 맞춘 토큰 버킷 앞의 대기열.
+    우선순위별로 클라이언트마다 줄을 따로 두고 라운드 로빈으로 꺼내므로, 한 클라이언트가 요청을 쏟아부어도
+    다른 클라이언트는 자기 차례를 받는다. 한도 안에서 ADMISSION_MAX_WAIT 안에 못 나갈 요청은 미리 거절한다.
+    """
+
+    def __init__(
+        self,
+        tpm: int = LLM_TPM_LIMIT,
+        rpm: int = LLM_RPM_LIMIT,
+        headroom: float = ADMISSION_HEADROOM,
+        max_wait: Optional[Dict[str, float]] = None,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        client_queue: int = ADMISSION_CLIENT_QUEUE,
+        output_tokens: Optional[Dict[str, float]] = None,
+    ):
+        self.tokens = TokenBucket(tpm * headroom) if tpm else None
+        self.requests = TokenBucket(rpm * headroom) if rpm else None
+        self.max_wait = max_wait if max_wait is not None else parse_overrides(ADMISSION_MAX_WAIT)
+        self.max_queue = max_queue
+        self.client_queue = client_queue
+        self.output_tokens = output_tokens if output_tokens is not None else parse_overrides(ADMISSION_OUTPUT_TOKENS)
+        self._queues: Dict[str, "OrderedDict[str, Deque[Waiter]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._queued_cost = {p: 0 for p in PRIORITIES}
+        self._depth = {p: 0 for p in PRIORITIES}
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.tokens is not None or self.requests is not None
+
+    def _wait_time(self, cost: int, now: float, ahead_cost: int = 0, ahead_requests: int = 0) -> float:
+        wait = 0.0
+        if self.tokens is not None:
+            wait = self.tokens.wait_time(min(cost, self.tokens.capacity), now, ahead_cost)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now, ahead_requests))
+        return wait
+
+    def _take(self, cost: int) -> None:
+        if self.tokens is not None:
+            self.tokens.take(min(cost, self.tokens.capacity))
+        if self.requests is not None:
+            self.requests.take(1)
+
+    def _ahead(self, priority: str):
+        """이 우선순위 요청보다 먼저 나갈 대기 요청의 (토큰, 요청 수)"""
+        rank = PRIORITIES.index(priority)
+        higher = PRIORITIES[:rank + 1]
+        return sum(self._queued_cost[p] for p in higher), sum(self._depth[p] for p in higher)
+
+    async def admit(self, cost: int, operation: str = "default", priority: Optional[str] = None) -> None:
+        """
+        토큰 버킷에서 cost를 낼 수 있을 때까지 기다린다. 제때 못 나갈 요청이면 AdmissionRejected.
+        priority를 주면 컨텍스트의 우선순위 대신 쓴다 (헤지처럼 요청 하나에 딸린 추가 호출).
+        """
+        if not self.enabled:
+            return
+        client, priority = _client.get(), priority or _priority.get()
+        if priority not in self._queues:
+            priority = "interactive"
+        now = time.monotonic()
+        ahead_cost, ahead_requests = self._ahead(priority)
+        wait = self._wait_time(cost, now, ahead_cost, ahead_requests)
+        if wait == 0.0:
+            self._take(cost)
+            metrics.inc("thinking_admission_total", priority=priority, outcome="admitted")
+            metrics.observe("thinking_admission_wait_seconds", 0.0, priority=priority)
+            return
+
+        queue = self._queues[priority].get(client)
+        if (
+            wait > self.max_wait.get(priority, 0.0)
+            or sum(self._depth.values()) >= self.max_queue
+            or (queue is not None and len(queue) >= self.client_queue)
+        ):
+            metrics.inc("thinking_admission_total", priority=priority, outcome="rejected")
+            raise AdmissionRejected(
+                f"LLM capacity is saturated ({operation}); retry later.", retry_after=max(1.0, wait),
+            )
+
+        waiter = Waiter(cost, client, priority, asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(client, deque()).append(waiter)
+        self._queued_cost[priority] += cost
+        self._depth[priority] += 1
+        metrics.inc("thinking_admission_total", priority=priority, outcome="queued")
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        try:
+            await waiter.future
+        finally:
+            if waiter.future.cancelled() or not waiter.future.done():
+                # 기다리던 요청이 취소됨 (클라이언트 연결 끊김 등) — 줄에서 뺀다
+                waiter.future.cancel()
+                self._remove(waiter)
+        metrics.observe("thinking_admission_wait_seconds", time.monotonic() - waiter.enqueued, priority=priority)
+
+    def _remove(self, waiter: Waiter) -> None:
+        clients = self._queues[waiter.priority]
+        queue = clients.get(waiter.client)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del clients[waiter.client]
+        self._queued_cost[waiter.priority] -= waiter.cost
+        self._depth[waiter.priority] -= 1
+
+    def _next(self) -> Optional[Waiter]:
+        """가장 높은 우선순위에서 차례가 된 클라이언트의 첫 요청"""
+        for priority in PRIORITIES:
+            clients = self._queues[priority]
+            if clients:
+                return next(iter(clients.values()))[0]
+        return None
+
+    async def _dispatch(self) -> None:
+        while True:
+            waiter = self._next()
+            if waiter is None:
+                return
+            if waiter.future.done():
+                self._remove(waiter)
+                continue
+            delay = self._wait_time(waiter.cost, time.monotonic())
+            if delay > 0:
+                # 자는 동안 더 높은 우선순위 요청이 오면 깨어난 뒤 그쪽을 먼저 내보낸다
+                await asyncio.sleep(delay)
+                continue
+            self._remove(waiter)
+            clients = self._queues[waiter.priority]
+            if waiter.client in clients:
+                clients.move_to_end(waiter.client)  # 라운드 로빈: 방금 나간 클라이언트는 맨 뒤로
+            self._take(waiter.cost)
+            waiter.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        buckets = {}
+        for name, bucket in (("tokens", self.tokens), ("requests", self.requests)):
+            if bucket is not None:
+                bucket.refill(now)
+                buckets[name] = {"available": round(bucket.tokens, 1), "capacity": bucket.capacity}
+        return {
+            "buckets": buckets,
+            "queue_depth": dict(self._depth),
+            "queued_tokens": dict(self._queued_cost),
+            "clients": {p: len(self._queues[p]) for p in PRIORITIES},
+        }
+
+
+class AdmissionContextMiddleware:
+    """X-Client-Id(없으면 접속 IP)를 공정 대기열의 클라이언트 키로, X-Priority: bulk를 낮은 우선순위로 쓴다"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            headers = dict(scope.get("headers") or [])
+            client = headers.get(b"x-client-id")
+            if client is not None:
+                client = client.decode(errors="replace")
+            elif scope.get("client"):
+                client = scope["client"][0]
+            # 클라이언트는 우선순위를 낮출 수만 있다
+            priority = "bulk" if headers.get(b"x-priority") == b"bulk" else "interactive"
+            bind(client or "anonymous", priority)
+        await self.app(scope, receive, send)
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+from .schemas import response_schemas
+
+# --- LLM Cache Configuration ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+# 비어 있으면 디스크 계층 없이 메모리 LRU만 사용
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", "")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def schema_fingerprint(response_format) -> str:
+    """응답 스키마(Pydantic 모델)의 지문. 스키마 레지스트리에 미리 계산되어 있다."""
+    if response_format is None:
+        return "text"
+    return response_schemas.get(response_format).fingerprint
+
+
+def make_cache_key(model: str, messages: List[Dict[str, str]], response_format=None) -> str:
+    """모델 + 정규화된 프롬프트 + 응답 스키마로 만든 content-addressed 키"""
+    normalized = [
+        [m["role"], _WHITESPACE.sub(" ", m["content"]).strip()]
+        for m in messages
+    ]
+    payload = json.dumps(
+        [model, schema_fingerprint(response_format), normalized],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    LLM 응답(텍스트 또는 structured output JSON)만 저장하는 캐시.
+    메모리 LRU + TTL이 1차, 선택적으로 SQLite 디스크 계층이 2차.
+    노드 ID/위치는 캐시하지 않으므로 hit이어도 매번 새로 만들어진다.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        ttl: float = LLM_CACHE_TTL,
+        db_path: str = LLM_CACHE_DB_PATH,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # key → (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        self._conn = None
+        self._lock = threading.Lock()
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self._conn is not None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                value, expires_at = row
+                if isinstance(value, str) and isinstance(expires_at, (int, float)) and expires_at > now:
+                    self._remember(key, value, expires_at)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+                # 만료되었거나 깨진 행은 지워서 다시 읽지 않는다
+                self._delete_row(key)
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        """쓸 수 없는 값(호출한 쪽에서 파싱에 실패한 값 등)을 두 계층에서 모두 지운다"""
+        self._entries.pop(key, None)
+        if self._conn is not None:
+            self._delete_row(key)
+
+    def _delete_row(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,311 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Optional, Type
+from pydantic import BaseModel
+from .metrics import metrics, current_endpoint
+from .providers import LLMProvider, CompletionDelta, LLM_WARMUP_CONNECTIONS
+from .resilience import UpstreamError
+
+# --- LLM Cassette Configuration ---
+# "" | record | replay — record면 업스트림 요청/응답을 파일에 덧붙이고, replay면 녹화된 응답으로 답한다
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "")
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "llm_cassette.jsonl")
+# replay: 1이면 녹화된 업스트림 지연(첫 조각까지/전체)을 그대로 재현한다. 0이면 즉시 (순수 백엔드 오버헤드 측정용)
+LLM_CASSETTE_TIMING = os.getenv("LLM_CASSETTE_TIMING", "0") == "1"
+# replay에서 녹화에 없는 요청: error(424) | passthrough(실제 프로바이더로 보낸다)
+LLM_CASSETTE_MISS = os.getenv("LLM_CASSETTE_MISS", "error")
+# record: 회귀 러너가 다시 보낼 API 요청 본문도 함께 녹화할 경로
+LLM_CASSETTE_ENDPOINTS = os.getenv(
+    "LLM_CASSETTE_ENDPOINTS",
+    "/analyze,/analyze/stream,/chat,/chat/stream,/chat-to-nodes,/chat-to-nodes/stream",
+)
+
+# 이 요청의 히스토리 크기 (에이전트가 그래프/대화를 만들 때 적어 둔다)
+_history: ContextVar[Dict[str, int]] = ContextVar("cassette_history", default={})
+
+
+def note_history(**sizes: int) -> None:
+    """note_history(history_nodes=len(graph)) / note_history(chat_messages=len(messages))"""
+    _history.set({**_history.get(), **sizes})
+
+
+def request_hash(model: str, messages: List[Dict[str, str]], schema: Optional[str]) -> str:
+    """
+    호출 방식(parse/stream 등)은 넣지 않는다: 같은 프롬프트면 녹화 때 스트리밍이었어도
+    replay에서 한 번에 받는 호출로 쓸 수 있다 (응답 텍스트가 같으므로).
+    """
+    payload = json.dumps([model, schema, messages], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CassetteMiss(UpstreamError):
+    """replay 중 녹화에 없는 요청 (프롬프트가 바뀌었거나 녹화되지 않은 경로)"""
+    status_code = 424
+
+
+class CassetteWriter:
+    """한 줄에 JSON 하나씩 덧붙이기만 하는 파일. 줄마다 flush해서 프로세스가 죽어도 앞부분은 남는다."""
+
+    def __init__(self, path: str = LLM_CASSETTE_PATH):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def load_cassette(path: str = LLM_CASSETTE_PATH) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def split_chunks(text: str, count: int) -> List[str]:
+    """녹화된 조각 수만큼 고르게 나눈다 (조각 경계는 녹화하지 않는다)"""
+    count = max(1, min(count, len(text)))
+    size = -(-len(text) // count) if text else 1
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class CassetteProvider(LLMProvider):
+    """
+    다른 프로바이더를 감싸 업스트림 호출을 녹화하거나(record) 녹화로 답한다(replay).
+    녹화 항목에는 응답과 함께 실제 업스트림 지연, 첫 조각까지 시간, 요청의 히스토리 크기와 프롬프트 크기를 남긴다.
+    replay는 요청 해시로 항목을 찾고, 같은 해시가 여러 번 녹화되었으면 순서대로 쓴 뒤 마지막 것을 반복한다.
+    """
+
+    def __init__(
+        self,
+        inner: Optional[LLMProvider],
+        mode: str,
+        path: str = LLM_CASSETTE_PATH,
+        timing: bool = LLM_CASSETTE_TIMING,
+        on_miss: str = LLM_CASSETTE_MISS,
+        entries: Optional[List[Dict[str, Any]]] = None,
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.inner = inner
+        self.mode = mode
+        self.timing = timing
+        self.on_miss = on_miss
+        self.writer = CassetteWriter(path) if mode == "record" else None
+        self._recorded: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        if mode == "replay":
+            for entry in entries if entries is not None else load_cassette(path):
+                if entry.get("type") == "llm":
+                    self._recorded[entry["hash"]].append(entry)
+        self.configured = mode == "replay" or (inner is not None and inner.configured)
+        self.counts = {"recorded": 0, "hit": 0, "miss": 0}
+
+    def _count(self, outcome: str) -> None:
+        self.counts[outcome] += 1
+        metrics.inc("thinking_cassette_total", outcome=outcome)
+
+    # ── record ──
+    def _record(
+        self, key: str, call: str, model: str, messages: List[Dict[str, str]], schema: Optional[str],
+        response: str, started: float, first_at: Optional[float], chunks: int, usage: Optional[Dict[str, Any]],
+    ) -> None:
+        now = time.perf_counter()
+        self.writer.append({
+            "type": "llm",
+            "hash": key,
+            "call": call,
+            "model": model,
+            "schema": schema,
+            "endpoint": current_endpoint(),
+            **_history.get(),
+            "prompt_chars": sum(len(m["content"]) for m in messages),
+            "latency_ms": round((now - started) * 1000, 1),
+            "ttft_ms": round((first_at - started) * 1000, 1) if first_at else None,
+            "chunks": chunks,
+            "response": response,
+            "usage": usage,
+            "at": time.time(),
+        })
+        self._count("recorded")
+
+    # ── replay ──
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        recorded = self._recorded.get(key)
+        if not recorded:
+            self._count("miss")
+            return None
+        index = min(self._cursor[key], len(recorded) - 1)
+        self._cursor[key] += 1
+        self._count("hit")
+        return recorded[index]
+
+    def _missed(self, model: str) -> None:
+        if self.on_miss != "passthrough" or self.inner is None:
+            raise CassetteMiss(f"No recorded LLM response for this {model} request.")
+
+    async def _replay_chunks(self, entry: Dict[str, Any]) -> AsyncIterator[str]:
+        chunks = split_chunks(entry["response"], entry.get("chunks") or 1)
+        latency = entry["latency_ms"] / 1000 if self.timing else 0.0
+        ttft = (entry.get("ttft_ms") or entry["latency_ms"]) / 1000 if self.timing else 0.0
+        step = max(0.0, latency - ttft) / max(1, len(chunks) - 1)
+        if ttft:
+            await asyncio.sleep(ttft)
+        for i, chunk in enumerate(chunks):
+            if i and step:
+                await asyncio.sleep(step)
+            yield chunk
+        if entry.get("usage"):
+            metrics.record_usage(entry["model"], entry["usage"])
+
+    async def _replay(self, entry: Dict[str, Any]) -> str:
+        if self.timing:
+            await asyncio.sleep(entry["latency_ms"] / 1000)
+        if entry.get("usage"):
+            metrics.record_usage(entry["model"], entry["usage"])
+        return entry["response"]
+
+    # ── LLMProvider ──
+    async def parse(self, model, messages, response_format: Type[BaseModel]):
+        key = request_hash(model, messages, response_format.__name__)
+        if self.mode == "replay":
+            entry = self._lookup(key)
+            if entry is not None:
+                return response_format.model_validate_json(await self._replay(entry))
+            self._missed(model)
+        started = time.perf_counter()
+        parsed = await self.inner.parse(model, messages, response_format)
+        if self.writer is not None:
+            self._record(key, "parse", model, messages, response_format.__name__,
+                         parsed.model_dump_json(), started, None, 1, None)
+        return parsed
+
+    async def complete(self, model, messages):
+        key = request_hash(model, messages, None)
+        if self.mode == "replay":
+            entry = self._lookup(key)
+            if entry is not None:
+                return await self._replay(entry)
+            self._missed(model)
+        started = time.perf_counter()
+        reply = await self.inner.complete(model, messages)
+        if self.writer is not None:
+            self._record(key, "complete", model, messages, None, reply, started, None, 1, None)
+        return reply
+
+    async def stream(self, model, messages):
+        key = request_hash(model, messages, None)
+        if self.mode == "replay":
+            entry = self._lookup(key)
+            if entry is not None:
+                async for chunk in self._replay_chunks(entry):
+                    yield CompletionDelta(chunk)
+                yield CompletionDelta(None, entry.get("usage"))
+                return
+            self._missed(model)
+        started = time.perf_counter()
+        first_at, parts, usage = None, [], None
+        async for delta in self.inner.stream(model, messages):
+            if delta.content:
+                first_at = first_at or time.perf_counter()
+                parts.append(delta.content)
+            if delta.usage is not None:
+                usage = delta.usage
+            yield delta
+        if self.writer is not None:
+            self._record(key, "stream", model, messages, None, "".join(parts), started, first_at, len(parts), usage)
+
+    async def stream_structured(self, model, messages, response_format):
+        key = request_hash(model, messages, response_format.__name__)
+        if self.mode == "replay":
+            entry = self._lookup(key)
+            if entry is not None:
+                async for chunk in self._replay_chunks(entry):
+                    yield chunk
+                return
+            self._missed(model)
+        started = time.perf_counter()
+        first_at, parts = None, []
+        async for delta in self.inner.stream_structured(model, messages, response_format):
+            first_at = first_at or time.perf_counter()
+            parts.append(delta)
+            yield delta
+        if self.writer is not None:
+            self._record(key, "stream_structured", model, messages, response_format.__name__,
+                         "".join(parts), started, first_at, len(parts), None)
+
+    async def warm_up(self, connections: int = LLM_WARMUP_CONNECTIONS) -> int:
+        if self.mode == "replay" or self.inner is None:
+            return 0
+        return await self.inner.warm_up(connections)
+
+    async def aclose(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        if self.inner is not None:
+            await self.inner.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "timing": self.timing, "requests": len(self._recorded), "counts": dict(self.counts)}
+
+
+def cassette_provider(provider: LLMProvider, mode: str = LLM_CASSETTE) -> LLMProvider:
+    """LLM_CASSETTE가 설정되어 있으면 provider를 녹화/재생 래퍼로 감싼다"""
+    if not mode:
+        return provider
+    return CassetteProvider(provider, mode)
+
+
+class CassetteRecorderMiddleware:
+    """
+    record 모드에서 회귀 러너가 다시 보낼 API 요청(경로 + 본문)과 응답 상태/시간을 같은 파일에 남긴다.
+    http 항목을 녹화된 순서대로 다시 보내면 같은 프롬프트가 만들어져 녹화된 LLM 항목으로 답할 수 있다.
+    """
+
+    def __init__(self, app, writer: CassetteWriter, paths: str = LLM_CASSETTE_ENDPOINTS):
+        self.app = app
+        self.writer = writer
+        self.paths = set(paths.split(","))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        body: List[bytes] = []
+        status = 500
+        started = time.perf_counter()
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.append(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            try:
+                payload = json.loads(b"".join(body) or b"null")
+            except ValueError:
+                payload = None
+            self.writer.append({
+                "type": "http",
+                "path": scope["path"],
+                "body": payload,
+                "status": status,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                "at": time.time(),
+            })
@@ -0,0 +1,126 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+from fastapi import WebSocket
+from .metrics import metrics
+from .serialization import dumps_str
+
+# --- WebSocket Channel Configuration ---
+# 연결마다 보내기 대기열 크기. 가득 차면 이벤트를 만드는 쪽(LLM 스트림 소비)이 기다린다.
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", "256"))
+# 연결 하나에서 동시에 진행할 수 있는 요청 수 (넘으면 429 error 메시지)
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "8"))
+
+# 정상 종료 외에 쓰는 close 코드
+CLOSE_SESSION_NOT_FOUND = 4404
+CLOSE_TOO_SLOW = 1013
+
+
+class ChannelBusy(Exception):
+    status_code = 429
+
+
+class Channel:
+    """
+    웹소켓 연결 하나.
+    보내는 메시지는 bounded queue를 거쳐 writer 태스크 하나가 순서대로 보낸다.
+    요청(op)은 correlation id별 태스크로 동시에 돌고, 각 이벤트에 그 id가 붙는다.
+    """
+
+    def __init__(self, websocket: WebSocket, send_queue: int = WS_SEND_QUEUE, max_inflight: int = WS_MAX_INFLIGHT):
+        self.websocket = websocket
+        self.max_inflight = max_inflight
+        self.ops: Dict[str, asyncio.Task] = {}
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(send_queue)
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._write())
+
+    async def _write(self) -> None:
+        while True:
+            message = await self._queue.get()
+            await self.websocket.send_text(dumps_str(message))
+            metrics.inc("thinking_ws_messages_total", direction="out", type=message.get("type", ""))
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        """대기열이 가득 차 있으면 자리가 날 때까지 기다린다 (느린 클라이언트 → 생산자 감속)"""
+        await self._queue.put(message)
+
+    def try_send(self, message: Dict[str, Any]) -> bool:
+        """다른 연결이 만든 푸시용. 기다리지 않고, 대기열이 가득 차 있으면 False."""
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def start_op(self, op_id: str, events: Callable[[], AsyncIterator[Dict[str, Any]]], on_error: Callable[[Exception], Dict[str, Any]],
+                 on_done: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> None:
+        """op_id로 태그한 이벤트를 흘려보내는 태스크를 띄운다. 실패는 error 메시지 하나로."""
+        if op_id in self.ops:
+            raise ValueError(f"Request id already in flight: {op_id}")
+        if len(self.ops) >= self.max_inflight:
+            raise ChannelBusy(f"At most {self.max_inflight} requests in flight per connection.")
+
+        async def run():
+            try:
+                async for event in events():
+                    await self.send({"id": op_id, **event})
+                    if event.get("type") == "done" and on_done is not None:
+                        await on_done(event)
+            except asyncio.CancelledError:
+                # 연결 종료로 취소될 때는 writer가 이미 멈췄을 수 있으므로 기다리지 않는다
+                self.try_send({"id": op_id, "type": "cancelled"})
+            except Exception as e:
+                await self.send({"id": op_id, "type": "error", **on_error(e)})
+            finally:
+                self.ops.pop(op_id, None)
+
+        self.ops[op_id] = asyncio.create_task(run())
+
+    def cancel_op(self, op_id: str) -> bool:
+        task = self.ops.get(op_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def close(self) -> None:
+        """진행 중인 요청을 취소하고 writer를 멈춘다 (연결이 이미 끊긴 뒤 호출)"""
+        for task in list(self.ops.values()):
+            task.cancel()
+        await asyncio.gather(*self.ops.values(), return_exceptions=True)
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+
+
+class SessionHub:
+    """캔버스 세션별로 열린 채널. 한 채널에서 그래프가 바뀌면 같은 세션의 다른 채널에 푸시한다."""
+
+    def __init__(self):
+        self.channels: Dict[str, Set[Channel]] = {}
+
+    def join(self, session_id: str, channel: Channel) -> None:
+        self.channels.setdefault(session_id, set()).add(channel)
+
+    def leave(self, session_id: str, channel: Channel) -> None:
+        channels = self.channels.get(session_id)
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del self.channels[session_id]
+
+    async def broadcast(self, session_id: str, message: Dict[str, Any], exclude: Optional[Channel] = None) -> None:
+        """푸시를 따라오지 못하는 채널은 닫는다 (재접속 후 GET /sessions로 다시 맞추면 된다)"""
+        for channel in list(self.channels.get(session_id, ())):
+            if channel is exclude:
+                continue
+            if not channel.try_send(message):
+                metrics.inc("thinking_ws_slow_closes_total")
+                self.leave(session_id, channel)
+                await channel.websocket.close(code=CLOSE_TOO_SLOW)
+
+    def connections(self) -> int:
+        return sum(len(channels) for channels in self.channels.values())
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Callable, Awaitable
+from pydantic import BaseModel
+from .models import ChatMessage
+from .retrieval import estimate_tokens
+
+# --- Conversation Compaction Configuration ---
+CHAT_COMPACTION = os.getenv("CHAT_COMPACTION", "1") == "1"
+# 요약하지 않고 그대로 보내는 최근 메시지 수
+CHAT_KEEP_MESSAGES = int(os.getenv("CHAT_KEEP_MESSAGES", "6"))
+# 대화 부분(요약 + 메시지)의 토큰 예산
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "2000"))
+CHAT_SUMMARY_MAX_CONVERSATIONS = int(os.getenv("CHAT_SUMMARY_MAX_CONVERSATIONS", "2048"))
+
+logger = logging.getLogger(__name__)
+
+
+def hash_messages(messages: List[ChatMessage]) -> str:
+    digest = hashlib.sha256()
+    for m in messages:
+        digest.update(m.role.encode())
+        digest.update(b"\0")
+        digest.update(m.content.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def messages_tokens(messages: List[ChatMessage]) -> int:
+    return sum(estimate_tokens(m.content) for m in messages)
+
+
+class ConversationSummary(BaseModel):
+    covered: int       # 요약에 반영된 앞쪽 메시지 수
+    prefix_hash: str   # messages[:covered]의 해시 (같은 대화인지 확인용)
+    text: str
+
+
+class ConversationCompactor:
+    """
+    긴 대화를 "누적 요약 + 최근 N개 메시지"로 줄인다.
+    요약은 요청 경로에서 기다리지 않고 백그라운드에서 한 번만 계산해 대화별로 캐시하며,
+    새로 밀려난 메시지만 기존 요약에 접어 넣는다(rolling).
+    대화 키가 없으면 다른 대화와 요약을 나누지 않도록 요약 없이 예산만 맞춘다.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[Optional[str], List[ChatMessage]], Awaitable[str]],
+        keep_messages: int = CHAT_KEEP_MESSAGES,
+        token_budget: int = CHAT_TOKEN_BUDGET,
+        max_conversations: int = CHAT_SUMMARY_MAX_CONVERSATIONS,
+    ):
+        self.summarize = summarize
+        self.keep_messages = keep_messages
+        self.token_budget = token_budget
+        self.max_conversations = max_conversations
+        self._summaries: "OrderedDict[str, ConversationSummary]" = OrderedDict()
+        self._pending: dict = {}  # conversation_key → asyncio.Task
+
+    def compact(
+        self, conversation_key: Optional[str], messages: List[ChatMessage]
+    ) -> Tuple[Optional[str], List[ChatMessage]]:
+        """(요약 또는 None, 그대로 보낼 메시지) — 예산 안이면 원본 그대로"""
+        if (
+            conversation_key is None
+            or messages_tokens(messages) <= self.token_budget
+            or len(messages) <= self.keep_messages
+        ):
+            return None, self._fit(None, list(messages))
+
+        older = messages[:-self.keep_messages]
+        recent = list(messages[-self.keep_messages:])
+
+        summary = self._summaries.get(conversation_key)
+        if summary is not None and (
+            summary.covered > len(older)
+            or hash_messages(older[:summary.covered]) != summary.prefix_hash
+        ):
+            summary = None  # 다른 대화이거나 편집된 대화
+        if summary is not None:
+            self._summaries.move_to_end(conversation_key)
+
+        covered = summary.covered if summary else 0
+        if covered < len(older):
+            self._schedule(conversation_key, summary, older)
+
+        # 아직 요약에 안 들어간 앞쪽 메시지는 예산이 허락하는 만큼 원문으로
+        pending_older = list(older[covered:])
+        summary_text = summary.text if summary else None
+        return summary_text, self._fit(summary_text, pending_older + recent)
+
+    def _fit(self, summary_text: Optional[str], messages: List[ChatMessage]) -> List[ChatMessage]:
+        """토큰 예산을 넘으면 가장 오래된 메시지부터 버린다 (마지막 메시지는 항상 유지)"""
+        used = estimate_tokens(summary_text) if summary_text else 0
+        kept: List[ChatMessage] = []
+        for m in reversed(messages):
+            cost = estimate_tokens(m.content)
+            if kept and used + cost > self.token_budget:
+                break
+            kept.append(m)
+            used += cost
+        kept.reverse()
+        return kept
+
+    def _schedule(self, conversation_key: str, summary: Optional[ConversationSummary], older: List[ChatMessage]) -> None:
+        if conversation_key in self._pending:
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._fold(conversation_key, summary, list(older))
+        )
+        self._pending[conversation_key] = task
+        task.add_done_callback(lambda _: self._pending.pop(conversation_key, None))
+
+    async def _fold(self, conversation_key: str, summary: Optional[ConversationSummary], older: List[ChatMessage]) -> None:
+        covered = summary.covered if summary else 0
+        try:
+            text = await self.summarize(summary.text if summary else None, older[covered:])
+        except Exception:
+            logger.exception("Conversation summary failed")
+            return
+        self._summaries[conversation_key] = ConversationSummary(
+            covered=len(older),
+            prefix_hash=hash_messages(older),
+            text=text,
+        )
+        self._summaries.move_to_end(conversation_key)
+        while len(self._summaries) > self.max_conversations:
+            self._summaries.popitem(last=False)
+
+    async def drain(self) -> None:
+        """대기 중인 백그라운드 요약이 끝날 때까지 기다린다 (테스트/종료 시)"""
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
@@ -0,0 +1,82 @@
+import os
+from typing import List
+import numpy as np
+from .models import UserNode, CrossConnectionResult
+from .retrieval import hashed_ngram_matrix
+from .sessions import GraphSession
+
+# --- Cross-Connection Configuration ---
+# llm: 모델이 cross_connections를 생성 / local: 로컬 유사도 + category/phase 친화도로 계산 (응답 스키마에서 필드를 뺀다)
+CROSS_CONNECTIONS = os.getenv("CROSS_CONNECTIONS", "llm")
+CROSS_MAX_EDGES = int(os.getenv("CROSS_MAX_EDGES", "3"))
+# 이 점수 미만 후보는 연결하지 않는다 (단, 기존 노드가 있으면 최고점 하나는 항상 연결)
+CROSS_MIN_SCORE = float(os.getenv("CROSS_MIN_SCORE", "0.45"))
+
+# 점수 = 텍스트 코사인 유사도 + 같은 category/phase 가산점 + 최근 노드 가산점(동점 정리용)
+SIMILARITY_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.2
+PHASE_WEIGHT = 0.1
+RECENCY_WEIGHT = 0.05
+
+
+def connection_label(existing_category: str, existing_phase: str, new_category: str, new_phase: str) -> str:
+    if existing_phase == "Problem" and new_phase == "Solution":
+        return "해결 방안"
+    if existing_phase == "Solution" and new_phase == "Problem":
+        return "해결 대상"
+    if existing_category == new_category:
+        return f"같은 {new_category} 관점"
+    return "관련"
+
+
+def score_matrix(graph: GraphSession, user_nodes: List[UserNode]) -> np.ndarray:
+    """(기존 노드 수, 새 노드 수) 점수 행렬. 행은 유사도 인덱스의 삽입 순서."""
+    index = graph.similarity_index
+    categories, phases = graph.node_facets()
+    queries = hashed_ngram_matrix([f"{n.label} {n.content}" for n in user_nodes], index.dim)
+    scores = SIMILARITY_WEIGHT * index.score_many(queries)
+    scores += CATEGORY_WEIGHT * (categories[:, None] == np.array([n.category for n in user_nodes])[None, :])
+    scores += PHASE_WEIGHT * (phases[:, None] == np.array([n.phase for n in user_nodes])[None, :])
+    scores += RECENCY_WEIGHT * np.linspace(0.0, 1.0, len(scores), dtype=np.float32)[:, None]
+    return scores
+
+
+def local_cross_connections(
+    graph: GraphSession,
+    user_nodes: List[UserNode],
+    max_edges: int = CROSS_MAX_EDGES,
+    min_score: float = CROSS_MIN_SCORE,
+) -> List[CrossConnectionResult]:
+    """
+    LLM 대신 새 노드와 기존 노드의 연결을 고른다 (결정적, 노드 수천 개에서도 행렬 곱 한 번).
+    점수가 높은 (기존, 새) 쌍부터 기존 노드가 겹치지 않게 최대 max_edges개.
+    """
+    if not len(graph) or not user_nodes or max_edges <= 0:
+        return []
+    scores = score_matrix(graph, user_nodes)
+    flat = scores.ravel()
+    # 기존 노드 중복을 건너뛰어도 max_edges개를 채울 만큼만 후보로 정렬한다
+    count = min(flat.size, max_edges * len(user_nodes))
+    top = np.argpartition(-flat, count - 1)[:count]
+    top = top[np.argsort(-flat[top], kind="stable")]
+
+    index = graph.similarity_index
+    categories, phases = graph.node_facets()
+    connections: List[CrossConnectionResult] = []
+    used_rows = set()
+    for cell in top.tolist():
+        row, new_index = divmod(cell, len(user_nodes))
+        if row in used_rows:
+            continue
+        if connections and flat[cell] < min_score:
+            break
+        used_rows.add(row)
+        new_node = user_nodes[new_index]
+        connections.append(CrossConnectionResult(
+            existing_node_id=index.ids[row],
+            new_node_index=new_index,
+            connection_label=connection_label(categories[row], phases[row], new_node.category, new_node.phase),
+        ))
+        if len(connections) == max_edges:
+            break
+    return connections
@@ -0,0 +1,124 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from .compaction import hash_messages
+from .metrics import metrics
+from .models import ChatMessage, Node
+
+# --- Incremental Chat Conversion Configuration ---
+# 1이면 대화별로 이미 노드로 만든 메시지를 기억해 두고, 다음 변환에는 새 턴만 보낸다
+CHAT_INCREMENTAL_CONVERSION = os.getenv("CHAT_INCREMENTAL_CONVERSION", "1") == "1"
+CHAT_CONVERSION_TTL = float(os.getenv("CHAT_CONVERSION_TTL", "86400"))
+CHAT_CONVERSION_MAX_CONVERSATIONS = int(os.getenv("CHAT_CONVERSION_MAX_CONVERSATIONS", "2048"))
+# 다음 변환 프롬프트에 요약으로 싣는 이전 노드 수 (최근 것부터)
+CHAT_CONVERSION_SUMMARY_NODES = int(os.getenv("CHAT_CONVERSION_SUMMARY_NODES", "12"))
+
+
+class ConvertedNode(BaseModel):
+    id: str
+    label: str
+    category: str
+    phase: str
+
+
+class ConversionCheckpoint(BaseModel):
+    covered: int       # 노드로 변환된 앞쪽 메시지 수
+    prefix_hash: str   # messages[:covered]의 해시 (같은 대화인지 확인용)
+    nodes: List[ConvertedNode]
+    updated: float
+
+
+def normalize_label(label: str) -> str:
+    return "".join(label.split()).lower()
+
+
+class ConversionCheckpoints:
+    """
+    대화(conversation_key)별로 어디까지 노드로 변환했는지와 그때 만든 노드를 기억한다.
+    다시 변환할 때는 체크포인트 이후의 새 턴만 프롬프트에 싣고, 이전 변환은 노드 목록 요약으로 대신한다.
+    대화가 편집되어 앞부분 해시가 달라지면 체크포인트를 버리고 처음부터 변환한다.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CHAT_CONVERSION_TTL,
+        max_conversations: int = CHAT_CONVERSION_MAX_CONVERSATIONS,
+        summary_nodes: int = CHAT_CONVERSION_SUMMARY_NODES,
+    ):
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self.summary_nodes = summary_nodes
+        self._checkpoints: "OrderedDict[str, ConversionCheckpoint]" = OrderedDict()
+        self._counts = {"full": 0, "incremental": 0, "unchanged": 0, "reset": 0}
+
+    def _count(self, outcome: str) -> None:
+        self._counts[outcome] += 1
+        metrics.inc("thinking_chat_conversion_total", outcome=outcome)
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        while self._checkpoints:
+            key, checkpoint = next(iter(self._checkpoints.items()))
+            if checkpoint.updated > cutoff and len(self._checkpoints) <= self.max_conversations:
+                break
+            del self._checkpoints[key]
+
+    def split(
+        self, conversation_key: str, messages: List[ChatMessage]
+    ) -> Tuple[Optional[ConversionCheckpoint], List[ChatMessage]]:
+        """(유효한 체크포인트 또는 None, 아직 변환하지 않은 메시지)"""
+        self._expire()
+        checkpoint = self._checkpoints.get(conversation_key)
+        if checkpoint is not None and (
+            checkpoint.covered > len(messages)
+            or hash_messages(messages[:checkpoint.covered]) != checkpoint.prefix_hash
+        ):
+            self._count("reset")  # 다른 대화이거나 편집된 대화
+            del self._checkpoints[conversation_key]
+            checkpoint = None
+        if checkpoint is None:
+            self._count("full")
+            return None, list(messages)
+        self._checkpoints.move_to_end(conversation_key)
+        pending = list(messages[checkpoint.covered:])
+        self._count("incremental" if pending else "unchanged")
+        return checkpoint, pending
+
+    def summary(self, checkpoint: ConversionCheckpoint) -> str:
+        """이전 변환에서 만든 노드를 한 줄씩 (프롬프트용, 최근 summary_nodes개)"""
+        nodes = checkpoint.nodes[-self.summary_nodes:]
+        omitted = len(checkpoint.nodes) - len(nodes)
+        lines = [f"- [{n.id}] {n.category}/{n.phase}: {n.label}" for n in nodes]
+        if omitted:
+            lines.insert(0, f"- (이전 노드 {omitted}개 생략)")
+        return "\n".join(lines)
+
+    def duplicates(self, checkpoint: Optional[ConversionCheckpoint]) -> set:
+        """이미 만든 노드와 같은 제목 (공백/대소문자 무시)"""
+        if checkpoint is None:
+            return set()
+        return {normalize_label(n.label) for n in checkpoint.nodes}
+
+    def record(self, conversation_key: str, messages: List[ChatMessage], created: List[Node]) -> ConversionCheckpoint:
+        """messages 전체를 변환한 것으로 기록하고 이번에 만든 노드를 이어 붙인다"""
+        previous = self._checkpoints.get(conversation_key)
+        nodes = list(previous.nodes) if previous is not None else []
+        nodes += [
+            ConvertedNode(id=n.id, label=n.data.label, category=n.data.category, phase=n.data.phase)
+            for n in created
+        ]
+        checkpoint = ConversionCheckpoint(
+            covered=len(messages),
+            prefix_hash=hash_messages(messages),
+            nodes=nodes,
+            updated=time.monotonic(),
+        )
+        self._checkpoints[conversation_key] = checkpoint
+        self._checkpoints.move_to_end(conversation_key)
+        self._expire()
+        return checkpoint
+
+    def stats(self) -> Dict[str, Any]:
+        return {"conversations": len(self._checkpoints), "counts": dict(self._counts)}
@@ -0,0 +1,376 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+from .admission import bind as bind_admission
+from .metrics import metrics
+from .serialization import dumps, loads
+
+# --- Background Job Configuration ---
+# 동시에 실행하는 잡 수 (LLM 동시성 상한은 ThinkingAgent 세마포어가 따로 건다)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# bulk 레인이 동시에 쓸 수 있는 워커 수 (나머지는 interactive 몫으로 남겨 둔다)
+JOB_BULK_WORKERS = int(os.getenv("JOB_BULK_WORKERS", "4"))
+# 대기열이 이보다 길면 제출을 거절한다 (429)
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+# 끝난 잡의 결과를 보관하는 시간(초)
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+# 만료된 결과를 지우는 주기(초). 요청이 없는 동안에도 워커 쪽에서 정리한다.
+JOB_PURGE_INTERVAL = float(os.getenv("JOB_PURGE_INTERVAL", "60"))
+# memory | sqlite
+JOB_STORE = os.getenv("JOB_STORE", "memory")
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+
+LANES = ("interactive", "bulk")
+TERMINAL = ("succeeded", "failed", "cancelled")
+
+Runner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    status_code = 429
+
+
+class Job:
+    """잡 하나의 상태. 요청 payload를 같이 저장해 재시작 후에도 다시 실행할 수 있다."""
+
+    def __init__(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        priority: str = "interactive",
+        job_id: Optional[str] = None,
+        client: Optional[str] = None,
+    ):
+        self.job_id = job_id or str(uuid.uuid4())
+        self.kind = kind
+        self.payload = payload
+        self.priority = priority
+        self.client = client  # 제출한 클라이언트 (LLM 입장 제어의 공정 대기열 키)
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Any] = None
+        self.status_code: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL
+
+    def expired(self, now: float, ttl: float) -> bool:
+        return self.finished_at is not None and now - self.finished_at > ttl
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "payload": self.payload,
+            "priority": self.priority,
+            "client": self.client,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "status_code": self.status_code,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def public(self) -> Dict[str, Any]:
+        """API 응답용 (요청 payload 제외)"""
+        data = self.to_dict()
+        del data["payload"]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        job = cls(data["kind"], data["payload"], data["priority"], data["job_id"], data.get("client"))
+        for key in ("status", "result", "error", "status_code", "created_at", "started_at", "finished_at"):
+            setattr(job, key, data.get(key))
+        return job
+
+
+class InMemoryJobStore:
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+
+    def save(self, job: Job) -> None:
+        self._jobs[job.job_id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def delete(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+
+    def unfinished(self) -> List[Job]:
+        return [job for job in self._jobs.values() if not job.done]
+
+    def purge_expired(self, now: float, ttl: float) -> int:
+        expired = [job_id for job_id, job in self._jobs.items() if job.expired(now, ttl)]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore(InMemoryJobStore):
+    """메모리 + SQLite write-through. 재시작하면 끝나지 않은 잡을 다시 큐에 넣을 수 있다."""
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, finished_at REAL, payload TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        for (payload,) in self._conn.execute("SELECT payload FROM jobs").fetchall():
+            job = Job.from_dict(json.loads(payload))
+            self._jobs[job.job_id] = job
+
+    def save(self, job: Job) -> None:
+        super().save(job)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, finished_at, payload) VALUES (?, ?, ?, ?)",
+                (job.job_id, job.status, job.finished_at, dumps(job.to_dict()).decode()),
+            )
+            self._conn.commit()
+
+    def delete(self, job_id: str) -> None:
+        super().delete(job_id)
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def purge_expired(self, now: float, ttl: float) -> int:
+        purged = super().purge_expired(now, ttl)
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (now - ttl,))
+            self._conn.commit()
+        return purged
+
+
+def create_job_store() -> InMemoryJobStore:
+    if JOB_STORE == "sqlite":
+        return SQLiteJobStore(JOB_DB_PATH)
+    return InMemoryJobStore()
+
+
+class JobManager:
+    """
+    잡 제출/실행/취소/구독.
+    워커는 항상 interactive 레인을 먼저 비우고, bulk 레인은 동시에 bulk_workers개까지만 실행한다.
+    따라서 대량 배치가 밀려 있어도 대화형 요청은 bulk 몫이 아닌 워커에서 바로 시작된다.
+    """
+
+    def __init__(
+        self,
+        runners: Dict[str, Runner],
+        store: Optional[InMemoryJobStore] = None,
+        workers: int = JOB_WORKERS,
+        bulk_workers: int = JOB_BULK_WORKERS,
+        max_queued: int = JOB_MAX_QUEUED,
+        ttl: float = JOB_RESULT_TTL,
+        purge_interval: float = JOB_PURGE_INTERVAL,
+    ):
+        self.runners = runners
+        self.store = store if store is not None else create_job_store()
+        self.workers = workers
+        self.bulk_workers = min(bulk_workers, workers)
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._lanes: Dict[str, Deque[str]] = {lane: deque() for lane in LANES}
+        self._running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ── 수명 ──
+    def start(self) -> None:
+        """현재 이벤트 루프에 워커를 띄운다. 저장소에 남은 미완료 잡은 다시 큐에 넣는다."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._wake = asyncio.Event()
+        self._changed.clear()
+        self._tasks.clear()
+        for lane in LANES:
+            self._lanes[lane].clear()
+            self._running[lane] = 0
+        for job in sorted(self.store.unfinished(), key=lambda j: j.created_at):
+            job.status, job.started_at = "queued", None
+            self.store.save(job)
+            self._lanes[job.priority].append(job.job_id)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._workers.append(asyncio.create_task(self._purge_expired()))
+        self._wake.set()
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._loop = None
+
+    # ── 조회 ──
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self.store.get(job_id)
+        if job is not None and job.expired(time.time(), self.ttl):
+            self.store.delete(job_id)
+            return None
+        return job
+
+    def queue_depth(self) -> Dict[str, int]:
+        return {lane: len(queue) for lane, queue in self._lanes.items()}
+
+    def running(self) -> Dict[str, int]:
+        return dict(self._running)
+
+    # ── 제출/취소 ──
+    def submit(self, kind: str, payload: Dict[str, Any], priority: str = "interactive", client: Optional[str] = None) -> Job:
+        if kind not in self.runners:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self.start()
+        self.store.purge_expired(time.time(), self.ttl)
+        if sum(self.queue_depth().values()) >= self.max_queued:
+            raise JobQueueFull("Job queue is full.")
+        job = Job(kind, payload, priority, client=client)
+        self.store.save(job)
+        self._lanes[priority].append(job.job_id)
+        metrics.inc("thinking_jobs_total", kind=kind, lane=priority, status="queued")
+        self._wake.set()
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """대기 중이면 바로 취소, 실행 중이면 태스크를 취소한다 (끝난 잡은 그대로 돌려줌)"""
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            return job
+        try:
+            self._lanes[job.priority].remove(job_id)
+        except ValueError:
+            pass
+        self._finish(job, "cancelled", error="Job was cancelled.")
+        return job
+
+    # ── 구독 ──
+    async def watch(self, job_id: str) -> AsyncIterator[Job]:
+        """상태가 바뀔 때마다 잡을 내보내고, 끝나면 멈춘다"""
+        job = self.get(job_id)
+        while job is not None:
+            changed = self._event(job_id)
+            yield job
+            if job.done:
+                return
+            await changed.wait()
+            job = self.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """끝날 때까지(최대 timeout초) 기다린 뒤 잡을 돌려준다 (롱 폴링)"""
+        job = self.get(job_id)
+        if job is None or job.done or timeout <= 0:
+            return job
+        try:
+            async with asyncio.timeout(timeout):
+                async for job in self.watch(job_id):
+                    pass
+        except TimeoutError:
+            pass
+        return self.get(job_id)
+
+    def _event(self, job_id: str) -> asyncio.Event:
+        event = self._changed.get(job_id)
+        if event is None:
+            event = self._changed[job_id] = asyncio.Event()
+        return event
+
+    def _notify(self, job_id: str) -> None:
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    # ── 실행 ──
+    def _finish(self, job: Job, status: str, result=None, error=None, status_code: Optional[int] = None) -> None:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.status_code = status_code
+        job.finished_at = time.time()
+        self.store.save(job)
+        metrics.inc("thinking_jobs_total", kind=job.kind, lane=job.priority, status=status)
+        if job.started_at is not None:
+            metrics.observe("thinking_job_run_seconds", job.finished_at - job.started_at, kind=job.kind, lane=job.priority)
+        self._notify(job.job_id)
+
+    async def _next(self) -> Optional[Job]:
+        while True:
+            if self._lanes["interactive"]:
+                job_id = self._lanes["interactive"].popleft()
+            elif self._lanes["bulk"] and self._running["bulk"] < self.bulk_workers:
+                job_id = self._lanes["bulk"].popleft()
+            else:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            job = self.store.get(job_id)
+            if job is not None and job.status == "queued":
+                return job
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._next()
+            lane = job.priority
+            self._running[lane] += 1
+            job.status = "running"
+            job.started_at = time.time()
+            self.store.save(job)
+            metrics.observe("thinking_job_wait_seconds", job.started_at - job.created_at, lane=lane)
+            self._notify(job.job_id)
+            # 잡의 LLM 호출은 제출한 클라이언트 몫으로, 레인을 우선순위로 입장 제어를 받는다 (태스크가 컨텍스트를 복사)
+            bind_admission(job.client or f"job:{job.kind}", lane)
+            task = self._tasks[job.job_id] = asyncio.create_task(self.runners[job.kind](job.payload))
+            try:
+                result = await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    # 워커 자체가 종료되는 중 (잡은 저장소에 running으로 남아 재시작 시 다시 실행된다)
+                    task.cancel()
+                    raise
+                self._finish(job, "cancelled", error="Job was cancelled.")
+            except Exception as e:
+                status_code = getattr(e, "status_code", 500)
+                if status_code == 500:
+                    logger.exception("Job %s (%s) failed", job.job_id, job.kind)
+                self._finish(job, "failed", error=getattr(e, "detail", str(e)), status_code=status_code)
+            else:
+                self._finish(job, "succeeded", result=loads(dumps(result)), status_code=200)
+            finally:
+                self._tasks.pop(job.job_id, None)
+                self._running[lane] -= 1
+                self._wake.set()
+
+    async def _purge_expired(self) -> None:
+        """submit/get이 없어도 끝난 지 ttl이 지난 잡 결과를 주기적으로 지운다"""
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            self.store.purge_expired(time.time(), self.ttl)
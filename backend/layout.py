@@ -0,0 +1,139 @@
+from typing import Dict, List, Optional, Tuple
+
+# --- Layout Configuration ---
+PROBLEM_X_RANGE = (0, 400)
+SOLUTION_X_RANGE = (600, 1000)
+
+CATEGORY_Y_MAP = {
+    "Why":   0,
+    "Who":   150,
+    "What":  300,
+    "How":   450,
+    "When":  600,
+    "Where": 750
+}
+
+NODE_WIDTH = 200
+NODE_HEIGHT = 120
+NODE_STRIDE_X = 230  # 노드 너비(200) + 간격(30)
+NODE_STRIDE_Y = 160  # 노드 높이(120) + 간격(40)
+# 두 노드 사이에 최소한 이만큼은 비어 있어야 겹치지 않은 것으로 본다
+MIN_GAP = 10
+
+# 공간 해시 셀 크기 = 충돌 판정 거리 → 충돌 후보는 항상 주변 3x3 셀 안에 있다
+CELL_W = NODE_WIDTH + MIN_GAP
+CELL_H = NODE_HEIGHT + MIN_GAP
+
+
+def slot_position(phase: str, category: str, slot_index: int = 0) -> Tuple[float, float]:
+    """
+    (phase, category) 밴드의 slot_index번째 후보 위치.
+    slot_index=0 → 중앙, 1 → 오른쪽, 2 → 왼쪽, 3 → 더 오른쪽 ... 4개마다 아래 줄로
+    """
+    x_range = PROBLEM_X_RANGE if phase == "Problem" else SOLUTION_X_RANGE
+    base_x = (x_range[0] + x_range[1]) / 2
+    base_y = CATEGORY_Y_MAP.get(category, 300)
+
+    # 0 → 0, 1 → +1, 2 → -1, 3 → +2, 4 → -2, ...
+    if slot_index == 0:
+        col_offset = 0
+    elif slot_index % 2 == 1:
+        col_offset = (slot_index + 1) // 2
+    else:
+        col_offset = -(slot_index // 2)
+
+    row = slot_index // 4
+
+    return base_x + col_offset * NODE_STRIDE_X, base_y + row * NODE_STRIDE_Y
+
+
+class LayoutEngine:
+    """
+    실제 노드 위치(position)로 만든 공간 해시(grid index) 위에서 새 노드를 배치한다.
+
+    - occupy: 기존/새 노드의 사각형을 그리드에 등록 (O(1))
+    - place: 밴드별 커서부터 후보 슬롯을 차례로 보며 비어 있는 첫 자리를 고른다.
+      커서 앞의 슬롯은 모두 차 있으므로 배치 비용은 amortized O(1)이다.
+    - release: 비워진 자리에 걸린 밴드의 커서만 그 슬롯까지 되돌린다 (다른 밴드는 그대로).
+    사용자가 옮긴 노드는 실제 위치로 등록되므로 비어 있는 슬롯은 다시 쓰이고,
+    밴드 간 겹침(예: 다음 줄이 아래 카테고리 밴드와 겹치는 경우)은 건너뛴다.
+    """
+
+    def __init__(self):
+        self.positions: Dict[str, Tuple[float, float]] = {}
+        self._grid: Dict[Tuple[int, int], List[str]] = {}
+        self._cursors: Dict[Tuple[str, str], int] = {}  # (phase, category) → 이 앞의 슬롯은 모두 차 있음
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @staticmethod
+    def _cell(x: float, y: float) -> Tuple[int, int]:
+        return int(x // CELL_W), int(y // CELL_H)
+
+    def is_free(self, x: float, y: float) -> bool:
+        cx, cy = self._cell(x, y)
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                for other in self._grid.get((gx, gy), ()):
+                    ox, oy = self.positions[other]
+                    if abs(ox - x) < CELL_W and abs(oy - y) < CELL_H:
+                        return False
+        return True
+
+    def occupy(self, node_id: str, x: float, y: float) -> None:
+        if node_id in self.positions:
+            if self.positions[node_id] == (x, y):
+                return
+            self.release(node_id)
+        self.positions[node_id] = (x, y)
+        self._grid.setdefault(self._cell(x, y), []).append(node_id)
+
+    def release(self, node_id: str) -> None:
+        pos = self.positions.pop(node_id, None)
+        if pos is None:
+            return
+        cell = self._cell(*pos)
+        bucket = self._grid[cell]
+        bucket.remove(node_id)
+        if not bucket:
+            del self._grid[cell]
+        # 비워진 자리를 다시 쓸 수 있도록, 그 자리가 막고 있던 슬롯이 커서보다 앞인 밴드만 되돌린다
+        for band, cursor in self._cursors.items():
+            freed = self._blocked_slot(*band, *pos)
+            if freed is not None and freed < cursor:
+                self._cursors[band] = freed
+
+    @staticmethod
+    def _blocked_slot(phase: str, category: str, x: float, y: float) -> Optional[int]:
+        """(x, y)의 노드가 막고 있던 이 밴드의 가장 앞 슬롯. 한 줄에 슬롯이 4개라 주변 줄만 보면 된다."""
+        base_y = slot_position(phase, category, 0)[1]
+        row = round((y - base_y) / NODE_STRIDE_Y)
+        for r in (row - 1, row, row + 1):
+            if r < 0:
+                continue
+            for slot in range(4 * r, 4 * r + 4):
+                sx, sy = slot_position(phase, category, slot)
+                if abs(sx - x) < CELL_W and abs(sy - y) < CELL_H:
+                    return slot
+        return None
+
+    def _find(self, phase: str, category: str) -> Tuple[int, Tuple[float, float]]:
+        slot = self._cursors.get((phase, category), 0)
+        while True:
+            pos = slot_position(phase, category, slot)
+            if self.is_free(*pos):
+                return slot, pos
+            slot += 1
+
+    def peek(self, phase: str, category: str) -> Dict[str, float]:
+        """다음에 배치될 위치 (점유하지 않음)"""
+        slot, (x, y) = self._find(phase, category)
+        self._cursors[(phase, category)] = slot  # 앞쪽은 모두 차 있으므로 커서만 당겨 둔다
+        return {"x": x, "y": y}
+
+    def place(self, phase: str, category: str, node_id: str) -> Dict[str, float]:
+        slot, (x, y) = self._find(phase, category)
+        self._cursors[(phase, category)] = slot + 1
+        self.occupy(node_id, x, y)
+        return {"x": x, "y": y}
@@ -1,31 +1,85 @@
+import asyncio
+import contextvars
 import os
 import random
+import time
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from dotenv import load_dotenv
-from openai import OpenAI
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from .models import Node, Edge, NodeData, Category, Phase, UserNode, CrossConnectionResult, ChatMessage
+from .admission import AdmissionController, bind as bind_admission, estimate_cost
+from .cache import LLMCache, LLM_CACHE_ENABLED, make_cache_key
+from .cassette import cassette_provider, note_history
+from .compaction import ConversationCompactor, CHAT_COMPACTION
+from .connections import CROSS_CONNECTIONS, local_cross_connections
+from .conversions import ConversionCheckpoints, ConversionCheckpoint, CHAT_INCREMENTAL_CONVERSION, normalize_label
+from .metrics import metrics
+from .prefetch import ChatPrefetcher, CHAT_PREFETCH, CHAT_OPENING_MESSAGE, CHAT_PREFETCH_REPLY_TOKENS, opening_fingerprint
+from .providers import LLMProvider, create_provider
+from .resilience import UpstreamPolicy
+from .retrieval import HISTORY_MODE, HISTORY_TOP_K, HISTORY_RECENT, HISTORY_TOKEN_BUDGET, estimate_tokens
+from .routing import ModelRouter
+from .schemas import response_schemas
+from .sessions import GraphSession
+from .singleflight import SingleFlight, LLM_SINGLEFLIGHT
+from .streaming import JsonArrayItemParser
 
 # Load .env.local first (takes precedence), then .env
 load_dotenv(dotenv_path=".env.local")
 load_dotenv()
 
-# --- Layout Configuration ---
-PROBLEM_X_RANGE = (0, 400)
-SOLUTION_X_RANGE = (600, 1000)
+# --- LLM Client Configuration ---
+# 프로세스 전체에서 동시에 OpenAI로 나가는 요청 수 상한
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+# 배치 요청 하나가 동시에 띄우는 LLM 호출 수 상한
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+# 기동 시 워밍업 (스키마 확인, 프롬프트 경로 1회 실행, 업스트림 커넥션 미리 열기)
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1") == "1"
+LLM_WARMUP_TIMEOUT = float(os.getenv("LLM_WARMUP_TIMEOUT", "10"))
+# 라우팅 규칙에 operation이 없을 때 쓰는 기본 모델
+ANALYSIS_MODEL = "gpt-4o-2024-08-06"
+CHAT_MODEL = "gpt-4o-mini"
+
+# --- Pipelined Analysis Configuration ---
+# 1이면 /analyze를 큰 호출 하나 대신 user_nodes 추출 → (제안 ‖ 기존 노드 연결) 동시 호출로 나눈다 (요청마다 pipeline으로 바꿀 수 있다)
+ANALYSIS_PIPELINE = os.getenv("ANALYSIS_PIPELINE", "0") == "1"
+# 추출 뒤 두 호출의 기본 모델 (라우팅 규칙에 analyze-suggest / analyze-connect가 있으면 그쪽을 따른다)
+ANALYSIS_PIPELINE_MODEL = os.getenv("ANALYSIS_PIPELINE_MODEL", CHAT_MODEL)
+
+
+# 인풋 → user_nodes 분해 지시 (한 번에 분석하는 프롬프트와 파이프라인의 추출 단계가 같이 쓴다)
+EXTRACTION_STEP = """## STEP 1. 인풋 분해 → user_nodes 생성
+
+사용자의 입력에서 **명확하게 존재하는 6하원칙 요소**만 노드로 추출하라.
+- 최소 1개, 최대 4개
+- 문장에 명시되거나 강하게 내포된 요소만 포함할 것. 억지로 만들지 마라.
+- 각 노드는 label(동사형 짧은 제목), content(한 문장 상세), category, phase로 구성
+
+**카테고리 선택 기준 (엄격히 준수):**
+| Category | 선택 조건 |
+|----------|----------|
+| Who      | 사용자·대상·이해관계자·주체가 핵심 |
+| What     | 구체적 결과물·기능·서비스·제품이 핵심 |
+| When     | 시간·타이밍·순서·빈도가 핵심 |
+| Where    | 장소·공간·채널·환경이 핵심 |
+| Why      | 목적·이유·동기·문제의식이 핵심 |
+| How      | 방법·프로세스·수단·전략이 핵심 |
+
+**Phase 선택 기준:**
+- Problem: 현재 문제/니즈/현상 파악 관점
+- Solution: 해결책/구현/실행 관점
+
+**예시:**
+입력: "일상에 지친 사람들이 진정한 휴식을 즐길 수 있는 광장을 만들고 싶다"
+→ user_nodes:
+  [0] Who / Problem: "지친 현대인 정의" / 일상에 지쳐 진정한 휴식이 필요한 사람들
+  [1] What / Solution: "휴식 광장 조성" / 진정한 휴식을 제공하는 도심 광장을 만든다
+  [2] Why / Problem: "휴식 부재 문제" / 현대인이 일상에서 진정한 휴식을 취하지 못하고 있다"""
 
-CATEGORY_Y_MAP = {
-    "Why":   0,
-    "Who":   150,
-    "What":  300,
-    "How":   450,
-    "When":  600,
-    "Where": 750
-}
 
 # ---- Pydantic model for AI structured output ----
-class AIAnalysisResult(BaseModel):
+class AIAnalysisCore(BaseModel):
     # 인풋에서 추출한 6하원칙 노드 목록 (1~4개)
     user_nodes: List[UserNode]
 
@@ -41,186 +95,370 @@ class AIAnalysisResult(BaseModel):
     # 제안 노드 연결 레이블
     connection_label: str
 
-    # 기존 노드와의 cross-connection
+
+class AIAnalysisResult(AIAnalysisCore):
+    # 기존 노드와의 cross-connection (CROSS_CONNECTIONS=local이면 모델에게 받지 않고 로컬에서 채운다)
     cross_connections: List[CrossConnectionResult]
 
 
-class ThinkingAgent:
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
+# ---- 파이프라인 모드의 단계별 출력 (합치면 AIAnalysisResult) ----
+class AnalysisNodes(BaseModel):
+    # 1단계: 인풋에서 추출한 6하원칙 노드만
+    user_nodes: List[UserNode]
 
-    def calculate_position(self, phase: Phase, category: Category, slot_index: int = 0) -> Dict[str, float]:
-        """
-        같은 (phase, category) 조합의 노드들은 열(column) 단위로 배치.
-        slot_index=0 → 중앙, 1 → 오른쪽, 2 → 왼쪽, 3 → 더 오른쪽 ...
-        """
-        x_range = PROBLEM_X_RANGE if phase == "Problem" else SOLUTION_X_RANGE
-        base_x = (x_range[0] + x_range[1]) / 2
-        base_y = CATEGORY_Y_MAP.get(category, 300)
-
-        NODE_STRIDE_X = 230  # 노드 너비(200) + 간격(30)
-        NODE_STRIDE_Y = 160  # 노드 높이(120) + 간격(40)
-
-        # 0 → 0, 1 → +1, 2 → -1, 3 → +2, 4 → -2, ...
-        if slot_index == 0:
-            col_offset = 0
-        elif slot_index % 2 == 1:
-            col_offset = (slot_index + 1) // 2
-        else:
-            col_offset = -(slot_index // 2)
 
-        row = slot_index // 4  # 4개마다 아래 줄로
+class AnalysisSuggestion(BaseModel):
+    # 2단계 (연결과 동시에): 추출된 노드를 보고 만든 제안 노드
+    suggestion_label: str
+    suggestion_content: str
+    suggestion_category: Category
+    suggestion_phase: Phase
+    suggestion_connects_to_index: int
+    connection_label: str
 
-        return {
-            "x": base_x + col_offset * NODE_STRIDE_X,
-            "y": base_y + row * NODE_STRIDE_Y
-        }
 
-    def build_history_context(self, history: List[Dict[str, Any]]) -> str:
-        if not history:
-            return "기존 노드 없음."
-        lines = []
-        for node in history:
-            node_id = node.get("id", "unknown")
-            data = node.get("data", {})
-            title = data.get("title", "")
-            category = data.get("category", "")
-            phase = data.get("phase", "")
-            if not isinstance(title, str):
-                title = "(unknown)"
-            lines.append(f"- ID: {node_id} | [{phase}/{category}] {title}")
-        return "\n".join(lines)
-
-    def process_idea(self, user_input: str, history: List[Dict[str, Any]]) -> Dict[str, Any]:
-        history_context = self.build_history_context(history)
+class AnalysisConnections(BaseModel):
+    # 2단계 (제안과 동시에): 추출된 노드와 기존 노드의 연결
+    cross_connections: List[CrossConnectionResult]
 
-        system_prompt = f"""
-너는 사용자의 아이디어를 구조화하고 확장하는 자율형 에이전트다.
-사용자의 한 문장 인풋을 받아 6하원칙(Who/What/When/Where/Why/How) 관점으로 분해하고,
-관련된 노드들을 추출한 뒤 JSON으로 응답하라.
 
----
+class ChatNodeCore(BaseModel):
+    user_nodes: List[UserNode]
 
-## STEP 1. 인풋 분해 → user_nodes 생성
 
-사용자의 입력에서 **명확하게 존재하는 6하원칙 요소**만 노드로 추출하라.
-- 최소 1개, 최대 4개
-- 문장에 명시되거나 강하게 내포된 요소만 포함할 것. 억지로 만들지 마라.
-- 각 노드는 label(동사형 짧은 제목), content(한 문장 상세), category, phase로 구성
+class ChatNodeResult(ChatNodeCore):
+    cross_connections: List[CrossConnectionResult]
 
-**카테고리 선택 기준 (엄격히 준수):**
-| Category | 선택 조건 |
-|----------|----------|
-| Who      | 사용자·대상·이해관계자·주체가 핵심 |
-| What     | 구체적 결과물·기능·서비스·제품이 핵심 |
-| When     | 시간·타이밍·순서·빈도가 핵심 |
-| Where    | 장소·공간·채널·환경이 핵심 |
-| Why      | 목적·이유·동기·문제의식이 핵심 |
-| How      | 방법·프로세스·수단·전략이 핵심 |
 
-**Phase 선택 기준:**
-- Problem: 현재 문제/니즈/현상 파악 관점
-- Solution: 해결책/구현/실행 관점
+# import 시점에 strict 스키마를 만들고 검증해 둔다 (잘못된 모델이면 기동 단계에서 실패)
+response_schemas.register(
+    AIAnalysisResult, ChatNodeResult, AIAnalysisCore, ChatNodeCore,
+    AnalysisNodes, AnalysisSuggestion, AnalysisConnections,
+)
 
-**예시:**
-입력: "일상에 지친 사람들이 진정한 휴식을 즐길 수 있는 광장을 만들고 싶다"
-→ user_nodes:
-  [0] Who / Problem: "지친 현대인 정의" / 일상에 지쳐 진정한 휴식이 필요한 사람들
-  [1] What / Solution: "휴식 광장 조성" / 진정한 휴식을 제공하는 도심 광장을 만든다
-  [2] Why / Problem: "휴식 부재 문제" / 현대인이 일상에서 진정한 휴식을 취하지 못하고 있다
 
-## STEP 2. AI 제안 노드 (1개)
+def stream_timing(started: float, first_at: Optional[float], first_key: str) -> Dict[str, Optional[float]]:
+    """스트리밍 응답의 첫 이벤트까지 시간과 전체 시간 (ms)"""
+    return {
+        first_key: round((first_at - started) * 1000, 1) if first_at else None,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
 
-user_nodes 전체를 보고 아이디어를 확장하는 날카로운 질문이나 제안을 하나 만들어라.
-- suggestion_connects_to_index: 제안 노드가 직접 연결될 user_nodes의 인덱스 (가장 핵심적인 노드)
 
-## STEP 3. 기존 노드 연결 (cross_connections)
+class ThinkingAgent:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        provider: Optional[LLMProvider] = None,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        cache: Optional[LLMCache] = None,
+        upstream: Optional[UpstreamPolicy] = None,
+    ):
+        # LLM 호출은 모두 provider를 거친다 (openai | fake). LLM_CASSETTE면 녹화/재생 래퍼로 감싼다.
+        self.provider = cassette_provider(provider or create_provider(api_key))
+        # 마감 시간, 재시도, 헤지, 서킷 브레이커
+        self.upstream = upstream or UpstreamPolicy()
+        # 요청마다 지연 예산/입력 크기/모델별 최근 지연을 보고 모델을 고른다
+        self.router = ModelRouter()
+        # 업스트림 TPM/RPM 한도 앞의 공정 대기열 (한도를 넘길 요청은 보내기 전에 429)
+        self.admission = AdmissionController()
+        # 업스트림 동시 호출 상한. 초과분은 여기서 대기하고 워커 스레드를 잡지 않는다.
+        self.llm_semaphore = asyncio.Semaphore(max_concurrency)
+        # LLM 결과만 캐시한다. 노드 ID/위치는 hit이어도 새로 생성된다.
+        if cache is None and LLM_CACHE_ENABLED:
+            cache = LLMCache()
+        self.cache = cache
+        # 동시에 들어온 같은 요청은 업스트림 호출 하나를 공유한다
+        self.singleflight = SingleFlight() if LLM_SINGLEFLIGHT else None
+        # 긴 대화는 누적 요약 + 최근 메시지로 줄여서 보낸다
+        self.compactor = ConversationCompactor(self.summarize_conversation) if CHAT_COMPACTION else None
+        # llm | local — local이면 cross_connections를 출력 토큰으로 받지 않고 로컬 인덱스로 계산한다
+        self.cross_connections = CROSS_CONNECTIONS
+        # 추출 → (제안 ‖ 연결) 파이프라인을 기본으로 쓸지 (요청의 pipeline이 우선)
+        self.analysis_pipeline = ANALYSIS_PIPELINE
+        # 제안 노드가 만들어지면 채팅 첫 턴을 미리 생성해 둔다 (추측 실행, 기본 꺼짐)
+        self.prefetcher = ChatPrefetcher(self.chat_with_suggestion) if CHAT_PREFETCH else None
+        # 같은 대화를 다시 노드로 변환하면 지난 변환 이후의 새 턴만 보낸다
+        self.conversions = ConversionCheckpoints() if CHAT_INCREMENTAL_CONVERSION else None
+
+    async def warm_up(self, timeout: float = LLM_WARMUP_TIMEOUT) -> Dict[str, Any]:
+        """
+        배포 직후 첫 사용자 요청이 초기화 비용을 떠안지 않도록 미리 한 번 돌려 둔다.
+        실패해도 기동은 막지 않고 결과만 보고한다.
+        """
+        started = time.perf_counter()
+        response_schemas.register(
+            AIAnalysisResult, ChatNodeResult, AIAnalysisCore, ChatNodeCore,
+            AnalysisNodes, AnalysisSuggestion, AnalysisConnections,
+        )
+        # 히스토리 인덱스/프롬프트 조립 경로를 한 번 태운다 (LLM 호출 없음)
+        graph = GraphSession.from_history([{
+            "id": "warmup",
+            "data": {"title": "워밍업", "content": "워밍업", "category": "What", "phase": "Problem"},
+            "position": {"x": 0, "y": 0},
+        }])
+        self.build_analysis_messages("워밍업", graph, None)
+        connections, error = 0, None
+        try:
+            async with asyncio.timeout(timeout):
+                connections = await self.provider.warm_up()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return {
+            "schemas": response_schemas.names(),
+            "connections": connections,
+            "error": error,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
 
-기존 노드 목록을 보고, 새로 만든 user_nodes 중 **의미적으로 관련된** 것과 연결하라.
-- existing_node_id: 기존 노드 ID
-- new_node_index: 연결될 user_nodes 인덱스
-- connection_label: 관계 설명 한 구절
-- **기존 노드가 존재하면 반드시 최소 1개는 연결할 것.** 같은 카테고리, 같은 phase, 또는 주제의 연장선상이면 반드시 연결하라.
-- 최대 3개.
+    async def aclose(self) -> None:
+        await self.provider.aclose()
+
+    def _cache_lookup(self, model: str, messages: List[Dict[str, str]], response_format, use_cache: bool):
+        """(요청 키, 캐시된 값) — 캐시/single-flight를 안 쓰면 (None, None)"""
+        if not use_cache or (self.cache is None and self.singleflight is None):
+            return None, None
+        key = make_cache_key(model, messages, response_format)
+        return key, self.cache.get(key) if self.cache is not None else None
+
+    def _cache_store(self, key: Optional[str], value: str) -> None:
+        if key is not None and self.cache is not None:
+            self.cache.set(key, value)
+
+    async def _admit(self, messages: List[Dict[str, str]], operation: str, priority: Optional[str] = None) -> None:
+        if self.admission.enabled:
+            with metrics.stage("admission"):
+                await self.admission.admit(
+                    estimate_cost(messages, operation, self.admission.output_tokens), operation, priority,
+                )
+
+    def _hedge_admission(self, messages: List[Dict[str, str]], operation: str):
+        """헤지 요청의 입장 제어: 기다리지 않는 speculative 우선순위라 여유가 없으면 헤지를 건너뛴다"""
+        return lambda: self._admit(messages, operation, "speculative")
+
+    async def _coalesced(self, key: Optional[str], call):
+        """같은 키로 진행 중인 업스트림 호출이 있으면 합류한다"""
+        if self.singleflight is None:
+            return await call(), False
+        return await self.singleflight.do(key, call)
+
+    def _validate_cached(self, key: str, cached: str, response_format):
+        """캐시 값을 스키마로 검증한다. 깨진 값이면 지우고 None (호출한 쪽이 업스트림에서 다시 받는다)"""
+        with metrics.stage("parse"):
+            try:
+                return response_format.model_validate_json(cached)
+            except ValidationError:
+                self.cache.delete(key)
+                return None
+
+    async def _parse_completion(
+        self, model: str, messages: List[Dict[str, str]], response_format,
+        use_cache: bool = True, operation: str = "default",
+    ):
+        key, cached = self._cache_lookup(model, messages, response_format, use_cache)
+        if cached is not None:
+            parsed = self._validate_cached(key, cached, response_format)
+            if parsed is not None:
+                return parsed
+
+        async def attempt():
+            return await self.provider.parse(model, messages, response_format)
+
+        async def call():
+            await self._admit(messages, operation)
+            # 동시 호출 슬롯을 잡은 뒤부터 잰다: 로컬 대기가 라우터 지연 통계나 헤지 p95에 섞이지 않도록
+            async with self.llm_semaphore:
+                with self.router.timed(model):
+                    parsed = await self.upstream.call(operation, attempt, self._hedge_admission(messages, operation))
+            self._cache_store(key, parsed.model_dump_json())
+            return parsed
+
+        with metrics.stage("llm"):
+            parsed, shared = await self._coalesced(key, call)
+        # 합류한 호출은 결과 객체를 공유하지 않도록 복사본을 받는다 (노드 ID는 어차피 호출마다 새로 생성)
+        return parsed.model_copy(deep=True) if shared else parsed
+
+    async def _stream_completion(self, model: str, messages: List[Dict[str, str]], operation: str = "default"):
+        def attempt():
+            return self.provider.stream(model, messages)
+
+        await self._admit(messages, operation)
+        # 스트림이 끝날 때까지 동시 호출 슬롯을 점유하고, 슬롯을 잡은 뒤부터 잰다
+        async with self.llm_semaphore:
+            with self.router.timed(model):
+                async for delta in self.upstream.stream(operation, attempt):
+                    yield delta
+
+    async def _stream_structured_completion(
+        self, model: str, messages: List[Dict[str, str]], response_format,
+        use_cache: bool = True, operation: str = "default",
+    ):
+        """structured output을 JSON 텍스트 조각(delta) 단위로 흘려보낸다. 캐시 hit이면 (검증한 뒤) 한 번에."""
+        key, cached = self._cache_lookup(model, messages, response_format, use_cache)
+        if cached is not None and self._validate_cached(key, cached, response_format) is not None:
+            yield cached
+            return
+
+        def attempt():
+            return self.provider.stream_structured(model, messages, response_format)
+
+        parts: List[str] = []
+        await self._admit(messages, operation)
+        async with self.llm_semaphore:
+            with self.router.timed(model):
+                async for delta in self.upstream.stream(operation, attempt):
+                    parts.append(delta)
+                    yield delta
+        self._cache_store(key, "".join(parts))
+
+    async def _create_completion(
+        self, model: str, messages: List[Dict[str, str]],
+        use_cache: bool = True, operation: str = "default",
+    ) -> str:
+        key, cached = self._cache_lookup(model, messages, None, use_cache)
+        if cached is not None:
+            return cached
 
-## 기존 노드 목록
-{history_context}
-"""
+        async def attempt():
+            return await self.provider.complete(model, messages)
 
-        completion = self.client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input},
-            ],
-            response_format=AIAnalysisResult,
-        )
+        async def call():
+            await self._admit(messages, operation)
+            async with self.llm_semaphore:
+                with self.router.timed(model):
+                    reply = await self.upstream.call(operation, attempt, self._hedge_admission(messages, operation))
+            self._cache_store(key, reply)
+            return reply
+
+        with metrics.stage("llm"):
+            reply, _ = await self._coalesced(key, call)
+        return reply
 
-        result = completion.choices[0].message.parsed
-
-        # ── 1. Build slot_counts from history (기존 노드들이 각 슬롯을 몇 개 차지하는지) ──
-        slot_counts: Dict[str, int] = {}
-        for h_node in history:
-            h_data = h_node.get("data", {})
-            h_phase = h_data.get("phase", "")
-            h_cat = h_data.get("category", "")
-            if h_phase and h_cat:
-                key = f"{h_phase}_{h_cat}"
-                slot_counts[key] = slot_counts.get(key, 0) + 1
-
-        # ── 2. Create user nodes ──
-        created_nodes = []
-        created_node_ids = []
-
-        for i, un in enumerate(result.user_nodes):
-            node_id = str(uuid.uuid4())
-            key = f"{un.phase}_{un.category}"
-            slot_idx = slot_counts.get(key, 0)
-            pos = self.calculate_position(un.phase, un.category, slot_index=slot_idx)
-            slot_counts[key] = slot_idx + 1  # 다음 노드를 위해 슬롯 증가
-
-            node = Node(
-                id=node_id,
-                type="default",
-                data=NodeData(
-                    label=un.label,
-                    content=un.content,
-                    category=un.category,
-                    phase=un.phase,
-                    is_ai_generated=False
-                ),
-                position=pos
+    # ─────────────────────────────────────────────
+    # 공통: 히스토리 문맥, 노드 배치, 엣지 구성
+    # ─────────────────────────────────────────────
+    def resolve_graph(
+        self, history: Optional[List[Dict[str, Any]]], graph: Optional[GraphSession]
+    ) -> GraphSession:
+        """세션 그래프가 없으면 요청에 실려 온 history로 일회용 그래프를 만든다"""
+        if graph is None:
+            with metrics.stage("history"):
+                graph = GraphSession.from_history(history or [])
+        metrics.observe_size("thinking_history_nodes", len(graph))
+        note_history(history_nodes=len(graph))
+        return graph
+
+    def choose_model(
+        self,
+        operation: str,
+        default_model: str,
+        messages: List[Dict[str, str]],
+        history_nodes: int = 0,
+        latency_budget_ms: Optional[float] = None,
+    ) -> str:
+        input_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        return self.router.route(
+            operation, default_model, input_tokens, history_nodes, latency_budget_ms
+        ).model
+
+    def history_context_for(self, graph: GraphSession, query: str, history_mode: Optional[str] = None) -> str:
+        """pruned 모드면 query와 관련된 노드 + 최근 노드만, full 모드면 전체 노드를 문맥으로"""
+        if (history_mode or HISTORY_MODE) == "pruned":
+            return graph.pruned_history_context(
+                query, HISTORY_TOP_K, HISTORY_RECENT, HISTORY_TOKEN_BUDGET
             )
-            created_nodes.append(node)
-            created_node_ids.append(node_id)
-
-        # ── 3. Create suggestion node ──
-        suggestion_id = str(uuid.uuid4())
-        # 제안 노드는 해당 category/phase의 다음 슬롯에 배치
-        s_key = f"{result.suggestion_phase}_{result.suggestion_category}"
-        s_slot = slot_counts.get(s_key, 0)
-        suggest_pos = self.calculate_position(
-            result.suggestion_phase,
-            result.suggestion_category,
-            slot_index=s_slot
-        )
-        suggestion_node = Node(
-            id=suggestion_id,
+        return graph.history_context()
+
+    def place_node(
+        self,
+        un: UserNode,
+        graph: GraphSession,
+        is_ai_generated: bool = False,
+        reserve_slot: bool = True,
+    ) -> Node:
+        """UserNode를 그래프 레이아웃의 다음 빈 자리에 배치해 새 ID의 Node로 만든다."""
+        node_id = str(uuid.uuid4())
+        if reserve_slot:
+            pos = graph.layout.place(un.phase, un.category, node_id)
+        else:
+            pos = graph.layout.peek(un.phase, un.category)
+
+        return Node(
+            id=node_id,
             type="default",
             data=NodeData(
-                label=result.suggestion_label,
-                content=result.suggestion_content,
-                category=result.suggestion_category,
-                phase=result.suggestion_phase,
-                is_ai_generated=True
+                label=un.label,
+                content=un.content,
+                category=un.category,
+                phase=un.phase,
+                is_ai_generated=is_ai_generated
             ),
-            position=suggest_pos
+            position=pos
         )
 
-        all_nodes = created_nodes + [suggestion_node]
+    def release_uncommitted(self, graph: GraphSession, nodes: List[Node]) -> None:
+        """스트리밍 중 배치한 노드가 그래프에 반영되지 못하고 끝나면(업스트림 실패, 연결 끊김) 잡아 둔 자리를 돌려준다"""
+        existing_ids = graph.existing_ids
+        for node in nodes:
+            if node.id not in existing_ids:
+                graph.layout.release(node.id)
+
+    def suggestion_as_user_node(self, result: AIAnalysisCore) -> UserNode:
+        return UserNode(
+            label=result.suggestion_label,
+            content=result.suggestion_content,
+            category=result.suggestion_category,
+            phase=result.suggestion_phase,
+        )
+
+    @property
+    def analysis_schema(self):
+        return AIAnalysisCore if self.cross_connections == "local" else AIAnalysisResult
+
+    @property
+    def chat_nodes_schema(self):
+        return ChatNodeCore if self.cross_connections == "local" else ChatNodeResult
+
+    def with_cross_connections(self, result: BaseModel, graph: GraphSession, result_cls):
+        """cross_connections 없이 받은 결과(local 모드)에 로컬에서 고른 연결을 채워 result_cls로"""
+        if isinstance(result, result_cls):
+            return result
+        connections = local_cross_connections(graph, result.user_nodes)
+        return result_cls.model_construct(**dict(result), cross_connections=connections)
+
+    def build_cross_edges(
+        self,
+        cross_connections: List[CrossConnectionResult],
+        created_node_ids: List[str],
+        existing_ids,
+    ) -> List[Edge]:
+        """LLM이 고른 cross-connection 중 실제 존재하는 기존 노드를 가리키는 것만 엣지로"""
         edges = []
+        for cross in cross_connections:
+            if cross.existing_node_id not in existing_ids:
+                continue
+            new_idx = cross.new_node_index
+            if new_idx >= len(created_node_ids):
+                new_idx = 0
+            target_id = created_node_ids[new_idx]
+            edges.append(Edge(
+                id=f"e-cross-{cross.existing_node_id}-{target_id}",
+                source=cross.existing_node_id,
+                target=target_id,
+                label=cross.connection_label
+            ))
+        return edges
 
-        # ── 3. Connect user nodes sequentially (같은 인풋 내 노드들 연결) ──
+    def build_analysis_edges(
+        self,
+        result: AIAnalysisResult,
+        created_node_ids: List[str],
+        suggestion_id: str,
+        graph: GraphSession,
+    ) -> List[Edge]:
+        edges = []
+
+        # ── 1. Connect user nodes sequentially (같은 인풋 내 노드들 연결) ──
         for i in range(len(created_node_ids) - 1):
             edges.append(Edge(
                 id=f"e-input-{created_node_ids[i]}-{created_node_ids[i+1]}",
@@ -229,7 +467,10 @@ user_nodes 전체를 보고 아이디어를 확장하는 날카로운 질문이
                 label="관련"
             ))
 
-        # ── 4. Connect main user node → suggestion ──
+        if not created_node_ids:
+            return edges
+
+        # ── 2. Connect main user node → suggestion ──
         idx = result.suggestion_connects_to_index
         if idx >= len(created_node_ids):
             idx = 0
@@ -241,40 +482,21 @@ user_nodes 전체를 보고 아이디어를 확장하는 날카로운 질문이
             label=result.connection_label
         ))
 
-        # ── 5. Cross-connections to existing nodes ──
-        existing_ids = {node.get("id") for node in history}
-        cross_connected_new_ids = set()
-
-        for cross in result.cross_connections:
-            if cross.existing_node_id not in existing_ids:
-                continue
-            new_idx = cross.new_node_index
-            if new_idx >= len(created_node_ids):
-                new_idx = 0
-            target_id = created_node_ids[new_idx]
-            edges.append(Edge(
-                id=f"e-cross-{cross.existing_node_id}-{target_id}",
-                source=cross.existing_node_id,
-                target=target_id,
-                label=cross.connection_label
-            ))
-            cross_connected_new_ids.add(target_id)
+        # ── 3. Cross-connections to existing nodes ──
+        existing_ids = graph.existing_ids
+        cross_edges = self.build_cross_edges(result.cross_connections, created_node_ids, existing_ids)
+        edges.extend(cross_edges)
 
-        # ── 6. Fallback: 기존 노드가 있지만 cross_connections가 없으면
+        # ── 4. Fallback: 기존 노드가 있지만 cross_connections가 없으면
         #       첫 번째 새 노드를 가장 가까운 기존 노드와 강제 연결 ──
-        if history and created_node_ids and not cross_connected_new_ids:
+        if len(graph) and not cross_edges:
             first_new_id = created_node_ids[0]
             first_new_cat = result.user_nodes[0].category if result.user_nodes else None
 
             # 같은 카테고리 기존 노드 우선, 없으면 가장 마지막 기존 노드
-            best_existing = None
-            for h_node in reversed(history):
-                h_cat = h_node.get("data", {}).get("category", "")
-                if h_cat == first_new_cat:
-                    best_existing = h_node.get("id")
-                    break
+            best_existing = graph.last_id_by_category.get(first_new_cat)
             if best_existing is None:
-                best_existing = history[-1].get("id")
+                best_existing = graph.last_node_id
 
             if best_existing and best_existing in existing_ids:
                 edge_id = f"e-cross-{best_existing}-{first_new_id}"
@@ -288,15 +510,510 @@ user_nodes 전체를 보고 아이디어를 확장하는 날카로운 질문이
                         label="관련"
                     ))
 
+        return edges
+
+    # ─────────────────────────────────────────────
+    # 1. 인풋 분석 → 노드+엣지
+    # ─────────────────────────────────────────────
+    def build_analysis_messages(
+        self, user_input: str, graph: GraphSession, history_mode: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        history_context = self.history_context_for(graph, user_input, history_mode)
+        # local 모드에서는 연결을 서버가 고르므로 STEP 3 지시를 뺀다 (기존 노드 목록은 제안의 문맥으로 남긴다)
+        cross_step = "" if self.cross_connections == "local" else """
+## STEP 3. 기존 노드 연결 (cross_connections)
+
+기존 노드 목록을 보고, 새로 만든 user_nodes 중 **의미적으로 관련된** 것과 연결하라.
+- existing_node_id: 기존 노드 ID
+- new_node_index: 연결될 user_nodes 인덱스
+- connection_label: 관계 설명 한 구절
+- **기존 노드가 존재하면 반드시 최소 1개는 연결할 것.** 같은 카테고리, 같은 phase, 또는 주제의 연장선상이면 반드시 연결하라.
+- 최대 3개.
+"""
+
+        system_prompt = f"""
+너는 사용자의 아이디어를 구조화하고 확장하는 자율형 에이전트다.
+사용자의 한 문장 인풋을 받아 6하원칙(Who/What/When/Where/Why/How) 관점으로 분해하고,
+관련된 노드들을 추출한 뒤 JSON으로 응답하라.
+
+---
+
+{EXTRACTION_STEP}
+
+## STEP 2. AI 제안 노드 (1개)
+
+user_nodes 전체를 보고 아이디어를 확장하는 날카로운 질문이나 제안을 하나 만들어라.
+- suggestion_connects_to_index: 제안 노드가 직접 연결될 user_nodes의 인덱스 (가장 핵심적인 노드)
+{cross_step}
+## 기존 노드 목록
+{history_context}
+"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input},
+        ]
+
+    def assemble_analysis(
+        self, result: AIAnalysisResult, graph: GraphSession, dedup_edges: bool = False
+    ) -> Dict[str, Any]:
+        """dedup_edges면 (배치용) 그래프에 이미 있는 (source, target) 엣지와 자기 자신으로 가는 엣지를 빼고 반영한다"""
+        with metrics.stage("layout"):
+            created_nodes = [self.place_node(un, graph) for un in result.user_nodes]
+            # 제안 노드는 해당 category/phase의 다음 슬롯에 배치
+            suggestion_node = self.place_node(
+                self.suggestion_as_user_node(result), graph,
+                is_ai_generated=True, reserve_slot=False,
+            )
+        self.prefetch_opening_turn(suggestion_node)
+        with metrics.stage("edges"):
+            result = self.with_cross_connections(result, graph, AIAnalysisResult)
+            edges = self.build_analysis_edges(
+                result, [n.id for n in created_nodes], suggestion_node.id, graph
+            )
+            if dedup_edges:
+                edges = self.drop_known_edges(edges, graph)
+        graph.add_nodes(created_nodes + [suggestion_node], edges)
         return {
-            "nodes": all_nodes,
+            "nodes": created_nodes + [suggestion_node],
             "edges": edges
         }
 
+    def drop_known_edges(self, edges: List[Edge], graph: GraphSession) -> List[Edge]:
+        """자기 자신으로 가는 엣지와, 그래프에 있거나 앞에서 나온 것과 같은 (source, target) 엣지를 뺀다"""
+        seen = {(e.get("source"), e.get("target")) for e in graph.edges.values()}
+        kept = []
+        for edge in edges:
+            pair = (edge.source, edge.target)
+            if edge.source == edge.target or pair in seen:
+                continue
+            seen.add(pair)
+            kept.append(edge)
+        return kept
+
+    async def process_idea(
+        self,
+        user_input: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        graph: Optional[GraphSession] = None,
+        use_cache: bool = True,
+        history_mode: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+        pipeline: Optional[bool] = None,
+    ) -> Dict[str, Any]:
+        """
+        graph(서버 세션)가 주어지면 history 대신 그 상태를 쓰고, 결과 노드를 그래프에 반영한다.
+        pipeline이면 (없으면 ANALYSIS_PIPELINE) 추출 → (제안 ‖ 연결) 단계로 나눠 호출하고 단계별 시간을 stages로 돌려준다.
+        """
+        graph = self.resolve_graph(history, graph)
+        if self.use_pipeline(pipeline):
+            return await self.process_idea_pipelined(user_input, graph, use_cache, history_mode, latency_budget_ms)
+        with metrics.stage("prompt"):
+            messages = self.build_analysis_messages(user_input, graph, history_mode)
+        model = self.choose_model("analyze", ANALYSIS_MODEL, messages, len(graph), latency_budget_ms)
+        result = await self._parse_completion(
+            model=model,
+            messages=messages,
+            response_format=self.analysis_schema,
+            use_cache=use_cache,
+            operation="analyze",
+        )
+        return {**self.assemble_analysis(result, graph), "model": model}
+
+    async def stream_process_idea(
+        self,
+        user_input: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        graph: Optional[GraphSession] = None,
+        use_cache: bool = True,
+        history_mode: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+        pipeline: Optional[bool] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        process_idea의 스트리밍 버전.
+        user_nodes 배열의 각 객체가 닫히는 즉시 배치된 node 이벤트를 내보내고,
+        생성이 끝나면 제안 노드와 edge 이벤트, 마지막으로 done 이벤트를 내보낸다.
+        """
+        graph = self.resolve_graph(history, graph)
+        if self.use_pipeline(pipeline):
+            async for event in self.stream_process_idea_pipelined(
+                user_input, graph, use_cache, history_mode, latency_budget_ms
+            ):
+                yield event
+            return
+        started = time.perf_counter()
+        first_node_at = None
+        parser = JsonArrayItemParser("user_nodes")
+        created_nodes: List[Node] = []
+        with metrics.stage("prompt"):
+            messages = self.build_analysis_messages(user_input, graph, history_mode)
+        model = self.choose_model("analyze", ANALYSIS_MODEL, messages, len(graph), latency_budget_ms)
+
+        try:
+            async for delta in self._stream_structured_completion(
+                model=model,
+                messages=messages,
+                response_format=self.analysis_schema,
+                use_cache=use_cache,
+                operation="analyze",
+            ):
+                for item in parser.feed(delta):
+                    node = self.place_node(UserNode.model_validate(item), graph)
+                    created_nodes.append(node)
+                    if first_node_at is None:
+                        first_node_at = time.perf_counter()
+                    yield {"type": "node", "node": node.model_dump()}
+
+            result = self.analysis_schema.model_validate_json(parser.text)
+            suggestion_node = self.place_node(
+                self.suggestion_as_user_node(result), graph,
+                is_ai_generated=True, reserve_slot=False,
+            )
+            self.prefetch_opening_turn(suggestion_node)
+            yield {"type": "node", "node": suggestion_node.model_dump()}
+
+            with metrics.stage("edges"):
+                result = self.with_cross_connections(result, graph, AIAnalysisResult)
+                edges = self.build_analysis_edges(
+                    result, [n.id for n in created_nodes], suggestion_node.id, graph
+                )
+            graph.add_nodes(created_nodes + [suggestion_node], edges)
+        finally:
+            self.release_uncommitted(graph, created_nodes)
+        for edge in edges:
+            yield {"type": "edge", "edge": edge.model_dump()}
+
+        yield {"type": "done", "model": model, "timing": stream_timing(started, first_node_at, "first_node_ms")}
+
+    # ─────────────────────────────────────────────
+    # 1-a. 파이프라인 분석: user_nodes 추출 → (제안 ‖ 기존 노드 연결)
+    # ─────────────────────────────────────────────
+    def use_pipeline(self, pipeline: Optional[bool]) -> bool:
+        return self.analysis_pipeline if pipeline is None else pipeline
+
+    def build_extraction_messages(self, user_input: str) -> List[Dict[str, str]]:
+        """추출 단계에는 기존 노드 목록이 필요 없으므로 히스토리 크기와 상관없이 프롬프트가 작다"""
+        system_prompt = f"""
+너는 사용자의 한 문장 인풋을 6하원칙(Who/What/When/Where/Why/How) 관점으로 분해하는 에이전트다.
+user_nodes만 JSON으로 응답하라.
+
+---
+
+{EXTRACTION_STEP}
+"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input},
+        ]
+
+    @staticmethod
+    def format_extracted_nodes(user_nodes: List[UserNode]) -> str:
+        return "\n".join(
+            f"[{i}] {un.category} / {un.phase}: \"{un.label}\" / {un.content}" for i, un in enumerate(user_nodes)
+        )
+
+    def build_suggestion_messages(
+        self, user_input: str, user_nodes: List[UserNode], history_context: str
+    ) -> List[Dict[str, str]]:
+        system_prompt = f"""
+너는 사용자의 아이디어를 확장하는 자율형 에이전트다.
+사용자의 인풋과 거기서 추출한 노드들을 보고 아이디어를 확장하는 날카로운 질문이나 제안 노드를 하나 만들어라.
+- suggestion_label(동사형 짧은 제목), suggestion_content(한 문장), suggestion_category, suggestion_phase
+- suggestion_connects_to_index: 제안 노드가 직접 연결될 추출 노드의 번호 (가장 핵심적인 노드)
+- connection_label: 그 노드와 제안의 관계 한 구절
+
+## 추출된 노드
+{self.format_extracted_nodes(user_nodes)}
+
+## 기존 노드 목록
+{history_context}
+"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input},
+        ]
+
+    def build_connection_messages(
+        self, user_input: str, user_nodes: List[UserNode], history_context: str
+    ) -> List[Dict[str, str]]:
+        system_prompt = f"""
+너는 새로 추출한 노드를 기존 아이디어 그래프에 연결하는 에이전트다.
+기존 노드 목록을 보고, 추출된 노드 중 **의미적으로 관련된** 것과 연결하라 (cross_connections).
+- existing_node_id: 기존 노드 ID
+- new_node_index: 연결될 추출 노드의 번호
+- connection_label: 관계 설명 한 구절
+- **기존 노드가 존재하면 반드시 최소 1개는 연결할 것.** 같은 카테고리, 같은 phase, 또는 주제의 연장선상이면 반드시 연결하라.
+- 최대 3개.
+
+## 추출된 노드
+{self.format_extracted_nodes(user_nodes)}
+
+## 기존 노드 목록
+{history_context}
+"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input},
+        ]
+
+    async def _timed_stage(self, name: str, stages: Dict[str, Any], model: str, call) -> Any:
+        """단계 하나를 실행하고 stages[name]에 모델과 걸린 시간(ms)을 남긴다 (Server-Timing에도 같은 이름으로)"""
+        started = time.perf_counter()
+        with metrics.stage(name):
+            result = await call
+        stages[name] = {"model": model, "ms": round((time.perf_counter() - started) * 1000, 1)}
+        return result
+
+    async def expand_extracted_nodes(
+        self,
+        user_input: str,
+        nodes: AnalysisNodes,
+        graph: GraphSession,
+        stages: Dict[str, Any],
+        use_cache: bool = True,
+        history_mode: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+    ) -> BaseModel:
+        """
+        추출된 노드로 제안과 cross-connection을 동시에 만들어 한 번에 받은 결과와 같은 모양으로 합친다.
+        local 모드면 연결은 assemble 단계에서 로컬로 채우고(AIAnalysisCore), 기존 노드가 없으면 연결 호출을 생략한다.
+        """
+        with metrics.stage("prompt"):
+            history_context = self.history_context_for(graph, user_input, history_mode)
+            suggest_messages = self.build_suggestion_messages(user_input, nodes.user_nodes, history_context)
+            connect = self.cross_connections != "local" and len(graph) > 0 and bool(nodes.user_nodes)
+            connect_messages = (
+                self.build_connection_messages(user_input, nodes.user_nodes, history_context) if connect else None
+            )
+        suggest_model = self.choose_model(
+            "analyze-suggest", ANALYSIS_PIPELINE_MODEL, suggest_messages, len(graph), latency_budget_ms
+        )
+        calls = [self._timed_stage("suggest", stages, suggest_model, self._parse_completion(
+            model=suggest_model, messages=suggest_messages, response_format=AnalysisSuggestion,
+            use_cache=use_cache, operation="analyze-suggest",
+        ))]
+        if connect:
+            connect_model = self.choose_model(
+                "analyze-connect", ANALYSIS_PIPELINE_MODEL, connect_messages, len(graph), latency_budget_ms
+            )
+            calls.append(self._timed_stage("connect", stages, connect_model, self._parse_completion(
+                model=connect_model, messages=connect_messages, response_format=AnalysisConnections,
+                use_cache=use_cache, operation="analyze-connect",
+            )))
+        suggestion, *connections = await asyncio.gather(*calls)
+
+        if self.cross_connections == "local":
+            return AIAnalysisCore.model_construct(user_nodes=nodes.user_nodes, **dict(suggestion))
+        return AIAnalysisResult.model_construct(
+            user_nodes=nodes.user_nodes,
+            **dict(suggestion),
+            cross_connections=connections[0].cross_connections if connections else [],
+        )
+
+    async def process_idea_pipelined(
+        self,
+        user_input: str,
+        graph: GraphSession,
+        use_cache: bool = True,
+        history_mode: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        stages: Dict[str, Any] = {}
+        started = time.perf_counter()
+        with metrics.stage("prompt"):
+            messages = self.build_extraction_messages(user_input)
+        model = self.choose_model("analyze-extract", ANALYSIS_MODEL, messages, len(graph), latency_budget_ms)
+        nodes = await self._timed_stage("extract", stages, model, self._parse_completion(
+            model=model, messages=messages, response_format=AnalysisNodes,
+            use_cache=use_cache, operation="analyze-extract",
+        ))
+        result = await self.expand_extracted_nodes(
+            user_input, nodes, graph, stages, use_cache, history_mode, latency_budget_ms
+        )
+        assembled = self.assemble_analysis(result, graph)
+        stages["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return {**assembled, "model": model, "stages": stages}
+
+    async def stream_process_idea_pipelined(
+        self,
+        user_input: str,
+        graph: GraphSession,
+        use_cache: bool = True,
+        history_mode: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """추출 단계는 스트리밍으로 node 이벤트를 내보내고, 끝나면 제안/연결 호출을 동시에 띄운다"""
+        stages: Dict[str, Any] = {}
+        started = time.perf_counter()
+        first_node_at = None
+        parser = JsonArrayItemParser("user_nodes")
+        created_nodes: List[Node] = []
+        with metrics.stage("prompt"):
+            messages = self.build_extraction_messages(user_input)
+        model = self.choose_model("analyze-extract", ANALYSIS_MODEL, messages, len(graph), latency_budget_ms)
+
+        try:
+            async for delta in self._stream_structured_completion(
+                model=model,
+                messages=messages,
+                response_format=AnalysisNodes,
+                use_cache=use_cache,
+                operation="analyze-extract",
+            ):
+                for item in parser.feed(delta):
+                    node = self.place_node(UserNode.model_validate(item), graph)
+                    created_nodes.append(node)
+                    if first_node_at is None:
+                        first_node_at = time.perf_counter()
+                    yield {"type": "node", "node": node.model_dump()}
+            stages["extract"] = {"model": model, "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+            result = await self.expand_extracted_nodes(
+                user_input, AnalysisNodes.model_validate_json(parser.text), graph, stages,
+                use_cache, history_mode, latency_budget_ms,
+            )
+            suggestion_node = self.place_node(
+                self.suggestion_as_user_node(result), graph,
+                is_ai_generated=True, reserve_slot=False,
+            )
+            self.prefetch_opening_turn(suggestion_node)
+            yield {"type": "node", "node": suggestion_node.model_dump()}
+
+            with metrics.stage("edges"):
+                result = self.with_cross_connections(result, graph, AIAnalysisResult)
+                edges = self.build_analysis_edges(
+                    result, [n.id for n in created_nodes], suggestion_node.id, graph
+                )
+            graph.add_nodes(created_nodes + [suggestion_node], edges)
+        finally:
+            self.release_uncommitted(graph, created_nodes)
+        for edge in edges:
+            yield {"type": "edge", "edge": edge.model_dump()}
+
+        stages["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        yield {
+            "type": "done",
+            "model": model,
+            "stages": stages,
+            "timing": stream_timing(started, first_node_at, "first_node_ms"),
+        }
+
+    # ─────────────────────────────────────────────
+    # 1-b. 여러 인풋 일괄 분석
+    # ─────────────────────────────────────────────
+    async def stream_process_batch(
+        self,
+        texts: List[str],
+        history: Optional[List[Dict[str, Any]]] = None,
+        graph: Optional[GraphSession] = None,
+        use_cache: bool = True,
+        history_mode: Optional[str] = None,
+        max_concurrency: int = BATCH_MAX_CONCURRENCY,
+        latency_budget_ms: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        여러 인풋의 LLM 호출을 동시에(최대 max_concurrency개) 실행하고,
+        끝나는 순서대로 하나의 그래프(공유 레이아웃)에 배치해 item 이벤트로 내보낸다.
+        프롬프트는 모두 배치 시작 시점의 그래프 기준이며, 항목별 실패는 그 항목만 error로 보고한다.
+        공백만 다른 같은 인풋은 한 번만 분석하고, 뒤의 항목은 duplicate_of로 앞 항목을 가리킨다.
+        """
+        graph = self.resolve_graph(history, graph)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        first_index: Dict[str, int] = {}
+        duplicates: Dict[int, List[int]] = {}
+        for index, text in enumerate(texts):
+            key = " ".join(text.split())
+            if key in first_index:
+                duplicates.setdefault(first_index[key], []).append(index)
+            else:
+                first_index[key] = index
+        unique = list(first_index.values())
+        with metrics.stage("prompt"):
+            prompts = {i: self.build_analysis_messages(texts[i], graph, history_mode) for i in unique}
+
+        models = {
+            i: self.choose_model("analyze", ANALYSIS_MODEL, prompt, len(graph), latency_budget_ms)
+            for i, prompt in prompts.items()
+        }
+
+        async def run(index: int):
+            async with semaphore:
+                try:
+                    result = await self._parse_completion(
+                        model=models[index],
+                        messages=prompts[index],
+                        response_format=self.analysis_schema,
+                        use_cache=use_cache,
+                        operation="analyze",
+                    )
+                    return index, result, None
+                except Exception as e:
+                    return index, None, e
+
+        # 배치 요청마다 한 번 우선순위를 낮춘 컨텍스트를 만들고, 항목 태스크는 그 복사본에서 돈다
+        # (요청 컨텍스트 자체는 바꾸지 않는다)
+        context = contextvars.copy_context()
+        context.run(bind_admission, priority="bulk")
+        tasks = [asyncio.create_task(run(i), context=context.copy()) for i in unique]
+        started = time.perf_counter()
+        first_item_at = None
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, result, error = await next_done
+                if first_item_at is None:
+                    first_item_at = time.perf_counter()
+                if error is not None:
+                    item = {"type": "item", "index": index, "status": "error", "error": str(error),
+                            "model": models[index], "nodes": [], "edges": []}
+                else:
+                    assembled = self.assemble_analysis(result, graph, dedup_edges=True)
+                    item = {"type": "item", "index": index, "status": "ok", "error": None,
+                            "model": models[index], "nodes": [n.model_dump() for n in assembled["nodes"]],
+                            "edges": [e.model_dump() for e in assembled["edges"]]}
+                for event in [item] + [
+                    {**item, "index": i, "duplicate_of": index, "nodes": [], "edges": []}
+                    for i in duplicates.get(index, [])
+                ]:
+                    if error is not None:
+                        failed += 1
+                    yield event
+        finally:
+            # 클라이언트가 끊겨 제너레이터가 닫히면 아직 안 끝난 항목의 LLM 호출도 멈춘다
+            for task in tasks:
+                task.cancel()
+
+        yield {"type": "done", "total": len(texts), "failed": failed,
+               "timing": stream_timing(started, first_item_at, "first_item_ms")}
+
+    async def process_batch(self, texts: List[str], **kwargs) -> Dict[str, Any]:
+        """stream_process_batch 결과를 하나의 nodes/edges 응답으로 합친다 (항목 순서대로 items 보고)"""
+        nodes, edges, items = [], [], []
+        node_ids: Dict[int, List[str]] = {}
+        async for event in self.stream_process_batch(texts, **kwargs):
+            if event["type"] != "item":
+                continue
+            nodes.extend(event["nodes"])
+            edges.extend(event["edges"])
+            duplicate_of = event.get("duplicate_of")
+            node_ids[event["index"]] = (
+                node_ids[duplicate_of] if duplicate_of is not None else [n["id"] for n in event["nodes"]]
+            )
+            items.append({
+                "index": event["index"],
+                "status": event["status"],
+                "error": event["error"],
+                "model": event["model"],
+                "node_ids": node_ids[event["index"]],
+                "duplicate_of": duplicate_of,
+            })
+        items.sort(key=lambda item: item["index"])
+        return {"nodes": nodes, "edges": edges, "items": items}
+
     # ─────────────────────────────────────────────
     # 2. AI 채팅: suggestion 카드 클릭 후 대화
     # ─────────────────────────────────────────────
-    def chat_with_suggestion(
+    def build_chat_messages(
         self,
         suggestion_title: str,
         suggestion_content: str,
@@ -304,7 +1021,8 @@ user_nodes 전체를 보고 아이디어를 확장하는 날카로운 질문이
         suggestion_phase: str,
         messages: List[ChatMessage],
         user_message: str,
-    ) -> str:
+        summary: Optional[str] = None,
+    ) -> List[Dict[str, str]]:
         system_prompt = f"""너는 사용자의 아이디어를 함께 탐구하는 AI 대화 파트너다.
 
 아래 제안 카드를 중심으로 사용자와 자유롭게 대화하라.
@@ -317,104 +1035,298 @@ user_nodes 전체를 보고 아이디어를 확장하는 날카로운 질문이
 카테고리: {suggestion_category} / {suggestion_phase}
 제목: {suggestion_title}
 내용: {suggestion_content}
+"""
+        if summary:
+            system_prompt += f"""
+[이전 대화 요약]
+{summary}
 """
         chat_history = [
             {"role": msg.role, "content": msg.content}
             for msg in messages
         ]
         chat_history.append({"role": "user", "content": user_message})
+        return [
+            {"role": "system", "content": system_prompt},
+            *chat_history,
+        ]
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                *chat_history,
-            ],
+    # ─────────────────────────────────────────────
+    # 대화 압축: 오래된 턴은 누적 요약으로
+    # ─────────────────────────────────────────────
+    def conversation_key(self, session_id: Optional[str], conversation_id: Optional[str]) -> Optional[str]:
+        """대화별 상태(요약, 변환 체크포인트)의 키. 대화 ID가 없으면 None — 다른 대화와 상태를 나누지 않는다"""
+        if conversation_id is None:
+            return None
+        return f"{session_id or ''}\0{conversation_id}"
+
+    def compact_messages(
+        self, conversation_key: Optional[str], messages: List[ChatMessage]
+    ) -> Tuple[Optional[str], List[ChatMessage]]:
+        metrics.observe_size("thinking_chat_messages", len(messages))
+        note_history(chat_messages=len(messages))
+        if self.compactor is None:
+            return None, messages
+        return self.compactor.compact(conversation_key, messages)
+
+    async def summarize_conversation(self, previous_summary: Optional[str], messages: List[ChatMessage]) -> str:
+        """기존 요약에 새로 밀려난 대화 턴을 접어 넣은 누적 요약 (백그라운드에서 호출)"""
+        conversation_text = "\n".join(
+            f"[{m.role.upper()}] {m.content}" for m in messages
+        )
+        system_prompt = f"""너는 아이디어 탐구 대화를 요약하는 에이전트다.
+기존 요약과 이어지는 대화를 합쳐, 이후 대화에 필요한 핵심 아이디어·결정·열린 질문만 남긴 요약을 만들어라.
+- 400자 이내, 한국어, 불릿 목록.
+
+[기존 요약]
+{previous_summary or "없음"}
+
+[이어지는 대화]
+{conversation_text}
+"""
+        prompt = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "요약해줘."},
+        ]
+        return await self._create_completion(
+            model=self.choose_model("summary", CHAT_MODEL, prompt),
+            messages=prompt,
+            operation="summary",
         )
-        return response.choices[0].message.content
 
     # ─────────────────────────────────────────────
-    # 3. 대화 내용 → ReactFlow 노드+엣지 변환
+    # 채팅 첫 턴 추측 생성: 제안 노드가 생기면 카드를 열기 전에 미리
     # ─────────────────────────────────────────────
-    def chat_to_nodes(
+    def prefetch_opening_turn(self, suggestion_node: Node) -> None:
+        """첫 턴은 제안 카드 정보만으로 정해지므로 노드가 만들어진 시점에 생성을 시작할 수 있다."""
+        if self.prefetcher is None:
+            return
+        data = suggestion_node.data
+        opening = dict(
+            suggestion_title=data.label,
+            suggestion_content=data.content,
+            suggestion_category=data.category,
+            suggestion_phase=data.phase,
+        )
+        prompt = self.build_chat_messages(**opening, messages=[], user_message=CHAT_OPENING_MESSAGE)
+        cost = sum(estimate_tokens(m["content"]) for m in prompt) + CHAT_PREFETCH_REPLY_TOKENS
+        self.prefetcher.schedule(
+            suggestion_node.id,
+            opening_fingerprint(data.label, data.content, data.category, data.phase, CHAT_OPENING_MESSAGE),
+            cost,
+            **opening, messages=[], user_message=CHAT_OPENING_MESSAGE,
+        )
+
+    async def take_opening_turn(
+        self,
+        suggestion_id: Optional[str],
+        suggestion_title: str,
+        suggestion_content: str,
+        suggestion_category: str,
+        suggestion_phase: str,
+        messages: List[ChatMessage],
+        user_message: str,
+        use_cache: bool,
+    ) -> Optional[Dict[str, Any]]:
+        """미리 생성해 둔 첫 턴 {"reply", "model"} (대화가 이미 진행 중이거나 캐시를 건너뛰는 요청이면 None)"""
+        if self.prefetcher is None or suggestion_id is None or messages or not use_cache:
+            return None
+        return await self.prefetcher.take(suggestion_id, opening_fingerprint(
+            suggestion_title, suggestion_content, suggestion_category, suggestion_phase, user_message,
+        ))
+
+    async def chat_with_suggestion(
         self,
         suggestion_title: str,
         suggestion_content: str,
         suggestion_category: str,
         suggestion_phase: str,
         messages: List[ChatMessage],
-        existing_nodes: List[Dict[str, Any]],
+        user_message: str,
+        use_cache: bool = True,
+        conversation_id: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+        suggestion_id: Optional[str] = None,
+        session_id: Optional[str] = None,
     ) -> Dict[str, Any]:
-        history_context = self.build_history_context(existing_nodes)
+        """{"reply": 답변, "model": 답변한 모델, "prefetched": 미리 만든 첫 턴인지}"""
+        prefetched = await self.take_opening_turn(
+            suggestion_id, suggestion_title, suggestion_content, suggestion_category,
+            suggestion_phase, messages, user_message, use_cache,
+        )
+        if prefetched is not None:
+            return {**prefetched, "prefetched": True}
+        with metrics.stage("prompt"):
+            summary, messages = self.compact_messages(
+                self.conversation_key(session_id, conversation_id), messages
+            )
+            chat_messages = self.build_chat_messages(
+                suggestion_title, suggestion_content, suggestion_category,
+                suggestion_phase, messages, user_message, summary,
+            )
+        model = self.choose_model("chat", CHAT_MODEL, chat_messages, latency_budget_ms=latency_budget_ms)
+        reply = await self._create_completion(
+            model=model,
+            messages=chat_messages,
+            use_cache=use_cache,
+            operation="chat",
+        )
+        return {"reply": reply, "model": model, "prefetched": False}
 
+    async def stream_chat_with_suggestion(
+        self,
+        suggestion_title: str,
+        suggestion_content: str,
+        suggestion_category: str,
+        suggestion_phase: str,
+        messages: List[ChatMessage],
+        user_message: str,
+        use_cache: bool = True,
+        conversation_id: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+        suggestion_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        chat_with_suggestion의 스트리밍 버전.
+        {"type": "delta", "content": ...} 이벤트를 토큰이 나오는 대로 내보내고,
+        마지막에 usage/timing을 담은 {"type": "done", ...} 이벤트를 내보낸다.
+        """
+        started = time.perf_counter()
+        prefetched = await self.take_opening_turn(
+            suggestion_id, suggestion_title, suggestion_content, suggestion_category,
+            suggestion_phase, messages, user_message, use_cache,
+        )
+        if prefetched is not None:
+            yield {"type": "delta", "content": prefetched["reply"]}
+            yield {
+                "type": "done",
+                "reply": prefetched["reply"],
+                "model": prefetched["model"],
+                "usage": None,
+                "cached": True,
+                "prefetched": True,
+                "timing": stream_timing(started, time.perf_counter(), "ttft_ms"),
+            }
+            return
+        with metrics.stage("prompt"):
+            summary, messages = self.compact_messages(
+                self.conversation_key(session_id, conversation_id), messages
+            )
+            chat_messages = self.build_chat_messages(
+                suggestion_title, suggestion_content, suggestion_category,
+                suggestion_phase, messages, user_message, summary,
+            )
+        model = self.choose_model("chat", CHAT_MODEL, chat_messages, latency_budget_ms=latency_budget_ms)
+        key, cached = self._cache_lookup(model, chat_messages, None, use_cache)
+        if cached is not None:
+            yield {"type": "delta", "content": cached}
+            yield {
+                "type": "done",
+                "reply": cached,
+                "model": model,
+                "usage": None,
+                "cached": True,
+                "prefetched": False,
+                "timing": stream_timing(started, time.perf_counter(), "ttft_ms"),
+            }
+            return
+
+        first_token_at = None
+        usage = None
+        reply_parts: List[str] = []
+
+        async for chunk in self._stream_completion(model=model, messages=chat_messages, operation="chat"):
+            if chunk.usage is not None:
+                usage = chunk.usage
+            delta = chunk.content
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            reply_parts.append(delta)
+            yield {"type": "delta", "content": delta}
+
+        reply = "".join(reply_parts)
+        self._cache_store(key, reply)
+        yield {
+            "type": "done",
+            "reply": reply,
+            "model": model,
+            "usage": usage,
+            "cached": False,
+            "prefetched": False,
+            "timing": stream_timing(started, first_token_at, "ttft_ms"),
+        }
+
+    # ─────────────────────────────────────────────
+    # 3. 대화 내용 → ReactFlow 노드+엣지 변환
+    # ─────────────────────────────────────────────
+    def build_chat_to_nodes_messages(
+        self,
+        suggestion_title: str,
+        suggestion_content: str,
+        suggestion_category: str,
+        suggestion_phase: str,
+        messages: List[ChatMessage],
+        graph: GraphSession,
+        history_mode: Optional[str] = None,
+        summary: Optional[str] = None,
+        converted: Optional[str] = None,
+    ) -> List[Dict[str, str]]:
         conversation_text = "\n".join(
             f"[{m.role.upper()}] {m.content}" for m in messages
         )
+        if summary:
+            conversation_text = f"[이전 대화 요약]\n{summary}\n\n[최근 대화]\n{conversation_text}"
+        # 같은 대화를 전에 변환했으면 그 이후의 턴만 싣고, 이미 만든 노드는 목록으로만 알려 준다
+        instruction = "아래 대화를 분석해서 핵심 아이디어를 1~4개의 노드로 추출하라."
+        converted_section = ""
+        if converted:
+            instruction = (
+                "아래는 이미 노드로 만든 대화 이후에 이어진 대화다. 새로 나온 아이디어만 0~4개의 노드로 추출하라.\n"
+                "이미 만든 노드와 같은 내용은 다시 만들지 마라."
+            )
+            converted_section = f"""
+[이미 만든 노드]
+{converted}
+"""
+        # 기존 노드 목록은 cross_connections에만 쓰이므로 local 모드에서는 프롬프트에 넣지 않는다
+        history_section = ""
+        if self.cross_connections != "local":
+            history_context = self.history_context_for(
+                graph, f"{suggestion_title} {suggestion_content}\n{conversation_text}", history_mode
+            )
+            history_section = f"""
+## 기존 노드 목록 (cross_connections 시 사용)
+{history_context}
+"""
 
         system_prompt = f"""
 너는 대화 내용을 6하원칙 노드로 구조화하는 에이전트다.
 
-아래 대화를 분석해서 핵심 아이디어를 1~4개의 노드로 추출하라.
+{instruction}
 각 노드는 label(짧은 동사형 제목), content(한 문장), category(Who/What/When/Where/Why/How), phase(Problem/Solution)로 구성.
 
 [제안 카드 원본]
 {suggestion_category}/{suggestion_phase}: {suggestion_title} - {suggestion_content}
-
+{converted_section}
 [대화 내용]
 {conversation_text}
+{history_section}"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "대화를 노드로 구조화해줘."},
+        ]
 
-## 기존 노드 목록 (cross_connections 시 사용)
-{history_context}
-"""
-
-        class ChatNodeResult(BaseModel):
-            user_nodes: List[UserNode]
-            cross_connections: List[CrossConnectionResult]
-
-        completion = self.client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": "대화를 노드로 구조화해줘."},
-            ],
-            response_format=ChatNodeResult,
-        )
-        result = completion.choices[0].message.parsed
-
-        # 슬롯 카운트 (기존 노드 기반)
-        slot_counts: Dict[str, int] = {}
-        for h_node in existing_nodes:
-            h_data = h_node.get("data", {})
-            h_phase = h_data.get("phase", "")
-            h_cat = h_data.get("category", "")
-            if h_phase and h_cat:
-                key = f"{h_phase}_{h_cat}"
-                slot_counts[key] = slot_counts.get(key, 0) + 1
-
-        created_nodes = []
-        created_node_ids = []
-        for un in result.user_nodes:
-            node_id = str(uuid.uuid4())
-            key = f"{un.phase}_{un.category}"
-            slot_idx = slot_counts.get(key, 0)
-            pos = self.calculate_position(un.phase, un.category, slot_index=slot_idx)
-            slot_counts[key] = slot_idx + 1
-
-            node = Node(
-                id=node_id,
-                type="default",
-                data=NodeData(
-                    label=un.label,
-                    content=un.content,
-                    category=un.category,
-                    phase=un.phase,
-                    is_ai_generated=False
-                ),
-                position=pos
-            )
-            created_nodes.append(node)
-            created_node_ids.append(node_id)
-
+    def build_chat_edges(
+        self,
+        result: ChatNodeResult,
+        created_node_ids: List[str],
+        graph: GraphSession,
+        anchor_id: Optional[str] = None,
+    ) -> List[Edge]:
+        """anchor_id: 같은 대화의 이전 변환에서 만든 마지막 노드 (있으면 연결이 없을 때 그 노드에서 이어 간다)"""
         edges = []
         # 같은 대화에서 나온 노드들 순차 연결
         for i in range(len(created_node_ids) - 1):
@@ -425,34 +1337,210 @@ user_nodes 전체를 보고 아이디어를 확장하는 날카로운 질문이
                 label="이어서"
             ))
 
+        if not created_node_ids:
+            return edges
+
         # cross-connections to existing nodes
-        existing_ids = {n.get("id") for n in existing_nodes}
-        cross_connected = set()
-        for cross in result.cross_connections:
-            if cross.existing_node_id not in existing_ids:
-                continue
-            new_idx = cross.new_node_index
-            if new_idx >= len(created_node_ids):
-                new_idx = 0
-            target_id = created_node_ids[new_idx]
-            edges.append(Edge(
-                id=f"e-cross-{cross.existing_node_id}-{target_id}",
-                source=cross.existing_node_id,
-                target=target_id,
-                label=cross.connection_label
-            ))
-            cross_connected.add(target_id)
+        existing_ids = graph.existing_ids
+        cross_edges = self.build_cross_edges(result.cross_connections, created_node_ids, existing_ids)
+        edges.extend(cross_edges)
 
         # fallback: 기존 노드가 있는데 아무 연결도 없으면 마지막 기존 노드에 연결
-        if existing_nodes and created_node_ids and not cross_connected:
+        if len(graph) and not cross_edges:
             first_id = created_node_ids[0]
-            anchor = existing_nodes[-1].get("id")
+            continued = anchor_id is not None and anchor_id in existing_ids
+            anchor = anchor_id if continued else graph.last_node_id
             if anchor and anchor in existing_ids:
                 edges.append(Edge(
                     id=f"e-cross-{anchor}-{first_id}",
                     source=anchor,
                     target=first_id,
-                    label="대화에서 발전"
+                    label="이어서" if continued else "대화에서 발전"
                 ))
 
+        return edges
+
+    def prepare_chat_conversion(
+        self,
+        suggestion_title: str,
+        suggestion_content: str,
+        suggestion_category: str,
+        suggestion_phase: str,
+        messages: List[ChatMessage],
+        graph: GraphSession,
+        history_mode: Optional[str],
+        conversation_id: Optional[str],
+    ) -> Tuple[Optional[str], Optional[ConversionCheckpoint], Optional[List[Dict[str, str]]]]:
+        """
+        (대화 키, 이전 변환 체크포인트, 프롬프트) — 지난 변환 이후 새 턴이 없으면 프롬프트는 None.
+        체크포인트는 세션과 대화 ID로만 찾는다. 대화 ID가 없으면 매번 대화 전체를 변환한다.
+        """
+        key = self.conversation_key(graph.session_id, conversation_id)
+        if self.conversions is None or key is None:
+            checkpoint, pending = None, messages
+        else:
+            checkpoint, pending = self.conversions.split(key, messages)
+        if checkpoint is not None and not pending:
+            return key, checkpoint, None
+        # 체크포인트 이후의 턴만 압축한다 (앞부분은 이미 노드가 되었으므로 요약 대상이 아니다)
+        compact_key = key if checkpoint is None else f"{key}\0{checkpoint.covered}"
+        summary, pending = self.compact_messages(compact_key, pending)
+        prompt = self.build_chat_to_nodes_messages(
+            suggestion_title, suggestion_content, suggestion_category, suggestion_phase, pending,
+            graph, history_mode, summary, self.conversions.summary(checkpoint) if checkpoint else None,
+        )
+        return key, checkpoint, prompt
+
+    def drop_converted_nodes(self, result: BaseModel, checkpoint: Optional[ConversionCheckpoint]) -> BaseModel:
+        """이전 변환에서 이미 만든 노드와 제목이 같은 노드를 빼고 cross_connections 인덱스를 맞춘다"""
+        if checkpoint is None:
+            return result
+        seen = self.conversions.duplicates(checkpoint)
+        keep = [i for i, node in enumerate(result.user_nodes) if normalize_label(node.label) not in seen]
+        if len(keep) == len(result.user_nodes):
+            return result
+        index = {old: new for new, old in enumerate(keep)}
+        fields = dict(result)
+        fields["user_nodes"] = [result.user_nodes[i] for i in keep]
+        if "cross_connections" in fields:
+            fields["cross_connections"] = [
+                c.model_copy(update={"new_node_index": index[c.new_node_index]})
+                for c in result.cross_connections if c.new_node_index in index
+            ]
+        return type(result).model_construct(**fields)
+
+    def last_converted_id(self, checkpoint: Optional[ConversionCheckpoint], graph: GraphSession) -> Optional[str]:
+        if checkpoint is None:
+            return None
+        existing_ids = graph.existing_ids
+        return next((n.id for n in reversed(checkpoint.nodes) if n.id in existing_ids), None)
+
+    def record_conversion(self, key: Optional[str], messages: List[ChatMessage], created_nodes: List[Node]) -> Optional[int]:
+        """변환이 끝난 메시지 수 (체크포인트를 쓰지 않으면 None)"""
+        if self.conversions is None or key is None:
+            return None
+        return self.conversions.record(key, messages, created_nodes).covered
+
+    def assemble_chat_nodes(
+        self, result: ChatNodeResult, graph: GraphSession, checkpoint: Optional[ConversionCheckpoint] = None
+    ) -> Dict[str, Any]:
+        result = self.drop_converted_nodes(result, checkpoint)
+        with metrics.stage("layout"):
+            created_nodes = [self.place_node(un, graph) for un in result.user_nodes]
+        with metrics.stage("edges"):
+            result = self.with_cross_connections(result, graph, ChatNodeResult)
+            edges = self.build_chat_edges(
+                result, [n.id for n in created_nodes], graph, self.last_converted_id(checkpoint, graph)
+            )
+        graph.add_nodes(created_nodes, edges)
         return {"nodes": created_nodes, "edges": edges}
+
+    async def chat_to_nodes(
+        self,
+        suggestion_title: str,
+        suggestion_content: str,
+        suggestion_category: str,
+        suggestion_phase: str,
+        messages: List[ChatMessage],
+        existing_nodes: Optional[List[Dict[str, Any]]] = None,
+        graph: Optional[GraphSession] = None,
+        use_cache: bool = True,
+        history_mode: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        graph = self.resolve_graph(existing_nodes, graph)
+        with metrics.stage("prompt"):
+            key, checkpoint, prompt = self.prepare_chat_conversion(
+                suggestion_title, suggestion_content, suggestion_category, suggestion_phase,
+                messages, graph, history_mode, conversation_id,
+            )
+        if prompt is None:
+            # 지난 변환 이후 새 턴이 없다 — LLM을 부르지 않는다
+            return {"nodes": [], "edges": [], "model": None, "converted_messages": checkpoint.covered}
+        model = self.choose_model("chat-to-nodes", ANALYSIS_MODEL, prompt, len(graph), latency_budget_ms)
+        result = await self._parse_completion(
+            model=model,
+            messages=prompt,
+            response_format=self.chat_nodes_schema,
+            use_cache=use_cache,
+            operation="chat-to-nodes",
+        )
+        assembled = self.assemble_chat_nodes(result, graph, checkpoint)
+        converted = self.record_conversion(key, messages, assembled["nodes"])
+        return {**assembled, "model": model, "converted_messages": converted}
+
+    async def stream_chat_to_nodes(
+        self,
+        suggestion_title: str,
+        suggestion_content: str,
+        suggestion_category: str,
+        suggestion_phase: str,
+        messages: List[ChatMessage],
+        existing_nodes: Optional[List[Dict[str, Any]]] = None,
+        graph: Optional[GraphSession] = None,
+        use_cache: bool = True,
+        history_mode: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """chat_to_nodes의 스트리밍 버전 (이벤트 형식은 stream_process_idea와 동일)"""
+        graph = self.resolve_graph(existing_nodes, graph)
+        started = time.perf_counter()
+        with metrics.stage("prompt"):
+            key, checkpoint, prompt = self.prepare_chat_conversion(
+                suggestion_title, suggestion_content, suggestion_category, suggestion_phase,
+                messages, graph, history_mode, conversation_id,
+            )
+        if prompt is None:
+            yield {
+                "type": "done",
+                "model": None,
+                "converted_messages": checkpoint.covered,
+                "timing": stream_timing(started, None, "first_node_ms"),
+            }
+            return
+        model = self.choose_model("chat-to-nodes", ANALYSIS_MODEL, prompt, len(graph), latency_budget_ms)
+        first_node_at = None
+        parser = JsonArrayItemParser("user_nodes")
+        created_nodes: List[Node] = []
+        seen = self.conversions.duplicates(checkpoint) if checkpoint is not None else set()
+
+        try:
+            async for delta in self._stream_structured_completion(
+                model=model,
+                messages=prompt,
+                response_format=self.chat_nodes_schema,
+                use_cache=use_cache,
+                operation="chat-to-nodes",
+            ):
+                for item in parser.feed(delta):
+                    user_node = UserNode.model_validate(item)
+                    if normalize_label(user_node.label) in seen:
+                        continue
+                    node = self.place_node(user_node, graph)
+                    created_nodes.append(node)
+                    if first_node_at is None:
+                        first_node_at = time.perf_counter()
+                    yield {"type": "node", "node": node.model_dump()}
+
+            result = self.drop_converted_nodes(self.chat_nodes_schema.model_validate_json(parser.text), checkpoint)
+            with metrics.stage("edges"):
+                result = self.with_cross_connections(result, graph, ChatNodeResult)
+                edges = self.build_chat_edges(
+                    result, [n.id for n in created_nodes], graph, self.last_converted_id(checkpoint, graph)
+                )
+            graph.add_nodes(created_nodes, edges)
+            # 그래프에 들어간 즉시 체크포인트도 남긴다 (done 전에 클라이언트가 끊겨도 다음 변환이 노드를 다시 만들지 않도록)
+            converted = self.record_conversion(key, messages, created_nodes)
+        finally:
+            self.release_uncommitted(graph, created_nodes)
+        for edge in edges:
+            yield {"type": "edge", "edge": edge.model_dump()}
+
+        yield {
+            "type": "done",
+            "model": model,
+            "converted_messages": converted,
+            "timing": stream_timing(started, first_node_at, "first_node_ms"),
+        }
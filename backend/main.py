@@ -1,10 +1,51 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager, contextmanager
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.routing import Match
+from pydantic import ValidationError
+import logging
 import os
-from .models import AnalysisRequest, AnalysisResponse, ChatRequest, ChatResponse, ChatToNodesRequest
-from .logic import ThinkingAgent
+import time
+from typing import Optional
+from .models import (
+    AnalysisRequest, AnalysisResponse, ChatRequest, ChatResponse, ChatToNodesRequest,
+    SessionSyncRequest, SessionResponse, BatchAnalysisRequest, BatchAnalysisResponse,
+    JobPriority, JobResponse, LayoutRequest, LayoutResponse,
+)
+from .admission import AdmissionContextMiddleware, current_client
+from .cassette import CassetteProvider, CassetteRecorderMiddleware
+from .channel import Channel, ChannelBusy, SessionHub, CLOSE_SESSION_NOT_FOUND
+from .jobs import JobManager, JobQueueFull
+from .logic import ThinkingAgent, LLM_WARMUP
+from .resilience import UpstreamError, UpstreamUnavailable
+from .metrics import metrics, MetricsMiddleware, METRICS_ENABLED, SERVER_TIMING
+from .relayout import layout_graph
+from .serialization import FastJSONRoute, dumps_str, orjson, prevalidated, raw_json
+from .sessions import GraphSession, create_session_store
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if LLM_WARMUP and agent.provider.configured:
+        report = await agent.warm_up()
+        if report["error"] is not None:
+            logger.warning("LLM warm-up failed: %s", report)
+        else:
+            logger.info("LLM warm-up: %s", report)
+    jobs.start()
+    yield
+    await jobs.stop()
+    # 공유 커넥션 풀 정리
+    await agent.aclose()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+if orjson is not None:
+    app.router.route_class = FastJSONRoute
 
 # Configure CORS for frontend
 app.add_middleware(
@@ -13,14 +54,96 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
+
+def route_template(scope: dict) -> str:
+    """메트릭 라벨용 라우트 경로 (예: /sessions/{session_id}). 매칭되지 않으면 other."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "other"
+
+
+# 둘 다 꺼져 있으면 미들웨어 자체를 붙이지 않는다
+if METRICS_ENABLED or SERVER_TIMING:
+    app.add_middleware(MetricsMiddleware, route_name=route_template)
+# LLM 입장 제어의 클라이언트 키/우선순위를 요청마다 정한다
+app.add_middleware(AdmissionContextMiddleware)
+
 # Initialize Agent
 api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    print("WARNING: OPENAI_API_KEY not found in environment variables.")
-
 agent = ThinkingAgent(api_key=api_key)
+if not agent.provider.configured:
+    logger.warning("OPENAI_API_KEY not found in environment variables.")
+# LLM_CASSETTE=record면 회귀 러너가 다시 보낼 API 요청 본문도 같은 파일에 남긴다
+if isinstance(agent.provider, CassetteProvider) and agent.provider.writer is not None:
+    app.add_middleware(CassetteRecorderMiddleware, writer=agent.provider.writer)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+session_store = create_session_store()
+
+
+def upstream_http_error(e: UpstreamError) -> HTTPException:
+    headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+
+@contextmanager
+def http_errors():
+    """엔드포인트 공통 오류 변환: UpstreamError는 그 상태 코드로, 예상하지 못한 오류는 스택을 로그로 남기고 500으로"""
+    try:
+        yield
+    except HTTPException:
+        raise
+    except UpstreamError as e:
+        raise upstream_http_error(e) from e
+    except Exception as e:
+        logger.exception("Unhandled error in endpoint")
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+def require_llm() -> None:
+    """LLM을 부를 수 없는 상태면 요청을 받기 전에 거절한다 (키 없음 500, 서킷 열림 503)"""
+    if not agent.provider.configured:
+        raise HTTPException(status_code=500, detail="OpenAI API Key is missing on server.")
+    breaker = agent.upstream.breaker
+    if breaker.state == "open":
+        raise upstream_http_error(UpstreamUnavailable(
+            "LLM upstream is unavailable (circuit open).", retry_after=breaker.retry_after(),
+        ))
+
+
+def resolve_session(session_id: Optional[str], client_version: Optional[int]) -> Optional[GraphSession]:
+    """session_id가 있으면 세션 그래프를 돌려준다. 클라이언트 버전이 다르면 409로 재동기화를 요구."""
+    if session_id is None:
+        return None
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found.")
+    if client_version is not None and client_version != session.version:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Session version mismatch.", "version": session.version},
+        )
+    return session
+
+
+async def commit_session(result: dict, session: Optional[GraphSession]) -> dict:
+    if session is not None:
+        result["session_id"] = session.session_id
+        result["version"] = session.version
+        await session_store.save_async(session)
+    return result
+
+
+async def with_session(events, session: Optional[GraphSession]):
+    """스트리밍이 끝나면 세션을 저장하고 done 이벤트에 세션 버전을 싣는다."""
+    async for event in events:
+        if event["type"] == "done":
+            await commit_session(event, session)
+        yield event
 
 
 @app.get("/")
@@ -28,57 +151,528 @@ def read_root():
     return {"message": "Visual Thinking Machine Backend is running"}
 
 
+@app.get("/cache/stats")
+def cache_stats_endpoint():
+    if agent.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent.cache.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus 텍스트 형식 메트릭"""
+    gauges = {}
+    if agent.cache is not None:
+        cache = agent.cache.stats()
+        gauges.update({
+            "thinking_llm_cache_hits": cache["hits"],
+            "thinking_llm_cache_misses": cache["misses"],
+            "thinking_llm_cache_size": cache["size"],
+        })
+    if agent.singleflight is not None:
+        flight = agent.singleflight.stats()
+        gauges.update({
+            "thinking_singleflight_leaders": flight["leaders"],
+            "thinking_singleflight_coalesced": flight["coalesced"],
+            "thinking_singleflight_in_flight": flight["in_flight"],
+        })
+    gauges["thinking_breaker_open"] = 1 if agent.upstream.breaker.state == "open" else 0
+    for lane, depth in jobs.queue_depth().items():
+        gauges[f"thinking_jobs_queued_{lane}"] = depth
+    for lane, running in jobs.running().items():
+        gauges[f"thinking_jobs_running_{lane}"] = running
+    gauges["thinking_ws_connections"] = hub.connections()
+    if agent.admission.enabled:
+        for priority, depth in agent.admission.stats()["queue_depth"].items():
+            gauges[f"thinking_admission_queued_{priority}"] = depth
+    return PlainTextResponse(
+        metrics.render(gauges), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/singleflight/stats")
+def singleflight_stats_endpoint():
+    """동시에 들어온 같은 LLM 요청이 하나로 합쳐진 횟수"""
+    if agent.singleflight is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent.singleflight.stats()}
+
+
+@app.get("/prefetch/stats")
+def prefetch_stats_endpoint():
+    """채팅 첫 턴 추측 생성의 적중률과 예산 사용량"""
+    if agent.prefetcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent.prefetcher.stats()}
+
+
+@app.get("/conversions/stats")
+def conversions_stats_endpoint():
+    """대화→노드 변환 체크포인트 수와 전체/증분 변환 횟수"""
+    if agent.conversions is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent.conversions.stats()}
+
+
+@app.get("/cassette/stats")
+def cassette_stats_endpoint():
+    """LLM 녹화/재생 모드와 녹화·적중·미스 횟수"""
+    if not isinstance(agent.provider, CassetteProvider):
+        return {"enabled": False}
+    return {"enabled": True, **agent.provider.stats()}
+
+
+@app.get("/admission/stats")
+def admission_stats_endpoint():
+    """업스트림 한도 버킷 잔량과 우선순위별 대기열"""
+    if not agent.admission.enabled:
+        return {"enabled": False}
+    return {"enabled": True, **agent.admission.stats()}
+
+
+@app.get("/router/stats")
+def router_stats_endpoint():
+    """모델별 최근 지연/오류율과 라우팅 결정 수"""
+    return agent.router.snapshot()
+
+
+@app.post("/sessions", response_model=SessionResponse)
+async def create_session_endpoint(request: SessionSyncRequest):
+    session = session_store.create(request.nodes, request.edges)
+    await session_store.save_async(session)
+    return raw_json(session.to_dict())
+
+
+@app.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session_endpoint(session_id: str):
+    session = resolve_session(session_id, None)
+    return raw_json(session.to_dict())
+
+
+@app.put("/sessions/{session_id}", response_model=SessionResponse)
+async def sync_session_endpoint(session_id: str, request: SessionSyncRequest):
+    session = resolve_session(session_id, None)
+    session.replace(request.nodes, request.edges)
+    await session_store.save_async(session)
+    return raw_json(session.to_dict())
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session_endpoint(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found.")
+    return {"deleted": session_id}
+
+
+@app.post("/layout", response_model=LayoutResponse)
+async def layout_endpoint(request: LayoutRequest):
+    """
+    force-directed 전체 다시 배치. 세션 그래프는 이벤트 루프에서 스냅샷을 뜨고 반영하며,
+    스레드풀에서는 순수 계산(layout_graph)만 돈다. 계산 중에 세션이 바뀌었으면 409.
+    """
+    session = resolve_session(request.session_id, request.client_version)
+    if session is not None:
+        nodes, edges = [node.raw for node in session.nodes.values()], list(session.edges.values())
+        version = session.version
+    else:
+        nodes, edges = request.nodes, request.edges
+
+    started = time.perf_counter()
+    with metrics.stage("layout"):
+        positions = await run_in_threadpool(
+            layout_graph, nodes, edges, warm_start=request.warm_start, iterations=request.iterations,
+        )
+    result = {"positions": positions, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    if session is not None:
+        if session.version != version:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Session changed during layout.", "version": session.version},
+            )
+        session.replace(
+            [{**node, "position": positions[node["id"]]} if node.get("id") in positions else node for node in nodes],
+            edges,
+        )
+    return raw_json(await commit_session(result, session))
+
+
+async def run_analyze(request: AnalysisRequest) -> dict:
+    session = resolve_session(request.session_id, request.client_version)
+    result = await agent.process_idea(
+        request.text, request.history, graph=session,
+        use_cache=not request.bypass_cache, history_mode=request.history_mode,
+        latency_budget_ms=request.latency_budget_ms, pipeline=request.pipeline,
+    )
+    return await commit_session(result, session)
+
+
 @app.post("/analyze", response_model=AnalysisResponse)
-def analyze_endpoint(request: AnalysisRequest):
-    try:
-        if not api_key:
-            raise HTTPException(status_code=500, detail="OpenAI API Key is missing on server.")
-        result = agent.process_idea(request.text, request.history)
-        return result
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+async def analyze_endpoint(request: AnalysisRequest):
+    with http_errors():
+        require_llm()
+        return prevalidated(AnalysisResponse, await run_analyze(request))
+
+
+def check_batch(request: BatchAnalysisRequest) -> None:
+    if not request.texts:
+        raise HTTPException(status_code=400, detail="texts must not be empty.")
+    if len(request.texts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} texts per batch.")
+
+
+async def run_analyze_batch(request: BatchAnalysisRequest) -> dict:
+    check_batch(request)
+    session = resolve_session(request.session_id, request.client_version)
+    result = await agent.process_batch(
+        request.texts, history=request.history, graph=session,
+        use_cache=not request.bypass_cache, history_mode=request.history_mode,
+        latency_budget_ms=request.latency_budget_ms,
+    )
+    return await commit_session(result, session)
+
+
+@app.post("/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_batch_endpoint(request: BatchAnalysisRequest):
+    """여러 인풋을 동시에 분석해 하나의 그래프로 합친다. 항목별 실패는 items에 보고."""
+    with http_errors():
+        require_llm()
+        return prevalidated(BatchAnalysisResponse, await run_analyze_batch(request))
 
 
 @app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest):
-    try:
-        if not api_key:
-            raise HTTPException(status_code=500, detail="OpenAI API Key is missing on server.")
-        reply = agent.chat_with_suggestion(
+async def chat_endpoint(request: ChatRequest):
+    with http_errors():
+        require_llm()
+        result = await agent.chat_with_suggestion(
             suggestion_title=request.suggestion_title,
             suggestion_content=request.suggestion_content,
             suggestion_category=request.suggestion_category,
             suggestion_phase=request.suggestion_phase,
             messages=request.messages,
             user_message=request.user_message,
+            use_cache=not request.bypass_cache,
+            conversation_id=request.conversation_id,
+            latency_budget_ms=request.latency_budget_ms,
+            suggestion_id=request.suggestion_id,
+            session_id=request.session_id,
         )
-        return ChatResponse(reply=reply)
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        return ChatResponse(**result)
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {dumps_str(data)}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    """{"type": ..., ...} 이벤트 제너레이터를 SSE 응답으로 감싼다. 도중 실패는 error 이벤트로."""
+    async def event_stream():
+        try:
+            async for event in events:
+                yield sse_event(event.pop("type"), event)
+        except UpstreamError as e:
+            yield sse_event("error", {"detail": str(e), "status": e.status_code})
+        except Exception as e:
+            logger.exception("Unhandled error in event stream")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# 스트리밍 이벤트 생성기: SSE 엔드포인트와 웹소켓 채널이 같이 쓴다
+def analyze_events(request: AnalysisRequest):
+    session = resolve_session(request.session_id, request.client_version)
+    return with_session(
+        agent.stream_process_idea(
+            request.text, request.history, graph=session,
+            use_cache=not request.bypass_cache, history_mode=request.history_mode,
+            latency_budget_ms=request.latency_budget_ms, pipeline=request.pipeline,
+        ),
+        session,
+    )
+
+
+def analyze_batch_events(request: BatchAnalysisRequest):
+    check_batch(request)
+    session = resolve_session(request.session_id, request.client_version)
+    return with_session(
+        agent.stream_process_batch(
+            request.texts, history=request.history, graph=session,
+            use_cache=not request.bypass_cache, history_mode=request.history_mode,
+            latency_budget_ms=request.latency_budget_ms,
+        ),
+        session,
+    )
+
+
+def chat_events(request: ChatRequest):
+    return agent.stream_chat_with_suggestion(
+        suggestion_title=request.suggestion_title,
+        suggestion_content=request.suggestion_content,
+        suggestion_category=request.suggestion_category,
+        suggestion_phase=request.suggestion_phase,
+        messages=request.messages,
+        user_message=request.user_message,
+        use_cache=not request.bypass_cache,
+        conversation_id=request.conversation_id,
+        latency_budget_ms=request.latency_budget_ms,
+        suggestion_id=request.suggestion_id,
+        session_id=request.session_id,
+    )
+
+
+def chat_to_nodes_events(request: ChatToNodesRequest):
+    session = resolve_session(request.session_id, request.client_version)
+    return with_session(agent.stream_chat_to_nodes(
+        suggestion_title=request.suggestion_title,
+        suggestion_content=request.suggestion_content,
+        suggestion_category=request.suggestion_category,
+        suggestion_phase=request.suggestion_phase,
+        messages=request.messages,
+        existing_nodes=request.existing_nodes,
+        graph=session,
+        use_cache=not request.bypass_cache,
+        history_mode=request.history_mode,
+        conversation_id=request.conversation_id,
+        latency_budget_ms=request.latency_budget_ms,
+    ), session)
+
+
+@app.post("/analyze/stream")
+async def analyze_stream_endpoint(request: AnalysisRequest):
+    """/analyze의 SSE 버전: node 이벤트를 생성되는 대로, 이어서 edge 이벤트와 done 이벤트를 보낸다."""
+    require_llm()
+    return sse_response(analyze_events(request))
+
+
+@app.post("/analyze/batch/stream")
+async def analyze_batch_stream_endpoint(request: BatchAnalysisRequest):
+    """/analyze/batch의 SSE 버전: 항목이 끝나는 순서대로 item 이벤트, 마지막에 done 이벤트."""
+    require_llm()
+    return sse_response(analyze_batch_events(request))
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """/chat의 SSE 버전: delta 이벤트를 토큰 단위로, 마지막에 done 이벤트를 보낸다."""
+    require_llm()
+    return sse_response(chat_events(request))
+
+
+async def run_chat_to_nodes(request: ChatToNodesRequest) -> dict:
+    session = resolve_session(request.session_id, request.client_version)
+    result = await agent.chat_to_nodes(
+        suggestion_title=request.suggestion_title,
+        suggestion_content=request.suggestion_content,
+        suggestion_category=request.suggestion_category,
+        suggestion_phase=request.suggestion_phase,
+        messages=request.messages,
+        existing_nodes=request.existing_nodes,
+        graph=session,
+        use_cache=not request.bypass_cache,
+        history_mode=request.history_mode,
+        conversation_id=request.conversation_id,
+        latency_budget_ms=request.latency_budget_ms,
+    )
+    return await commit_session(result, session)
 
 
 @app.post("/chat-to-nodes", response_model=AnalysisResponse)
-def chat_to_nodes_endpoint(request: ChatToNodesRequest):
+async def chat_to_nodes_endpoint(request: ChatToNodesRequest):
+    with http_errors():
+        require_llm()
+        return prevalidated(AnalysisResponse, await run_chat_to_nodes(request))
+
+
+@app.post("/chat-to-nodes/stream")
+async def chat_to_nodes_stream_endpoint(request: ChatToNodesRequest):
+    """/chat-to-nodes의 SSE 버전 (이벤트 형식은 /analyze/stream과 동일)"""
+    require_llm()
+    return sse_response(chat_to_nodes_events(request))
+
+
+# ─────────────────────────────────────────────
+# 백그라운드 잡: 제출 즉시 job_id를 받고 폴링/구독으로 결과를 가져간다
+# ─────────────────────────────────────────────
+jobs = JobManager({
+    "analyze": lambda payload: run_analyze(AnalysisRequest.model_validate(payload)),
+    "analyze-batch": lambda payload: run_analyze_batch(BatchAnalysisRequest.model_validate(payload)),
+    "chat-to-nodes": lambda payload: run_chat_to_nodes(ChatToNodesRequest.model_validate(payload)),
+})
+JOB_WAIT_MAX = float(os.getenv("JOB_WAIT_MAX", "30"))
+
+
+def submit_job(kind: str, request, priority: str) -> JobResponse:
+    require_llm()
+    # 세션 버전 불일치는 큐에 넣기 전에 바로 알린다 (실행 시점에 다시 확인)
+    resolve_session(request.session_id, request.client_version)
     try:
-        if not api_key:
-            raise HTTPException(status_code=500, detail="OpenAI API Key is missing on server.")
-        result = agent.chat_to_nodes(
-            suggestion_title=request.suggestion_title,
-            suggestion_content=request.suggestion_content,
-            suggestion_category=request.suggestion_category,
-            suggestion_phase=request.suggestion_phase,
-            messages=request.messages,
-            existing_nodes=request.existing_nodes,
-        )
-        return result
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        job = jobs.submit(kind, request.model_dump(), priority, client=current_client())
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return JobResponse(**job.public())
+
+
+def get_job_or_404(job):
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return JobResponse(**job.public())
+
+
+@app.post("/jobs/analyze", response_model=JobResponse, status_code=202)
+async def submit_analyze_job(request: AnalysisRequest, priority: JobPriority = "interactive"):
+    return submit_job("analyze", request, priority)
+
+
+@app.post("/jobs/analyze/batch", response_model=JobResponse, status_code=202)
+async def submit_analyze_batch_job(request: BatchAnalysisRequest, priority: JobPriority = "bulk"):
+    check_batch(request)
+    return submit_job("analyze-batch", request, priority)
+
+
+@app.post("/jobs/chat-to-nodes", response_model=JobResponse, status_code=202)
+async def submit_chat_to_nodes_job(request: ChatToNodesRequest, priority: JobPriority = "interactive"):
+    return submit_job("chat-to-nodes", request, priority)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job_endpoint(job_id: str, wait: float = Query(0, ge=0, description="끝날 때까지 최대 몇 초 기다릴지 (롱 폴링)")):
+    return get_job_or_404(await jobs.wait(job_id, min(wait, JOB_WAIT_MAX)))
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str):
+    """잡 상태가 바뀔 때마다 status 이벤트, 끝나면 결과를 담은 done 이벤트를 보낸다."""
+    get_job_or_404(jobs.get(job_id))
+
+    async def events():
+        async for job in jobs.watch(job_id):
+            yield {"type": "done" if job.done else "status", **job.public()}
+
+    return sse_response(events())
+
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job_endpoint(job_id: str):
+    """대기 중인 잡은 바로, 실행 중인 잡은 LLM 호출을 끊고 취소한다 (같은 호출을 기다리는 다른 요청이 있으면 호출은 계속된다)."""
+    job = jobs.cancel(job_id)
+    if job is not None and not job.done:
+        # 실행 중이던 태스크가 취소를 반영할 때까지 잠깐 기다린다
+        job = await jobs.wait(job_id, 1.0)
+    return get_job_or_404(job)
+
+
+# ─────────────────────────────────────────────
+# 웹소켓 채널: 캔버스 세션 하나에 연결 하나로 analyze/chat/chat-to-nodes를 다중화
+# ─────────────────────────────────────────────
+hub = SessionHub()
+
+# op → (요청 모델, 이벤트 생성기, 세션 그래프를 바꾸는지)
+CHANNEL_OPS = {
+    "analyze": (AnalysisRequest, analyze_events, True),
+    "analyze-batch": (BatchAnalysisRequest, analyze_batch_events, True),
+    "chat": (ChatRequest, chat_events, False),
+    "chat-to-nodes": (ChatToNodesRequest, chat_to_nodes_events, True),
+}
+
+
+def channel_error(e: Exception) -> dict:
+    """REST였다면 받았을 상태 코드와 detail"""
+    if isinstance(e, HTTPException):
+        return {"status": e.status_code, "detail": e.detail}
+    if isinstance(e, ValidationError):
+        return {"status": 422, "detail": e.errors(include_url=False, include_context=False)}
+    if isinstance(e, UpstreamError):
+        return {"status": e.status_code, "detail": str(e), "retry_after": e.retry_after}
+    logger.exception("Unhandled error in channel op", exc_info=e)
+    return {"status": 500, "detail": str(e)}
+
+
+def channel_op_events(session_id: str, op: str, payload: dict, changes: dict):
+    """op 요청을 검증해 이벤트 생성기를 만든다. 그래프에 추가된 노드/엣지는 changes에 모은다."""
+    request_model, make_events, _ = CHANNEL_OPS[op]
+
+    async def events():
+        require_llm()
+        body = dict(payload)
+        if "session_id" in request_model.model_fields:
+            body["session_id"] = session_id
+        async for event in make_events(request_model.model_validate(body)):
+            if event["type"] == "node":
+                changes["nodes"].append(event["node"])
+            elif event["type"] == "edge":
+                changes["edges"].append(event["edge"])
+            elif event["type"] == "item":
+                changes["nodes"].extend(event["nodes"])
+                changes["edges"].extend(event["edges"])
+            yield event
+
+    return events
+
+
+@app.websocket("/ws/sessions/{session_id}")
+async def session_channel(websocket: WebSocket, session_id: str):
+    """
+    클라이언트 → 서버: {"id": 상관 ID, "op": "analyze" | "analyze-batch" | "chat" | "chat-to-nodes", "payload": 요청 본문}
+                      {"id": 취소할 요청 ID, "op": "cancel"} / {"id": ..., "op": "ping"}
+    서버 → 클라이언트: 각 요청의 SSE 이벤트와 같은 이벤트에 "id"를 붙여 보낸다 (node/edge/delta/item/done/error/cancelled).
+    같은 세션의 다른 연결이 그래프를 바꾸면 {"type": "graph", ...} 푸시를 받는다.
+    """
+    await websocket.accept()
+    session = session_store.get(session_id)
+    if session is None:
+        await websocket.send_json({"type": "error", "status": 404, "detail": "Session not found."})
+        await websocket.close(code=CLOSE_SESSION_NOT_FOUND)
+        return
+
+    channel = Channel(websocket)
+    channel.start()
+    hub.join(session_id, channel)
+    await channel.send({"type": "hello", "session_id": session_id, "version": session.version})
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                await channel.send({"id": None, "type": "error", "status": 400, "detail": "Invalid JSON message."})
+                continue
+            op_id, op = message.get("id"), message.get("op")
+            metrics.inc("thinking_ws_messages_total", direction="in", type=str(op))
+            if op == "ping":
+                await channel.send({"id": op_id, "type": "pong"})
+            elif op == "cancel":
+                if not channel.cancel_op(op_id):
+                    await channel.send({"id": op_id, "type": "error", "status": 404, "detail": "No such request in flight."})
+            elif op in CHANNEL_OPS:
+                changes = {"nodes": [], "edges": []}
+
+                async def on_done(event, op=op, op_id=op_id, changes=changes):
+                    if CHANNEL_OPS[op][2] and (changes["nodes"] or changes["edges"]):
+                        await hub.broadcast(session_id, {
+                            "type": "graph", "origin": op_id, "session_id": session_id,
+                            "version": event.get("version"), **changes,
+                        }, exclude=channel)
+
+                try:
+                    channel.start_op(
+                        str(op_id), channel_op_events(session_id, op, message.get("payload") or {}, changes),
+                        channel_error, on_done,
+                    )
+                except (ChannelBusy, ValueError) as e:
+                    await channel.send({"id": op_id, "type": "error", "status": getattr(e, "status_code", 400), "detail": str(e)})
+            else:
+                await channel.send({"id": op_id, "type": "error", "status": 400, "detail": f"Unknown op: {op}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.leave(session_id, channel)
+        await channel.close()
 
 
 if __name__ == "__main__":
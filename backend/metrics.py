@@ -0,0 +1,242 @@
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# --- Metrics Configuration ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# 요청별 단계 시간을 Server-Timing 응답 헤더로 보낸다 (스트리밍 응답은 total만)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (0, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 현재 요청의 엔드포인트(라우트 템플릿)와 단계별 누적 시간(초)
+_endpoint: ContextVar[str] = ContextVar("metrics_endpoint", default="")
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("server_timings", default=None)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 마지막 칸은 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NoopStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _StageTimer:
+    __slots__ = ("registry", "name", "timings", "started")
+
+    def __init__(self, registry: "MetricsRegistry", name: str, timings: Optional[Dict[str, float]]):
+        self.registry = registry
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        if self.timings is not None:
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        if self.registry.enabled:
+            endpoint = _endpoint.get()
+            self.registry.observe("thinking_stage_seconds", elapsed, endpoint=endpoint, stage=self.name)
+            if exc_type is not None:
+                self.registry.inc("thinking_errors_total", endpoint=endpoint, stage=self.name, error=exc_type.__name__)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Prometheus 텍스트 형식으로 내보내는 최소한의 카운터/히스토그램 모음.
+    이벤트 루프 한 곳에서만 갱신하므로 락을 쓰지 않는다.
+    비활성화하면 stage()는 공유 no-op 객체를 돌려주고 inc/observe는 즉시 반환한다.
+    """
+
+    HELP = {
+        "thinking_requests_total": ("counter", "HTTP 요청 수"),
+        "thinking_request_seconds": ("histogram", "HTTP 요청 처리 시간 (스트리밍은 마지막 바이트까지)"),
+        "thinking_stage_seconds": ("histogram", "ThinkingAgent 단계별 소요 시간"),
+        "thinking_errors_total": ("counter", "단계별 예외 수"),
+        "thinking_llm_tokens_total": ("counter", "LLM 토큰 사용량"),
+        "thinking_history_nodes": ("histogram", "요청에 쓰인 기존 노드 수"),
+        "thinking_chat_messages": ("histogram", "요청에 쓰인 대화 메시지 수"),
+        "thinking_upstream_retries_total": ("counter", "업스트림 재시도 수"),
+        "thinking_upstream_failures_total": ("counter", "재시도 후에도 실패한 업스트림 호출 수"),
+        "thinking_upstream_hedges_total": ("counter", "p95를 넘겨 헤지 요청을 보낸 수"),
+        "thinking_upstream_hedge_wins_total": ("counter", "헤지 요청이 먼저 응답한 수"),
+        "thinking_breaker_opened_total": ("counter", "서킷 브레이커가 열린 횟수"),
+        "thinking_jobs_total": ("counter", "백그라운드 잡 상태 전이 수"),
+        "thinking_job_wait_seconds": ("histogram", "잡이 큐에서 기다린 시간"),
+        "thinking_job_run_seconds": ("histogram", "잡 실행 시간"),
+        "thinking_admission_total": ("counter", "LLM 호출 입장 제어 결과 (outcome: admitted/queued/rejected)"),
+        "thinking_admission_wait_seconds": ("histogram", "LLM 호출이 입장 대기열에서 기다린 시간"),
+        "thinking_chat_prefetch_total": ("counter", "채팅 첫 턴 추측 생성 (outcome: scheduled/skipped_busy/skipped_budget/failed/hit/pending/miss/stale/unused)"),
+        "thinking_chat_prefetch_tokens_total": ("counter", "추측 생성에 예약한 토큰 (추정치)"),
+        "thinking_ws_messages_total": ("counter", "웹소켓 메시지 수 (direction: in/out)"),
+        "thinking_ws_slow_closes_total": ("counter", "푸시를 따라오지 못해 닫은 웹소켓 연결 수"),
+        "thinking_model_routes_total": ("counter", "모델 라우터 결정 수 (reason: primary/budget/degraded/input_size/fallback)"),
+    }
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        if not self.enabled:
+            return
+        series = self._counters.setdefault(name, {})
+        key = tuple(labels.items())
+        series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> None:
+        if not self.enabled:
+            return
+        series = self._histograms.setdefault(name, {})
+        key = tuple(labels.items())
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def stage(self, name: str):
+        """with metrics.stage("llm"): ... — 단계 시간 히스토그램 + Server-Timing 누적"""
+        timings = _timings.get()
+        if not self.enabled and timings is None:
+            return _NOOP_STAGE
+        return _StageTimer(self, name, timings)
+
+    def record_usage(self, model: str, usage: Optional[Dict[str, Any]]) -> None:
+        if not self.enabled or not usage:
+            return
+        endpoint = _endpoint.get()
+        for kind in ("prompt", "completion"):
+            tokens = usage.get(f"{kind}_tokens")
+            if tokens:
+                self.inc("thinking_llm_tokens_total", tokens, endpoint=endpoint, model=model, kind=kind)
+
+    def observe_size(self, name: str, size: int) -> None:
+        if self.enabled:
+            self.observe(name, size, SIZE_BUCKETS, endpoint=_endpoint.get())
+
+    # ── 출력 ──
+    @staticmethod
+    def _labels(labels: Iterable[Tuple[str, str]]) -> str:
+        parts = []
+        for key, value in labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            parts.append(f'{key}="{value}"')
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def _header(self, lines: List[str], name: str, default_type: str) -> None:
+        metric_type, help_text = self.HELP.get(name, (default_type, name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        lines: List[str] = []
+        for name, series in sorted(self._counters.items()):
+            self._header(lines, name, "counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for name, series in sorted(self._histograms.items()):
+            self._header(lines, name, "histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{name}_bucket{self._labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum:g}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def current_endpoint() -> str:
+    """지금 처리 중인 요청의 엔드포인트 라벨 (요청 밖이면 빈 문자열)"""
+    return _endpoint.get()
+
+
+def detach_context(endpoint: str) -> None:
+    """
+    요청 안에서 띄운 백그라운드 태스크의 첫 줄에서 호출한다.
+    태스크는 요청의 컨텍스트 사본을 가지므로, 이후 집계는 지정한 endpoint 라벨로 하고 Server-Timing에는 넣지 않는다.
+    """
+    _endpoint.set(endpoint)
+    _timings.set(None)
+
+
+def format_server_timing(timings: Dict[str, float], total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """
+    요청마다 엔드포인트 라벨과 단계 시간 누적용 dict를 contextvar에 심고,
+    끝나면 요청 수/시간을 기록한다. Server-Timing은 응답 헤더가 나가는 시점까지의 단계만 담는다.
+    """
+
+    def __init__(self, app, route_name: Callable[[dict], str], registry: MetricsRegistry = metrics, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.route_name = route_name
+        self.registry = registry
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self.route_name(scope)
+        timings: Optional[Dict[str, float]] = {} if self.server_timing else None
+        endpoint_token = _endpoint.set(endpoint)
+        timings_token = _timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings is not None:
+                    header = format_server_timing(timings, time.perf_counter() - started)
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.registry.inc("thinking_requests_total", endpoint=endpoint, method=scope["method"], status=str(status))
+            self.registry.observe("thinking_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+            _endpoint.reset(endpoint_token)
+            _timings.reset(timings_token)
@@ -1,11 +1,25 @@
-from pydantic import BaseModel
-from typing import List, Optional, Literal, Dict, Any
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, List, Optional, Literal, Dict, Any
 
 
 # Enums based on 5W1H and Phase
 Category = Literal["Who", "What", "When", "Where", "Why", "How"]
 Phase = Literal["Problem", "Solution"]
 
+
+def require_node_ids(nodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """그래프는 노드를 id로 찾으므로 id가 없는 노드는 받지 않는다 (422)"""
+    for index, node in enumerate(nodes):
+        node_id = node.get("id")
+        if not isinstance(node_id, str) or not node_id:
+            raise ValueError(f"node {index} needs a non-empty string id")
+    return nodes
+
+
+# 클라이언트 캔버스 노드 (React Flow 형식 그대로, id만 검증한다)
+HistoryNodes = Annotated[List[Dict[str, Any]], AfterValidator(require_node_ids)]
+
+
 class UserNode(BaseModel):
     """AI가 인풋 문장에서 추출하는 6하원칙 노드 하나"""
     label: str          # 동사형 짧은 제목
@@ -40,11 +54,43 @@ class Edge(BaseModel):
 
 class AnalysisRequest(BaseModel):
     text: str
-    history: List[Dict[str, Any]] = []
+    history: HistoryNodes = []
+    session_id: Optional[str] = None      # 서버 세션을 쓰면 history 대신 세션 그래프 사용
+    client_version: Optional[int] = None  # 클라이언트가 알고 있는 세션 버전 (불일치 시 409)
+    bypass_cache: bool = False            # True면 LLM 캐시를 건너뛰고 새로 생성
+    history_mode: Optional[Literal["full", "pruned"]] = None  # 히스토리 문맥 모드 (없으면 서버 기본값)
+    latency_budget_ms: Optional[float] = None  # 클라이언트 지연 예산 (넘길 것 같으면 더 빠른 모델로)
+    pipeline: Optional[bool] = None       # 추출 → (제안 ‖ 연결) 단계 호출 (없으면 서버 기본값)
 
 class AnalysisResponse(BaseModel):
     nodes: List[Node]
     edges: List[Edge]
+    session_id: Optional[str] = None
+    version: Optional[int] = None
+    model: Optional[str] = None           # 실제로 응답한 모델 (배치는 items 쪽에)
+    converted_messages: Optional[int] = None  # chat-to-nodes: 지금까지 노드로 변환된 대화 메시지 수
+    stages: Optional[Dict[str, Any]] = None   # 파이프라인 분석: 단계별 {"model", "ms"}와 total_ms
+
+
+class BatchAnalysisRequest(BaseModel):
+    texts: List[str]
+    history: HistoryNodes = []
+    session_id: Optional[str] = None
+    client_version: Optional[int] = None
+    bypass_cache: bool = False
+    history_mode: Optional[Literal["full", "pruned"]] = None
+    latency_budget_ms: Optional[float] = None
+
+class BatchItemResult(BaseModel):
+    index: int                       # texts 안에서의 위치
+    status: Literal["ok", "error"]
+    error: Optional[str] = None
+    model: Optional[str] = None
+    node_ids: List[str] = []
+    duplicate_of: Optional[int] = None  # 같은 인풋이 앞에 있으면 그 항목의 index (node_ids도 그 항목 것)
+
+class BatchAnalysisResponse(AnalysisResponse):
+    items: List[BatchItemResult]
 
 
 class ChatMessage(BaseModel):
@@ -59,10 +105,17 @@ class ChatRequest(BaseModel):
     suggestion_phase: str
     messages: List[ChatMessage] = []   # 이전 대화 히스토리
     user_message: str                  # 현재 사용자 메시지
+    bypass_cache: bool = False
+    conversation_id: Optional[str] = None  # 대화 요약 키 (없으면 요약 없이 최근 대화만 예산 안에서 보낸다)
+    latency_budget_ms: Optional[float] = None
+    suggestion_id: Optional[str] = None    # 제안 노드 ID (첫 턴을 미리 생성해 둔 결과를 찾는 키)
+    session_id: Optional[str] = None       # 대화 요약을 세션 안으로 한정하는 키 (그래프는 쓰지 않는다)
 
 
 class ChatResponse(BaseModel):
     reply: str
+    model: Optional[str] = None
+    prefetched: bool = False
 
 
 class ChatToNodesRequest(BaseModel):
@@ -71,4 +124,57 @@ class ChatToNodesRequest(BaseModel):
     suggestion_category: str
     suggestion_phase: str
     messages: List[ChatMessage]
-    existing_nodes: List[Dict[str, Any]] = []  # history (기존 노드들)
+    existing_nodes: HistoryNodes = []  # history (기존 노드들)
+    session_id: Optional[str] = None
+    client_version: Optional[int] = None
+    bypass_cache: bool = False
+    history_mode: Optional[Literal["full", "pruned"]] = None
+    conversation_id: Optional[str] = None  # 변환 체크포인트 키 (없으면 매번 대화 전체를 변환한다)
+    latency_budget_ms: Optional[float] = None
+
+
+class SessionSyncRequest(BaseModel):
+    """세션 생성 또는 클라이언트 캔버스 전체로 세션 재동기화"""
+    nodes: HistoryNodes = []
+    edges: List[Dict[str, Any]] = []
+
+
+class SessionResponse(BaseModel):
+    session_id: str
+    version: int
+    nodes: List[Dict[str, Any]]
+    edges: List[Dict[str, Any]]
+
+
+class LayoutRequest(BaseModel):
+    """캔버스 전체 다시 배치. session_id가 있으면 세션 그래프를 배치하고 새 위치를 세션에 저장한다."""
+    nodes: HistoryNodes = []
+    edges: List[Dict[str, Any]] = []
+    session_id: Optional[str] = None
+    client_version: Optional[int] = None
+    warm_start: bool = True            # 기존 위치에서 시작해 모양을 유지
+    iterations: Optional[int] = Field(default=None, ge=0, le=500)
+
+
+class LayoutResponse(BaseModel):
+    positions: Dict[str, Dict[str, float]]   # node id → {"x", "y"}
+    elapsed_ms: float
+    session_id: Optional[str] = None
+    version: Optional[int] = None
+
+
+JobPriority = Literal["interactive", "bulk"]
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str                          # analyze | analyze-batch | chat-to-nodes
+    priority: JobPriority
+    status: JobStatus
+    result: Optional[Dict[str, Any]] = None   # 동기 엔드포인트 응답과 같은 형식
+    error: Optional[Any] = None
+    status_code: Optional[int] = None         # 동기 엔드포인트였다면 받았을 HTTP 상태
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+from .admission import bind as bind_admission
+from .metrics import metrics, detach_context
+
+# --- Speculative Chat Prefetch Configuration ---
+# 1이면 /analyze가 만든 제안 노드마다 채팅 첫 턴(제안 설명)을 미리 생성해 둔다
+CHAT_PREFETCH = os.getenv("CHAT_PREFETCH", "0") == "1"
+# 제안 카드를 열 때 프론트엔드가 보내는 첫 메시지 (ChatDialog.jsx와 같아야 한다)
+CHAT_OPENING_MESSAGE = os.getenv("CHAT_OPENING_MESSAGE", "이 제안에 대해 먼저 설명해줘.")
+CHAT_PREFETCH_TTL = float(os.getenv("CHAT_PREFETCH_TTL", "900"))
+CHAT_PREFETCH_MAX_ENTRIES = int(os.getenv("CHAT_PREFETCH_MAX_ENTRIES", "1024"))
+# 동시에 진행하는 추측 호출 수. 넘치면 예약하지 않는다 (실제 요청과 업스트림을 다투지 않도록).
+CHAT_PREFETCH_MAX_INFLIGHT = int(os.getenv("CHAT_PREFETCH_MAX_INFLIGHT", "4"))
+# 추측 호출에 쓸 수 있는 토큰 예산 (추정치, CHAT_PREFETCH_WINDOW초마다 초기화)
+CHAT_PREFETCH_TOKEN_BUDGET = int(os.getenv("CHAT_PREFETCH_TOKEN_BUDGET", "200000"))
+CHAT_PREFETCH_WINDOW = float(os.getenv("CHAT_PREFETCH_WINDOW", "3600"))
+# 첫 턴 답변 길이 추정 (프롬프트가 200자 내외로 제한한다)
+CHAT_PREFETCH_REPLY_TOKENS = int(os.getenv("CHAT_PREFETCH_REPLY_TOKENS", "300"))
+
+
+def opening_fingerprint(title: str, content: str, category: str, phase: str, user_message: str) -> str:
+    """미리 만든 답변이 지금 요청과 같은 프롬프트로 만들어졌는지 확인하는 지문"""
+    digest = hashlib.sha256()
+    for part in (title, content, category, phase, user_message):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class PrefetchEntry:
+    __slots__ = ("fingerprint", "task", "created", "used")
+
+    def __init__(self, fingerprint: str, task: asyncio.Task):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.created = time.monotonic()
+        self.used = False
+
+
+class ChatPrefetcher:
+    """
+    제안 노드 ID별로 채팅 첫 턴을 백그라운드에서 미리 생성해 둔다.
+    사용자가 카드를 열기 전에 끝나 있으면 바로, 진행 중이면 그 호출을 이어받아 답한다.
+    추측 호출은 토큰 예산과 동시 실행 수로 제한하고, 적중률을 집계한다.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[..., Awaitable[Dict[str, Any]]],
+        ttl: float = CHAT_PREFETCH_TTL,
+        max_entries: int = CHAT_PREFETCH_MAX_ENTRIES,
+        max_inflight: int = CHAT_PREFETCH_MAX_INFLIGHT,
+        token_budget: int = CHAT_PREFETCH_TOKEN_BUDGET,
+        window: float = CHAT_PREFETCH_WINDOW,
+    ):
+        self.generate = generate
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_inflight = max_inflight
+        self.token_budget = token_budget
+        self.window = window
+        self._entries: "OrderedDict[str, PrefetchEntry]" = OrderedDict()
+        self._inflight = 0
+        self._window_started = time.monotonic()
+        self._spent = 0
+        self._counts = {"scheduled": 0, "hit": 0, "pending": 0, "miss": 0, "stale": 0, "unused": 0}
+        self._used = 0  # 한 번 이상 쓰인 항목 수
+
+    def _count(self, outcome: str) -> None:
+        self._counts[outcome] = self._counts.get(outcome, 0) + 1
+        metrics.inc("thinking_chat_prefetch_total", outcome=outcome)
+
+    def _reserve(self, cost: int) -> bool:
+        now = time.monotonic()
+        if now - self._window_started >= self.window:
+            self._window_started, self._spent = now, 0
+        if self._spent + cost > self.token_budget:
+            return False
+        self._spent += cost
+        metrics.inc("thinking_chat_prefetch_tokens_total", cost)
+        return True
+
+    def _drop(self, suggestion_id: str) -> None:
+        entry = self._entries.pop(suggestion_id)
+        if not entry.used:
+            self._count("unused")
+        if not entry.task.done():
+            entry.task.cancel()
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        while self._entries:
+            suggestion_id, entry = next(iter(self._entries.items()))
+            if entry.created > cutoff and len(self._entries) <= self.max_entries:
+                break
+            self._drop(suggestion_id)
+
+    def schedule(self, suggestion_id: str, fingerprint: str, cost: int, **kwargs: Any) -> bool:
+        """kwargs는 generate에 그대로 넘긴다. 예산/동시 실행 수를 넘으면 예약하지 않고 False."""
+        self._expire()
+        if suggestion_id in self._entries:
+            return False
+        if self._inflight >= self.max_inflight:
+            self._count("skipped_busy")
+            return False
+        if not self._reserve(cost):
+            self._count("skipped_budget")
+            return False
+
+        self._inflight += 1
+        task = asyncio.get_running_loop().create_task(self._run(kwargs))
+        task.add_done_callback(self._finished)
+        self._entries[suggestion_id] = PrefetchEntry(fingerprint, task)
+        self._count("scheduled")
+        self._expire()
+        return True
+
+    async def _run(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # /analyze 요청의 컨텍스트를 이어받지만 그 요청의 Server-Timing/토큰 집계에는 섞이지 않게 한다
+        detach_context("prefetch")
+        # 추측 생성은 대기열에 서지 않고 업스트림 한도에 여유가 있을 때만 나간다
+        bind_admission(priority="speculative")
+        return await self.generate(**kwargs)
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._inflight -= 1
+        if not task.cancelled() and task.exception() is not None:
+            self._count("failed")
+
+    async def take(self, suggestion_id: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """미리 만든 첫 턴. 없거나, 다른 프롬프트로 만들어졌거나, 실패했으면 None (호출자가 직접 생성)."""
+        self._expire()
+        entry = self._entries.get(suggestion_id)
+        if entry is None:
+            self._count("miss")
+            return None
+        if entry.fingerprint != fingerprint:
+            self._count("stale")
+            self._drop(suggestion_id)
+            return None
+        if entry.task.done() and (entry.task.cancelled() or entry.task.exception() is not None):
+            self._count("miss")
+            self._entries.pop(suggestion_id)
+            return None
+
+        self._count("hit" if entry.task.done() else "pending")
+        if not entry.used:
+            entry.used = True
+            self._used += 1
+        try:
+            # 요청이 끊겨도 추측 호출은 끝까지 진행해 다음 요청이 쓸 수 있게 한다
+            return await asyncio.shield(entry.task)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._entries.pop(suggestion_id, None)
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        served = self._counts["hit"] + self._counts["pending"]
+        scheduled = self._counts["scheduled"]
+        lookups = served + self._counts["miss"] + self._counts["stale"]
+        return {
+            "entries": len(self._entries),
+            "inflight": self._inflight,
+            "spent_tokens": self._spent,
+            "token_budget": self.token_budget,
+            "counts": dict(self._counts),
+            "hit_rate": round(served / lookups, 3) if lookups else None,
+            # 예약한 추측 호출 중 실제로 쓰인 비율 (낮으면 비용만 쓰고 있다)
+            "use_rate": round(self._used / scheduled, 3) if scheduled else None,
+        }
@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import typing
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, AsyncIterator, Callable, NamedTuple, Optional, Type
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, LengthFinishReasonError
+from pydantic import BaseModel
+from .metrics import metrics
+from .schemas import response_schemas
+
+# --- LLM Provider Configuration ---
+# openai | fake (오프라인 결정적 응답 — 테스트/벤치마크용)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+# keep-alive 커넥션 풀 크기 (동시 요청 상한보다 약간 크게)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "128"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "64"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+# 기동 시 미리 열어 둘 keep-alive 커넥션 수 (0이면 끔)
+LLM_WARMUP_CONNECTIONS = int(os.getenv("LLM_WARMUP_CONNECTIONS", "4"))
+# fake 응답 지연 분포: "0" | "fixed:MS" | "uniform:LO_MS:HI_MS" | "normal:MEAN_MS:SD_MS" | "lognormal:MEDIAN_MS:SIGMA"
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "0")
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+# 스트리밍에서 첫 조각이 나오기까지 걸리는 시간의 비율 (나머지는 조각마다 균등 분배)
+FAKE_LLM_TTFT_RATIO = float(os.getenv("FAKE_LLM_TTFT_RATIO", "0.3"))
+# 출력 토큰당 생성 시간 (ms). 0이 아니면 긴 응답일수록 늦게 끝난다 (출력 크기가 지연을 좌우하는 경우 확인용)
+FAKE_LLM_OUTPUT_MS = float(os.getenv("FAKE_LLM_OUTPUT_MS", "0"))
+# 이 확률로 503을 흉내 낸 오류를 낸다 (재시도/브레이커 확인용)
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+
+_HISTORY_ID = re.compile(r"ID: ([^\s|]+)")
+
+
+class CompletionDelta(NamedTuple):
+    """텍스트 스트리밍의 한 조각. 마지막 조각에만 usage가 실린다."""
+    content: Optional[str]
+    usage: Optional[Dict[str, Any]] = None
+
+
+class FakeUpstreamError(Exception):
+    status_code = 503
+
+
+class LLMProvider(ABC):
+    """
+    ThinkingAgent가 호출하는 LLM 백엔드 인터페이스.
+    동시성 제한, 캐시, single-flight는 에이전트 쪽에서 처리하므로 여기서는 호출과 토큰 사용량 기록만 담당한다.
+    """
+
+    # 호출할 준비가 되었는지 (예: API 키 존재)
+    configured = True
+
+    @abstractmethod
+    async def parse(self, model: str, messages: List[Dict[str, str]], response_format: Type[BaseModel]) -> BaseModel:
+        ...
+
+    @abstractmethod
+    async def complete(self, model: str, messages: List[Dict[str, str]]) -> str:
+        ...
+
+    @abstractmethod
+    def stream(self, model: str, messages: List[Dict[str, str]]) -> AsyncIterator[CompletionDelta]:
+        ...
+
+    @abstractmethod
+    def stream_structured(
+        self, model: str, messages: List[Dict[str, str]], response_format: Type[BaseModel]
+    ) -> AsyncIterator[str]:
+        """structured output의 JSON 텍스트 조각"""
+
+    async def warm_up(self, connections: int = LLM_WARMUP_CONNECTIONS) -> int:
+        """첫 사용자 요청 전에 커넥션 등을 미리 준비한다. 준비된 커넥션 수를 돌려준다."""
+        return 0
+
+    async def aclose(self) -> None:
+        pass
+
+
+# ─────────────────────────────────────────────
+# OpenAI
+# ─────────────────────────────────────────────
+def create_async_client(api_key: Optional[str]) -> AsyncOpenAI:
+    """keep-alive 커넥션 풀을 튜닝한 공유 AsyncOpenAI 클라이언트 생성"""
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+    )
+    # 재시도/마감 시간은 UpstreamPolicy가 담당하므로 SDK 자체 재시도는 끈다
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def _usage_dict(usage) -> Optional[Dict[str, Any]]:
+    return usage.model_dump() if usage is not None else None
+
+
+class OpenAIProvider(LLMProvider):
+    def __init__(self, api_key: Optional[str], client: Optional[AsyncOpenAI] = None):
+        self.client = client or create_async_client(api_key)
+        self.configured = bool(api_key) or client is not None
+
+    async def parse(self, model, messages, response_format):
+        # 스키마는 레지스트리에 미리 만들어 둔 strict JSON schema를 그대로 보낸다 (호출마다 재생성하지 않음)
+        completion = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            response_format=response_schemas.get(response_format).response_format,
+        )
+        metrics.record_usage(model, _usage_dict(completion.usage))
+        choice = completion.choices[0]
+        if choice.finish_reason == "length":
+            raise LengthFinishReasonError(completion=completion)
+        if choice.message.refusal:
+            raise ValueError(f"LLM refused the request: {choice.message.refusal}")
+        return response_format.model_validate_json(choice.message.content)
+
+    async def complete(self, model, messages):
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+        )
+        metrics.record_usage(model, _usage_dict(response.usage))
+        return response.choices[0].message.content
+
+    async def stream(self, model, messages):
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            usage = _usage_dict(chunk.usage)
+            if usage:
+                metrics.record_usage(model, usage)
+            if content or usage:
+                yield CompletionDelta(content, usage)
+
+    async def stream_structured(self, model, messages, response_format):
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            response_format=response_schemas.get(response_format).response_format,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage is not None:
+                metrics.record_usage(model, _usage_dict(chunk.usage))
+
+    async def warm_up(self, connections: int = LLM_WARMUP_CONNECTIONS) -> int:
+        """가벼운 GET /models를 동시에 보내 TLS 핸드셰이크를 끝낸 커넥션을 풀에 남겨 둔다 (토큰 비용 없음)"""
+        if not self.configured or connections <= 0:
+            return 0
+        results = await asyncio.gather(
+            *[self.client.models.list() for _ in range(connections)],
+            return_exceptions=True,
+        )
+        return sum(1 for r in results if not isinstance(r, BaseException))
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+
+# ─────────────────────────────────────────────
+# Fake (오프라인)
+# ─────────────────────────────────────────────
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """지연 분포 스펙 → rng를 받아 지연(초)을 돌려주는 함수"""
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind in ("", "0", "none"):
+        return lambda rng: 0.0
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal":
+        # median 기준: exp(mu) = median
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeProvider(LLMProvider):
+    """
+    네트워크 없이 결정적인 응답을 만드는 프로바이더.
+    같은 (model, messages, 스키마)에는 항상 같은 응답을 돌려주고, 응답 스키마의 필드 타입을 따라
+    유효한 structured output(AIAnalysisResult, ChatNodeResult 등)을 만든다.
+    cross-connection은 프롬프트의 히스토리 문맥에 실제로 등장한 노드 ID만 가리킨다.
+    지연은 설정한 분포에서 뽑으며, 응답 내용과 달리 호출 순서에 따라 달라진다.
+    """
+
+    def __init__(
+        self,
+        latency: str = FAKE_LLM_LATENCY,
+        seed: int = FAKE_LLM_SEED,
+        ttft_ratio: float = FAKE_LLM_TTFT_RATIO,
+        error_rate: float = FAKE_LLM_ERROR_RATE,
+        output_ms: float = FAKE_LLM_OUTPUT_MS,
+    ):
+        self.latency = parse_latency(latency)
+        self.seed = seed
+        self.ttft_ratio = ttft_ratio
+        self.error_rate = error_rate
+        self.output_ms = output_ms
+        self._latency_rng = random.Random(seed)
+        self.calls = 0
+
+    def _rng(self, model: str, messages: List[Dict[str, str]], kind: str) -> random.Random:
+        digest = hashlib.sha256(
+            json.dumps([self.seed, model, kind, messages], ensure_ascii=False).encode()
+        ).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and self._latency_rng.random() < self.error_rate:
+            raise FakeUpstreamError("fake upstream error")
+
+    def _delay(self, output: str) -> float:
+        """분포에서 뽑은 지연 + 출력 토큰 수 × output_ms"""
+        delay = self.latency(self._latency_rng)
+        if self.output_ms:
+            delay += (len(output) // 3 + 1) * self.output_ms / 1000
+        return delay
+
+    async def _wait(self, output: str) -> float:
+        self.calls += 1
+        delay = self._delay(output)
+        if delay:
+            await asyncio.sleep(delay)
+        self._maybe_fail()
+        return delay
+
+    # ── 응답 생성 ──
+    @staticmethod
+    def _words(messages: List[Dict[str, str]]) -> List[str]:
+        words = messages[-1]["content"].split() if messages else []
+        return words or ["아이디어"]
+
+    def _text(self, rng: random.Random, words: List[str], count: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(count))
+
+    def _value(self, name: str, annotation, rng: random.Random, ctx: Dict[str, Any]):
+        origin = typing.get_origin(annotation)
+        args = typing.get_args(annotation)
+        if origin is typing.Literal:
+            return rng.choice(args)
+        if origin is typing.Union:
+            return self._value(name, next(a for a in args if a is not type(None)), rng, ctx)
+        if origin in (list, List):
+            item = args[0] if args else str
+            if isinstance(item, type) and issubclass(item, BaseModel) and "existing_node_id" in item.model_fields:
+                count = min(len(ctx["ids"]), rng.randint(0, 2))
+            else:
+                count = rng.randint(1, 3)
+            return [self._value(name, item, rng, ctx) for _ in range(count)]
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return self._instance(annotation, rng, ctx)
+        if annotation is int:
+            return 0  # *_index 필드는 항상 유효한 범위 안으로
+        if annotation is float:
+            return round(rng.random(), 3)
+        if annotation is bool:
+            return rng.random() < 0.5
+        if name == "existing_node_id":
+            return rng.choice(ctx["ids"])
+        if "label" in name:
+            return self._text(rng, ctx["words"], 2)
+        return self._text(rng, ctx["words"], 8)
+
+    def _instance(self, model_cls: Type[BaseModel], rng: random.Random, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            name: self._value(name, field.annotation, rng, ctx)
+            for name, field in model_cls.model_fields.items()
+        }
+
+    def _structured(self, model, messages, response_format) -> BaseModel:
+        rng = self._rng(model, messages, response_format.__name__)
+        system = " ".join(m["content"] for m in messages if m["role"] == "system")
+        ctx = {"ids": _HISTORY_ID.findall(system), "words": self._words(messages)}
+        return response_format.model_validate(self._instance(response_format, rng, ctx))
+
+    def _reply(self, model, messages) -> str:
+        rng = self._rng(model, messages, "text")
+        return self._text(rng, self._words(messages), rng.randint(20, 60))
+
+    @staticmethod
+    def _usage(messages: List[Dict[str, str]], reply: str) -> Dict[str, int]:
+        prompt = sum(len(m["content"]) for m in messages) // 3 + 1
+        completion = len(reply) // 3 + 1
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    # ── LLMProvider ──
+    async def parse(self, model, messages, response_format):
+        parsed = self._structured(model, messages, response_format)
+        await self._wait(parsed.model_dump_json())
+        metrics.record_usage(model, self._usage(messages, parsed.model_dump_json()))
+        return parsed
+
+    async def complete(self, model, messages):
+        reply = self._reply(model, messages)
+        await self._wait(reply)
+        metrics.record_usage(model, self._usage(messages, reply))
+        return reply
+
+    async def _chunked(self, text: str, chunk_size: int = 16) -> AsyncIterator[str]:
+        """첫 조각은 전체 지연의 ttft_ratio 뒤에, 나머지는 남은 지연을 나눠 가며"""
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+        self.calls += 1
+        delay = self._delay(text)
+        await asyncio.sleep(delay * self.ttft_ratio)
+        self._maybe_fail()
+        step = delay * (1 - self.ttft_ratio) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(step)
+            yield chunk
+
+    async def stream(self, model, messages):
+        reply = self._reply(model, messages)
+        async for chunk in self._chunked(reply):
+            yield CompletionDelta(chunk)
+        usage = self._usage(messages, reply)
+        metrics.record_usage(model, usage)
+        yield CompletionDelta(None, usage)
+
+    async def stream_structured(self, model, messages, response_format):
+        text = self._structured(model, messages, response_format).model_dump_json()
+        async for chunk in self._chunked(text):
+            yield chunk
+        metrics.record_usage(model, self._usage(messages, text))
+
+
+def create_provider(api_key: Optional[str], name: str = LLM_PROVIDER) -> LLMProvider:
+    if name == "fake":
+        return FakeProvider()
+    if name == "openai":
+        return OpenAIProvider(api_key)
+    raise ValueError(f"Unknown LLM provider: {name}")
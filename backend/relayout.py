@@ -0,0 +1,318 @@
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .layout import (
+    LayoutEngine, PROBLEM_X_RANGE, SOLUTION_X_RANGE, CATEGORY_Y_MAP,
+    NODE_WIDTH, NODE_HEIGHT, NODE_STRIDE_X, NODE_STRIDE_Y, MIN_GAP,
+)
+from .sessions import HistoryNode
+
+# --- Global Re-layout Configuration ---
+# 반복 횟수 (기존 위치에서 시작하면 적게, 처음부터면 많이)
+RELAYOUT_ITERATIONS = int(os.getenv("RELAYOUT_ITERATIONS", "40"))
+RELAYOUT_WARM_ITERATIONS = int(os.getenv("RELAYOUT_WARM_ITERATIONS", "20"))
+# 마지막에 겹침만 푸는 반복 횟수 (남은 겹침은 LayoutEngine으로 가까운 빈자리에 옮긴다)
+RELAYOUT_OVERLAP_ITERATIONS = int(os.getenv("RELAYOUT_OVERLAP_ITERATIONS", "20"))
+# 밴드(phase x 범위, category y 줄) 중심으로 당기는 스프링 배율. 1이면 반발과 균형을 이뤄 밴드에 내접하는 타원에
+# 고르게 퍼지고, 크면 밴드 안으로 더 모이며(엣지 인력은 덜 반영), 작으면 엣지 구조가 밴드를 더 흐린다.
+RELAYOUT_BAND_WEIGHT = float(os.getenv("RELAYOUT_BAND_WEIGHT", "1.0"))
+
+# 이상적인 엣지 길이 (노드 한 칸)
+IDEAL_LENGTH = float(NODE_STRIDE_X)
+# 이 거리 안의 노드끼리는 쌍으로 정확히, 그 밖은 이 크기 격자로 근사해 반발을 계산한다
+REPULSION_CUTOFF = 2.0 * IDEAL_LENGTH
+# warm start의 첫 반복에서 노드 하나가 움직일 수 있는 최대 거리 (이후 선형으로 줄어든다)
+WARM_TEMPERATURE = IDEAL_LENGTH / 4
+# 이웃 쌍 목록을 몇 번 반복마다 다시 만들지 (그 사이 노드는 온도만큼만 움직이므로 목록이 거의 그대로다)
+NEIGHBOR_REBUILD = 4
+# 반발 격자의 한 변 최대 셀 수 (영역이 아주 넓으면 셀을 키운다)
+MESH_MAX_CELLS = 256
+# 밴드 좌표계를 노드 수에 맞춰 늘릴 때 노드 하나가 차지한다고 보는 면적.
+# 슬롯 배치(LayoutEngine)의 3배 — 더 빽빽하면 force 배치가 끝난 뒤 겹침이 많이 남아 정리 비용이 커진다.
+AREA_PER_NODE = 3.0 * NODE_STRIDE_X * NODE_STRIDE_Y
+# category 줄 사이 간격 (CATEGORY_Y_MAP은 등간격)
+CATEGORY_ROW_GAP = float(min(b - a for a, b in zip(sorted(CATEGORY_Y_MAP.values()), sorted(CATEGORY_Y_MAP.values())[1:])))
+
+
+def band_scale(n: int) -> float:
+    """노드가 많으면 기본 밴드(1000x900 안팎)에 다 들어가지 않으므로 밴드 좌표를 같은 비율로 늘린다"""
+    base_area = (SOLUTION_X_RANGE[1] - PROBLEM_X_RANGE[0]) * (max(CATEGORY_Y_MAP.values()) + NODE_STRIDE_Y)
+    return max(1.0, math.sqrt(n * AREA_PER_NODE / base_area))
+
+
+def band_targets(phases: List[str], categories: List[str], scale: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    노드별 허용 사각형 [x 하한, x 상한] x [y 하한, y 상한] → ((n, 2) 하한, (n, 2) 상한).
+    x는 phase 범위, y는 category 줄을 중심으로 다음 줄까지의 절반씩. 모르는 phase는 양쪽 전체, 모르는 category는 What 줄.
+    """
+    problem = np.array([p == "Problem" for p in phases])
+    solution = np.array([p == "Solution" for p in phases])
+    x_lo = np.where(problem, PROBLEM_X_RANGE[0], np.where(solution, SOLUTION_X_RANGE[0], PROBLEM_X_RANGE[0]))
+    x_hi = np.where(problem, PROBLEM_X_RANGE[1], np.where(solution, SOLUTION_X_RANGE[1], SOLUTION_X_RANGE[1]))
+    y = np.array([CATEGORY_Y_MAP.get(c, CATEGORY_Y_MAP["What"]) for c in categories], dtype=np.float64)
+    half = CATEGORY_ROW_GAP / 2
+    low = np.column_stack([x_lo, y - half]) * scale
+    high = np.column_stack([x_hi, y + half]) * scale
+    return low, high
+
+
+def neighbor_pairs(pos: np.ndarray, cell: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    거리 cell 안에 있을 수 있는 모든 (i, j) 쌍 (i != j, 양방향).
+    노드를 셀 키로 정렬한 뒤 주변 9개 셀의 연속 구간을 ragged arange로 펼쳐 파이썬 루프 없이 만든다.
+    """
+    n = len(pos)
+    grid = np.floor(pos / cell).astype(np.int64)
+    grid -= grid.min(axis=0) - 1          # 이웃 오프셋(-1)이 음수가 되지 않게
+    width = int(grid[:, 1].max()) + 2
+    keys = grid[:, 0] * width + grid[:, 1]
+    order = np.argsort(keys, kind="stable")
+    cells, starts, inverse, counts = np.unique(keys[order], return_index=True, return_inverse=True, return_counts=True)
+    cell_of = np.empty(n, dtype=np.int64)
+    cell_of[order] = inverse
+
+    rows, cols = [], []
+    node = np.arange(n)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            # 이웃 셀 찾기는 노드가 아니라 (노드가 있는) 셀 단위로 한다
+            target = cells + dx * width + dy
+            at = np.minimum(np.searchsorted(cells, target), len(cells) - 1)
+            count = np.where(cells[at] == target, counts[at], 0)[cell_of]
+            total = int(count.sum())
+            if not total:
+                continue
+            # 각 노드의 이웃 셀 구간 [start, start + count)를 한 배열로 이어 붙인다
+            offsets = np.repeat(starts[at][cell_of] - (np.cumsum(count) - count), count) + np.arange(total)
+            rows.append(np.repeat(node, count))
+            cols.append(order[offsets])
+    i = np.concatenate(rows)
+    j = np.concatenate(cols)
+    keep = i != j
+    return i[keep], j[keep]
+
+
+class RepulsionMesh:
+    """
+    먼 거리 반발 k²/d의 particle-mesh 근사. 배치 영역을 고정 격자로 덮고 셀마다 노드 수를 세어, 반발 커널과의
+    합성곱(FFT)으로 셀마다 받는 힘을 구한 뒤 노드가 속한 셀의 값을 읽는다 — 반복당 O(n + G² log G).
+    격자가 고정이라 커널 스펙트럼은 한 번만 계산한다. 영역 밖 노드는 가장자리 셀로 센다.
+    같은 셀 안 노드끼리는 서로 밀지 않으므로 가까운 쌍의 반발은 neighbor_pairs로 따로 계산한다.
+    """
+
+    def __init__(self, low: np.ndarray, high: np.ndarray, k: float, cell: float):
+        margin = (high - low) * 0.25 + cell
+        self.origin = low - margin
+        extent = (high + margin) - self.origin
+        self.cell = max(cell, float(extent.max()) / MESH_MAX_CELLS)
+        self.shape = tuple(int(v) for v in np.ceil(extent / self.cell))
+        gx, gy = self.shape
+        # 선형(원형이 아닌) 합성곱을 위해 두 배 크기로 패딩 — 커널은 셀 간 변위 (-g+1 .. g-1)
+        self.padded = (2 * gx, 2 * gy)
+        dx = np.fft.fftfreq(2 * gx, 1 / (2 * gx))[:, None] * self.cell
+        dy = np.fft.fftfreq(2 * gy, 1 / (2 * gy))[None, :] * self.cell
+        d2 = dx * dx + dy * dy
+        d2[0, 0] = 1.0
+        kernel = k * k / d2
+        kernel[0, 0] = 0.0
+        self.kernel_x = np.fft.rfft2(kernel * dx)
+        self.kernel_y = np.fft.rfft2(kernel * dy)
+
+    def __call__(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        gx, gy = self.shape
+        cx = np.clip(((x - self.origin[0]) // self.cell).astype(np.int64), 0, gx - 1)
+        cy = np.clip(((y - self.origin[1]) // self.cell).astype(np.int64), 0, gy - 1)
+        cells = cx * gy + cy
+        density = np.bincount(cells, minlength=gx * gy).reshape(gx, gy).astype(np.float64)
+        spectrum = np.fft.rfft2(density, self.padded)
+        force_x = np.fft.irfft2(spectrum * self.kernel_x, self.padded)[:gx, :gy].ravel()
+        force_y = np.fft.irfft2(spectrum * self.kernel_y, self.padded)[:gx, :gy].ravel()
+        return force_x[cells], force_y[cells]
+
+
+def force_layout(
+    positions: np.ndarray,
+    edges: np.ndarray,
+    low: np.ndarray,
+    high: np.ndarray,
+    iterations: int,
+    overlap_iterations: int = RELAYOUT_OVERLAP_ITERATIONS,
+    initial_temperature: Optional[float] = None,
+) -> np.ndarray:
+    """
+    그리드 기반 force-directed 배치 + 밴드 제약 + 겹침 제거. 모든 힘은 배열 연산으로 계산한다.
+      반발  k²/d           REPULSION_CUTOFF 안은 이웃 쌍으로, 밖은 RepulsionMesh로
+      인력  k·log(1 + d/k)  엣지 양 끝 (LinLog 계열: 먼 엣지 몇 개가 전체를 한 점으로 끌어모으지 않는다)
+      밴드  자기 밴드(phase x 범위 x category y 줄) 중심으로 당기는 스프링 — 반발과 함께 밴드 안에 고르게 퍼진다
+    positions: (n, 2) 시작 위치, edges: (m, 2) 노드 인덱스 쌍, low/high: (n, 2) 밴드 사각형
+    """
+    x = positions[:, 0].astype(np.float64)
+    y = positions[:, 1].astype(np.float64)
+    n = len(x)
+    if n < 2:
+        return np.column_stack([x, y])
+    k = IDEAL_LENGTH
+    src, dst = (edges[:, 0], edges[:, 1]) if len(edges) else (np.zeros(0, np.int64), np.zeros(0, np.int64))
+    span = float(max(np.ptp(x), np.ptp(y))) or k
+    t0 = initial_temperature if initial_temperature is not None else span / 10
+    cutoff2 = REPULSION_CUTOFF ** 2
+    rebuild2 = (1.5 * REPULSION_CUTOFF) ** 2
+    # 밴드마다 조화 퍼텐셜(중심으로 당기는 스프링). 반발과 균형을 이루면 노드가 밴드에 내접하는 타원 안에 고르게 퍼지도록
+    # 밴드의 노드 수로 세기를 정한다: 반지름 A, B 타원에 N개가 균일하면 안쪽 반발장이 (2Nk²/(A(A+B))·x, 2Nk²/(B(A+B))·y)
+    center_x, center_y = (low[:, 0] + high[:, 0]) / 2, (low[:, 1] + high[:, 1]) / 2
+    half_x, half_y = (high[:, 0] - low[:, 0]) / 2, (high[:, 1] - low[:, 1]) / 2
+    _, box, box_size = np.unique(np.column_stack([center_x, center_y]), axis=0, return_inverse=True, return_counts=True)
+    members = box_size[box.ravel()] * RELAYOUT_BAND_WEIGHT
+    trap_x = 2 * members * k * k / (half_x * (half_x + half_y))
+    trap_y = 2 * members * k * k / (half_y * (half_x + half_y))
+    mesh = RepulsionMesh(
+        np.minimum(low.min(axis=0), positions.min(axis=0)),
+        np.maximum(high.max(axis=0), positions.max(axis=0)),
+        k, REPULSION_CUTOFF,
+    )
+
+    for step in range(iterations):
+        if step % NEIGHBOR_REBUILD == 0:
+            i, j = neighbor_pairs(np.column_stack([x, y]), REPULSION_CUTOFF)
+            # 양방향 쌍 중 한쪽만, 다음 재구성 전까지 컷오프 안으로 들어올 수 있는 것만 남긴다
+            keep = i < j
+            i, j = i[keep], j[keep]
+            keep = (x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2 < rebuild2
+            i, j = i[keep], j[keep]
+        dx, dy = x[i] - x[j], y[i] - y[j]
+        d2 = dx * dx + dy * dy
+        strength = np.where(d2 < cutoff2, k * k / np.maximum(d2, 1.0), 0.0)
+        push_x, push_y = dx * strength, dy * strength
+        force_x = np.bincount(i, push_x, n) - np.bincount(j, push_x, n)
+        force_y = np.bincount(i, push_y, n) - np.bincount(j, push_y, n)
+
+        far_x, far_y = mesh(x, y)
+        force_x += far_x
+        force_y += far_y
+
+        if len(src):
+            ex, ey = x[src] - x[dst], y[src] - y[dst]
+            length = np.sqrt(ex * ex + ey * ey)
+            pull = k * np.log1p(length / k) / np.maximum(length, 1e-9)
+            pull_x, pull_y = ex * pull, ey * pull
+            force_x -= np.bincount(src, pull_x, n) - np.bincount(dst, pull_x, n)
+            force_y -= np.bincount(src, pull_y, n) - np.bincount(dst, pull_y, n)
+        force_x -= trap_x * (x - center_x)
+        force_y -= trap_y * (y - center_y)
+
+        # 선형 냉각: 한 번에 움직이는 거리를 온도로 제한한다
+        temperature = t0 * (1 - step / iterations) + 1.0
+        length = np.sqrt(force_x * force_x + force_y * force_y)
+        scale = np.minimum(length, temperature) / np.maximum(length, 1e-9)
+        x += force_x * scale
+        y += force_y * scale
+
+    return remove_overlaps(np.column_stack([x, y]), overlap_iterations)
+
+
+def remove_overlaps(pos: np.ndarray, iterations: int) -> np.ndarray:
+    """노드 사각형(+간격)이 겹치는 쌍을 겹침이 작은 축으로 반씩 밀어낸다"""
+    min_dx, min_dy = NODE_WIDTH + MIN_GAP, NODE_HEIGHT + MIN_GAP
+    n = len(pos)
+    for _ in range(iterations):
+        i, j = neighbor_pairs(pos, max(min_dx, min_dy))
+        delta = pos[i] - pos[j]
+        over_x = min_dx - np.abs(delta[:, 0])
+        over_y = min_dy - np.abs(delta[:, 1])
+        hit = (over_x > 0) & (over_y > 0)
+        if not hit.any():
+            break
+        # 부동소수 오차로 딱 붙은 쌍이 계속 겹침으로 남지 않게 조금 더 민다
+        i, j, delta, over_x, over_y = i[hit], j[hit], delta[hit], over_x[hit] + 0.01, over_y[hit] + 0.01
+        along_x = over_x * min_dy < over_y * min_dx   # 상대적으로 덜 겹친 축으로
+        # 같은 좌표에 있는 쌍은 인덱스 순서로 방향을 정한다 (둘이 같은 쪽으로 밀리지 않게)
+        tie = np.where(i < j, 1.0, -1.0)
+        sign_x = np.where(delta[:, 0] > 0, 1.0, np.where(delta[:, 0] < 0, -1.0, tie))
+        sign_y = np.where(delta[:, 1] > 0, 1.0, np.where(delta[:, 1] < 0, -1.0, tie))
+        # 쌍은 양방향으로 들어 있으므로 각자 절반씩 움직이면 정확히 떨어진다
+        pos[:, 0] += np.bincount(i, weights=np.where(along_x, sign_x * over_x / 2, 0.0), minlength=n)
+        pos[:, 1] += np.bincount(i, weights=np.where(along_x, 0.0, sign_y * over_y / 2), minlength=n)
+    return pos
+
+
+def overlapping(pos: np.ndarray) -> np.ndarray:
+    """다른 노드와 겹치는 노드 마스크"""
+    i, j = neighbor_pairs(pos, max(NODE_WIDTH, NODE_HEIGHT) + MIN_GAP)
+    delta = np.abs(pos[i] - pos[j])
+    hit = (delta[:, 0] < NODE_WIDTH + MIN_GAP) & (delta[:, 1] < NODE_HEIGHT + MIN_GAP)
+    mask = np.zeros(len(pos), dtype=bool)
+    mask[i[hit]] = True
+    return mask
+
+
+def legalize(pos: np.ndarray, max_rings: int = 64) -> np.ndarray:
+    """
+    remove_overlaps로 다 풀리지 않은 겹침을 LayoutEngine의 공간 해시로 정리한다.
+    겹치지 않는 노드를 먼저 등록하고, 겹치는 노드는 자기 자리에서 가까운 칸부터 빈자리를 찾아 옮긴다.
+    """
+    clash = overlapping(pos)
+    if not clash.any():
+        return pos
+    engine = LayoutEngine()
+    for row in np.flatnonzero(~clash).tolist():
+        engine.occupy(row, float(pos[row, 0]), float(pos[row, 1]))
+    for row in np.flatnonzero(clash).tolist():
+        x, y = float(pos[row, 0]), float(pos[row, 1])
+        for ring in range(max_rings):
+            spot = next((
+                (x + dx * NODE_STRIDE_X, y + dy * NODE_STRIDE_Y)
+                for dx in range(-ring, ring + 1) for dy in range(-ring, ring + 1)
+                if max(abs(dx), abs(dy)) == ring and engine.is_free(x + dx * NODE_STRIDE_X, y + dy * NODE_STRIDE_Y)
+            ), None)
+            if spot is not None:
+                pos[row] = spot
+                engine.occupy(row, *spot)
+                break
+    return pos
+
+
+def layout_graph(
+    nodes: List[Dict[str, Any]],
+    edges: List[Dict[str, Any]],
+    warm_start: bool = True,
+    iterations: Optional[int] = None,
+    seed: int = 0,
+) -> Dict[str, Dict[str, float]]:
+    """
+    캔버스 노드/엣지 전체를 다시 배치해 {id: {"x", "y"}}를 돌려준다.
+    warm_start면 위치가 있는 노드는 그 자리에서 시작하고(적은 반복으로 모양을 유지), 없는 노드는 밴드 안 임의 위치에서.
+    """
+    parsed = [HistoryNode(node) for node in nodes]
+    if not parsed:
+        return {}
+    index = {node.id: row for row, node in enumerate(parsed)}
+    pairs = [
+        (index[e.get("source")], index[e.get("target")]) for e in edges
+        if e.get("source") in index and e.get("target") in index and e.get("source") != e.get("target")
+    ]
+    edge_array = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+    scale = band_scale(len(parsed))
+    low, high = band_targets([n.phase for n in parsed], [n.category for n in parsed], scale)
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(low, high)
+    warm = False
+    if warm_start:
+        known = np.array([n.x is not None for n in parsed])
+        if known.any():
+            warm = True
+            start[known] = [(n.x, n.y) for n in parsed if n.x is not None]
+
+    if iterations is None:
+        iterations = RELAYOUT_WARM_ITERATIONS if warm else RELAYOUT_ITERATIONS
+    # 기존 배치에서 시작하면 큰 이동으로 모양을 흩뜨리지 않도록 낮은 온도(노드 너비의 1/4 안팎)에서 시작한다
+    positions = force_layout(
+        start, edge_array, low, high, iterations,
+        initial_temperature=WARM_TEMPERATURE if warm else None,
+    )
+    positions = legalize(positions)
+    return {
+        node.id: {"x": float(x), "y": float(y)}
+        for node, (x, y) in zip(parsed, positions)
+    }
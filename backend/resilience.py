@@ -0,0 +1,317 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+import openai
+from .metrics import metrics
+
+# --- Upstream Policy Configuration ---
+# 호출 종류(operation)별 전체 마감 시간(초). 재시도/헤지/대기 시간을 모두 포함한다.
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+# "chat=30,summary=20" 형식으로 operation별 덮어쓰기
+LLM_DEADLINES = os.getenv("LLM_DEADLINES", "chat=30,summary=30")
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# 첫 요청이 관측된 p95를 넘기면 같은 요청을 하나 더 보내고 먼저 온 응답을 쓴다
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# 연속 실패가 이만큼 쌓이면 cooldown 동안 업스트림을 부르지 않고 바로 503
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+T = TypeVar("T")
+
+
+def parse_overrides(spec: str) -> Dict[str, float]:
+    overrides = {}
+    for part in spec.split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            overrides[name.strip()] = float(value)
+    return overrides
+
+
+class UpstreamError(Exception):
+    """업스트림 정책이 포기한 호출. main.py에서 status_code 그대로 HTTP 응답이 된다."""
+    status_code = 502
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamUnavailable(UpstreamError):
+    status_code = 503
+
+
+class UpstreamTimeout(UpstreamError):
+    status_code = 504
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429/5xx, 연결 오류, 타임아웃만 재시도한다 (4xx 요청 오류는 그대로)"""
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(exc, (openai.APIConnectionError, ConnectionError, asyncio.TimeoutError))
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """
+    closed → (연속 실패 threshold회) → open → (cooldown 경과) → half-open.
+    half-open에서는 시험 호출 하나만 통과시키고, 성공하면 closed, 실패하면 다시 open.
+    """
+
+    def __init__(self, threshold: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def check(self) -> None:
+        if not self.allow():
+            raise UpstreamUnavailable("LLM upstream is unavailable (circuit open).", retry_after=self.retry_after() or 1.0)
+
+    def abandon(self) -> None:
+        """시험 호출이 결과 없이 취소된 경우 다음 호출이 다시 시험할 수 있게"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            if self.opened_at is None or self._probing:
+                metrics.inc("thinking_breaker_opened_total")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class LatencyTracker:
+    """operation별 최근 성공 호출 지연 (헤지 기준 백분위 계산용)"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, operation: str, seconds: float) -> None:
+        samples = self._samples.get(operation)
+        if samples is None:
+            samples = self._samples[operation] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, operation: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        samples = self._samples.get(operation)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class UpstreamPolicy:
+    """
+    LLM 호출 하나에 대한 마감 시간, 지수 백오프(full jitter) 재시도, 헤지, 서킷 브레이커.
+    attempt는 매번 새 업스트림 요청을 만드는 콜러블이어야 한다 (재시도/헤지 때 다시 호출됨).
+    """
+
+    def __init__(
+        self,
+        deadline: float = LLM_DEADLINE,
+        deadlines: Optional[Dict[str, float]] = None,
+        retries: int = LLM_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        hedge: bool = LLM_HEDGE,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.deadline = deadline
+        self.deadlines = parse_overrides(LLM_DEADLINES) if deadlines is None else deadlines
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+
+    def deadline_for(self, operation: str) -> float:
+        return self.deadlines.get(operation, self.deadline)
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = retry_after_seconds(exc)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def _give_up(self, operation: str, exc: BaseException) -> None:
+        """
+        더 재시도하지 않는 실패를 기록한다. 업스트림 상태 문제(429/5xx/연결)면 브레이커에 반영하고
+        UpstreamError로 바꿔 올린다 (429는 503 + Retry-After, 나머지는 502). 요청 자체의 오류는 그대로 둔다.
+        """
+        metrics.inc("thinking_upstream_failures_total", operation=operation, error=type(exc).__name__)
+        if not is_retryable(exc) or isinstance(exc, TimeoutError):
+            return
+        self.breaker.record_failure()
+        if getattr(exc, "status_code", None) == 429:
+            raise UpstreamUnavailable("LLM upstream is rate limited.", retry_after=retry_after_seconds(exc) or 1.0) from exc
+        raise UpstreamError(f"LLM upstream failed: {exc}") from exc
+
+    async def call(
+        self, operation: str, attempt: Callable[[], Awaitable[T]],
+        admit_hedge: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> T:
+        """admit_hedge: 헤지 요청을 보내기 전에 부르는 입장 제어. UpstreamError로 거절하면 헤지하지 않는다."""
+        self.breaker.check()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_for(operation)
+        tries = 0
+        while True:
+            remaining = deadline - loop.time()
+            started = time.perf_counter()
+            try:
+                async with asyncio.timeout(remaining):
+                    result = await self._hedged(operation, attempt, admit_hedge)
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except TimeoutError as exc:
+                self._give_up(operation, exc)
+                self.breaker.record_failure()
+                raise UpstreamTimeout(f"LLM call exceeded its {self.deadline_for(operation):g}s deadline.") from exc
+            except Exception as exc:
+                delay = self._backoff(tries, exc)
+                if not is_retryable(exc) or tries >= self.retries or loop.time() + delay >= deadline:
+                    self._give_up(operation, exc)
+                    raise
+                tries += 1
+                metrics.inc("thinking_upstream_retries_total", operation=operation)
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.latency.record(operation, time.perf_counter() - started)
+            return result
+
+    async def _hedged(
+        self, operation: str, attempt: Callable[[], Awaitable[T]],
+        admit_hedge: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> T:
+        threshold = self.latency.percentile(operation, self.hedge_percentile, self.hedge_min_samples) if self.hedge else None
+        if threshold is None:
+            return await attempt()
+
+        primary = asyncio.ensure_future(attempt())
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=threshold)
+            if done:
+                return primary.result()
+
+            # 헤지도 업스트림 한도를 쓰는 요청이다: 입장 제어를 통과하지 못하면 첫 요청만 기다린다
+            if admit_hedge is not None:
+                try:
+                    await admit_hedge()
+                except UpstreamError:
+                    metrics.inc("thinking_upstream_hedges_skipped_total", operation=operation)
+                    return await primary
+            metrics.inc("thinking_upstream_hedges_total", operation=operation)
+            hedge = asyncio.ensure_future(attempt())
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.inc("thinking_upstream_hedge_wins_total", operation=operation)
+                        return task.result()
+            # 둘 다 실패하면 먼저 보낸 요청의 오류를 올린다
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def stream(self, operation: str, open_stream: Callable[[], AsyncGenerator[Any, None]]) -> AsyncIterator[Any]:
+        """
+        스트리밍 호출: 마감 시간은 업스트림에서 조각을 기다리는 시간에만 적용하고 (소비자가 조각을 처리하느라
+        멈춰 있던 시간은 빼고), 재시도는 첫 조각이 나오기 전에 실패한 경우에만 한다
+        (이미 보낸 조각은 되돌릴 수 없으므로). 헤지는 하지 않는다.
+        """
+        self.breaker.check()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_for(operation)
+        tries = 0
+        while True:
+            emitted = False
+            stream = open_stream()
+            try:
+                while True:
+                    try:
+                        async with asyncio.timeout_at(deadline):
+                            item = await stream.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    emitted = True
+                    paused = loop.time()
+                    yield item
+                    deadline += loop.time() - paused
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.abandon()
+                raise
+            except TimeoutError as exc:
+                self._give_up(operation, exc)
+                self.breaker.record_failure()
+                raise UpstreamTimeout(f"LLM stream exceeded its {self.deadline_for(operation):g}s deadline.") from exc
+            except Exception as exc:
+                delay = self._backoff(tries, exc)
+                if emitted or not is_retryable(exc) or tries >= self.retries or loop.time() + delay >= deadline:
+                    self._give_up(operation, exc)
+                    raise
+                tries += 1
+                metrics.inc("thinking_upstream_retries_total", operation=operation)
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                await stream.aclose()
+            self.breaker.record_success()
+            return
@@ -0,0 +1,130 @@
+import os
+from typing import List, Dict, Sequence, Tuple
+import numpy as np
+
+# --- History Pruning Configuration ---
+# full: 모든 기존 노드를 프롬프트에 넣음 / pruned: 관련 top-k + 최근 노드만 토큰 예산 안에서
+HISTORY_MODE = os.getenv("HISTORY_MODE", "pruned")
+HISTORY_TOP_K = int(os.getenv("HISTORY_TOP_K", "20"))
+HISTORY_RECENT = int(os.getenv("HISTORY_RECENT", "8"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+
+NGRAM_SIZES = (2, 3)
+INDEX_DIM = 2048
+# 인덱스를 한꺼번에 만들 때 한 번에 해싱하는 텍스트 수 (임시 카운트 행렬 크기 제한)
+INDEX_BUILD_CHUNK = 1024
+
+_HASH_MULT = np.uint64(0x100000001B3)
+_MIX_MULT = np.uint64(0xFF51AFD7ED558CCD)
+
+
+def estimate_tokens(text: str) -> int:
+    """토크나이저 없이 쓰는 대략적인 토큰 수 (한글/영문 혼합 기준 3자 ≈ 1토큰)"""
+    return len(text) // 3 + 1
+
+
+def hashed_ngram_matrix(texts: Sequence[str], dim: int = INDEX_DIM) -> np.ndarray:
+    """
+    문자 n-gram을 해싱한 TF 벡터를 텍스트마다 한 행씩 (sublinear tf, L2 정규화).
+    문자 단위 파이썬 루프 없이, 모든 텍스트를 NUL로 이어 붙인 코드포인트 배열 위에서
+    n-gram 해시와 행별 bincount를 한 번에 계산한다. 해시는 프로세스와 무관하게 결정적이다.
+    """
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    if not texts:
+        return matrix
+    joined = "\0" + "\0".join(" ".join(t.lower().replace("\0", " ").split()) for t in texts) + "\0"
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    owner = np.cumsum(codes == 0) - 1   # 각 위치가 속한 텍스트 (구분자는 다음 텍스트로 셈)
+    valid = codes != 0
+    cells = []
+    for n in NGRAM_SIZES:
+        count = len(codes) - n + 1
+        if count <= 0:
+            continue
+        h = np.full(count, n, dtype=np.uint64)
+        window = valid[:count].copy()
+        for k in range(n):
+            h = h * _HASH_MULT + codes[k:k + count]
+            window &= valid[k:k + count]
+        h ^= h >> np.uint64(33)
+        h *= _MIX_MULT
+        h ^= h >> np.uint64(33)
+        cells.append(owner[:count][window] * dim + (h[window] % np.uint64(dim)).astype(np.int64))
+    # 등장한 (행, 버킷) 칸만 희소하게 세고 정규화한 뒤 한 번에 써 넣는다
+    cell, counts = np.unique(np.concatenate(cells), return_counts=True)
+    rows = cell // dim
+    values = np.log1p(counts).astype(np.float32)
+    norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(texts))).astype(np.float32)
+    matrix[rows, cell % dim] = values / norms[rows]
+    return matrix
+
+
+def hashed_ngram_vector(text: str, dim: int = INDEX_DIM) -> np.ndarray:
+    return hashed_ngram_matrix([text], dim)[0]
+
+
+class SimilarityIndex:
+    """
+    노드 label/content에 대한 로컬 유사도 인덱스.
+    행렬을 두 배씩 키우며 append하므로 노드 추가는 amortized O(1),
+    질의는 NumPy 행렬-벡터 곱 한 번(코사인 유사도)이다.
+    """
+
+    def __init__(self, dim: int = INDEX_DIM, capacity: int = 64):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, node_id: str, text: str) -> None:
+        row = self._rows.get(node_id)
+        if row is None:
+            row = len(self.ids)
+            if row == self._matrix.shape[0]:
+                grown = np.zeros((row * 2, self.dim), dtype=np.float32)
+                grown[:row] = self._matrix
+                self._matrix = grown
+            self.ids.append(node_id)
+            self._rows[node_id] = row
+        self._matrix[row] = hashed_ngram_vector(text, self.dim)
+
+    def add_many(self, node_ids: Sequence[str], texts: Sequence[str]) -> None:
+        """여러 노드를 한 번에 (벡터화 해싱, 행렬은 한 번만 키움)"""
+        rows = []
+        for node_id in node_ids:
+            row = self._rows.get(node_id)
+            if row is None:
+                row = self._rows[node_id] = len(self.ids)
+                self.ids.append(node_id)
+            rows.append(row)
+        if len(self.ids) > self._matrix.shape[0]:
+            grown = np.zeros((max(len(self.ids), self._matrix.shape[0] * 2), self.dim), dtype=np.float32)
+            grown[:self._matrix.shape[0]] = self._matrix
+            self._matrix = grown
+        for start in range(0, len(rows), INDEX_BUILD_CHUNK):
+            chunk = slice(start, start + INDEX_BUILD_CHUNK)
+            self._matrix[rows[chunk]] = hashed_ngram_matrix(texts[chunk], self.dim)
+
+    def row(self, node_id: str) -> int:
+        """삽입 순서상의 위치"""
+        return self._rows[node_id]
+
+    def scores(self, text: str) -> np.ndarray:
+        """모든 노드에 대한 코사인 유사도 (삽입 순서)"""
+        return self._matrix[:len(self.ids)] @ hashed_ngram_vector(text, self.dim)
+
+    def score_many(self, queries: np.ndarray) -> np.ndarray:
+        """(노드 수, 질의 수) 코사인 유사도 — queries는 hashed_ngram_matrix의 행들"""
+        return self._matrix[:len(self.ids)] @ queries.T
+
+    def query(self, text: str, k: int) -> List[Tuple[str, float]]:
+        if not self.ids or k <= 0:
+            return []
+        scores = self.scores(text)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
@@ -0,0 +1,215 @@
+import json
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+from pydantic import BaseModel
+from .metrics import metrics
+
+# --- Model Routing Configuration ---
+# 라우팅 규칙 JSON (파일 경로가 우선, 없으면 MODEL_ROUTES 문자열, 둘 다 없으면 DEFAULT_ROUTES)
+MODEL_ROUTES_PATH = os.getenv("MODEL_ROUTES_PATH", "")
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "")
+# 모델별 최근 호출 몇 개로 지연/오류율을 볼지
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "100"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+# 최근 오류율이 이 이상이면 degraded로 보고 다음 후보로 넘어간다
+ROUTER_DEGRADED_ERROR_RATE = float(os.getenv("ROUTER_DEGRADED_ERROR_RATE", "0.3"))
+
+DEFAULT_ROUTES = {
+    "analyze": [
+        {"model": "gpt-4o-2024-08-06", "expected_ms": 6000, "degraded_p95_ms": 20000},
+        {"model": "gpt-4o-mini", "expected_ms": 3000},
+    ],
+    "chat-to-nodes": [
+        {"model": "gpt-4o-2024-08-06", "expected_ms": 6000, "degraded_p95_ms": 20000},
+        {"model": "gpt-4o-mini", "expected_ms": 3000},
+    ],
+    "chat": [
+        {"model": "gpt-4o-mini", "expected_ms": 2500},
+    ],
+    "summary": [
+        {"model": "gpt-4o-mini", "expected_ms": 2500},
+    ],
+}
+
+
+class ModelRoute(BaseModel):
+    """operation의 후보 모델 하나. 목록 순서가 선호 순서다."""
+    model: str
+    # 관측치가 쌓이기 전 예상 지연 (예산 비교용)
+    expected_ms: Optional[float] = None
+    # 최근 p95가 이보다 느리면 degraded로 본다
+    degraded_p95_ms: Optional[float] = None
+    # 프롬프트/히스토리가 이보다 크면 이 모델은 건너뛴다
+    max_input_tokens: Optional[int] = None
+    max_history_nodes: Optional[int] = None
+
+
+class RouteDecision(NamedTuple):
+    model: str
+    reason: str   # primary | budget | degraded | input_size | fallback
+
+
+class ModelStats:
+    """모델별 최근 호출의 (지연 초, 성공 여부) 링 버퍼"""
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self._calls: Deque[Tuple[float, bool]] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self._calls.append((seconds, ok))
+
+    def percentile_ms(self, pct: float) -> Optional[float]:
+        latencies = sorted(seconds for seconds, ok in self._calls if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))] * 1000
+
+    def error_rate(self) -> float:
+        if not self._calls:
+            return 0.0
+        return sum(1 for _, ok in self._calls if not ok) / len(self._calls)
+
+
+def load_routes() -> Dict[str, List[ModelRoute]]:
+    if MODEL_ROUTES_PATH:
+        with open(MODEL_ROUTES_PATH, encoding="utf-8") as f:
+            raw = json.load(f)
+    elif MODEL_ROUTES:
+        raw = json.loads(MODEL_ROUTES)
+    else:
+        raw = DEFAULT_ROUTES
+    return {
+        operation: [ModelRoute.model_validate(candidate) for candidate in candidates]
+        for operation, candidates in raw.items()
+    }
+
+
+class ModelRouter:
+    """
+    요청마다 operation의 후보 모델 중 하나를 고른다.
+    선호 순서대로 보면서 입력 크기 제한, degraded 여부(최근 오류율/p95), 클라이언트 지연 예산을
+    모두 통과하는 첫 모델을 쓰고, 아무것도 통과하지 못하면 예상 지연이 가장 짧은 모델로 간다.
+    """
+
+    def __init__(
+        self,
+        routes: Optional[Dict[str, List[ModelRoute]]] = None,
+        window: int = ROUTER_WINDOW,
+        min_samples: int = ROUTER_MIN_SAMPLES,
+        degraded_error_rate: float = ROUTER_DEGRADED_ERROR_RATE,
+    ):
+        self.routes = routes if routes is not None else load_routes()
+        self.window = window
+        self.min_samples = min_samples
+        self.degraded_error_rate = degraded_error_rate
+        self.stats: Dict[str, ModelStats] = {}
+        self.decisions: Dict[Tuple[str, str, str], int] = {}
+
+    def _stats(self, model: str) -> ModelStats:
+        stats = self.stats.get(model)
+        if stats is None:
+            stats = self.stats[model] = ModelStats(self.window)
+        return stats
+
+    def record(self, model: str, seconds: float, ok: bool = True) -> None:
+        self._stats(model).record(seconds, ok)
+
+    def predicted_ms(self, candidate: ModelRoute) -> Optional[float]:
+        stats = self.stats.get(candidate.model)
+        if stats is not None and len(stats) >= self.min_samples:
+            observed = stats.percentile_ms(90)
+            if observed is not None:
+                return observed
+        return candidate.expected_ms
+
+    def is_degraded(self, candidate: ModelRoute) -> bool:
+        stats = self.stats.get(candidate.model)
+        if stats is None or len(stats) < self.min_samples:
+            return False
+        if stats.error_rate() >= self.degraded_error_rate:
+            return True
+        if candidate.degraded_p95_ms is not None:
+            p95 = stats.percentile_ms(95)
+            return p95 is not None and p95 > candidate.degraded_p95_ms
+        return False
+
+    def route(
+        self,
+        operation: str,
+        default_model: str,
+        input_tokens: int = 0,
+        history_nodes: int = 0,
+        budget_ms: Optional[float] = None,
+    ) -> RouteDecision:
+        candidates = self.routes.get(operation)
+        if not candidates:
+            return self._decide(operation, RouteDecision(default_model, "primary"))
+
+        skipped_reason = None
+        for candidate in candidates:
+            if (candidate.max_input_tokens is not None and input_tokens > candidate.max_input_tokens) or (
+                candidate.max_history_nodes is not None and history_nodes > candidate.max_history_nodes
+            ):
+                skipped_reason = skipped_reason or "input_size"
+                continue
+            if self.is_degraded(candidate):
+                skipped_reason = skipped_reason or "degraded"
+                continue
+            predicted = self.predicted_ms(candidate)
+            if budget_ms is not None and predicted is not None and predicted > budget_ms:
+                skipped_reason = skipped_reason or "budget"
+                continue
+            return self._decide(operation, RouteDecision(candidate.model, skipped_reason or "primary"))
+
+        fastest = min(candidates, key=lambda c: self.predicted_ms(c) or float("inf"))
+        return self._decide(operation, RouteDecision(fastest.model, "fallback"))
+
+    def _decide(self, operation: str, decision: RouteDecision) -> RouteDecision:
+        key = (operation, decision.model, decision.reason)
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+        metrics.inc("thinking_model_routes_total", operation=operation, model=decision.model, reason=decision.reason)
+        return decision
+
+    def timed(self, model: str) -> "RouteTimer":
+        return RouteTimer(self, model)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "models": {
+                model: {
+                    "samples": len(stats),
+                    "p50_ms": stats.percentile_ms(50),
+                    "p95_ms": stats.percentile_ms(95),
+                    "error_rate": round(stats.error_rate(), 4),
+                }
+                for model, stats in self.stats.items()
+            },
+            "decisions": [
+                {"operation": op, "model": model, "reason": reason, "count": count}
+                for (op, model, reason), count in self.decisions.items()
+            ],
+        }
+
+
+class RouteTimer:
+    """with router.timed(model): ... — 업스트림 호출 지연/성공 여부를 모델 통계에 기록"""
+    __slots__ = ("router", "model", "started")
+
+    def __init__(self, router: ModelRouter, model: str):
+        self.router = router
+        self.model = model
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 취소(클라이언트 이탈)는 모델 상태와 무관하므로 기록하지 않는다
+        if exc_type is None or issubclass(exc_type, Exception):
+            self.router.record(self.model, time.perf_counter() - self.started, ok=exc_type is None)
+        return False
@@ -0,0 +1,58 @@
+import hashlib
+import json
+from typing import Any, Dict, List, NamedTuple, Type
+from openai.lib._pydantic import to_strict_json_schema
+from pydantic import BaseModel
+
+
+class ResponseSchema(NamedTuple):
+    """structured output 하나의 미리 만든 산출물"""
+    model: Type[BaseModel]
+    # chat.completions.create(response_format=...)에 그대로 넘기는 strict JSON schema 파라미터
+    response_format: Dict[str, Any]
+    # 캐시 키용 지문 (실제로 업스트림에 보내는 스키마 기준)
+    fingerprint: str
+
+
+def build_response_schema(model: Type[BaseModel]) -> ResponseSchema:
+    """strict 모드 규칙(모든 필드 required, additionalProperties=false)을 만족하지 않으면 여기서 실패한다."""
+    schema = to_strict_json_schema(model)
+    serialized = json.dumps(schema, sort_keys=True, ensure_ascii=False)
+    return ResponseSchema(
+        model=model,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": model.__name__, "schema": schema, "strict": True},
+        },
+        fingerprint=f"{model.__name__}:{hashlib.sha256(serialized.encode()).hexdigest()[:16]}",
+    )
+
+
+class SchemaRegistry:
+    """
+    응답 스키마를 모듈 import 시점에 한 번 만들어 두고 호출마다 재사용한다.
+    등록되지 않은 모델이 들어오면 그 자리에서 만들어 등록한다 (첫 호출만 비용을 낸다).
+    """
+
+    def __init__(self):
+        self._schemas: Dict[Type[BaseModel], ResponseSchema] = {}
+
+    def register(self, *models: Type[BaseModel]) -> None:
+        for model in models:
+            if model not in self._schemas:
+                self._schemas[model] = build_response_schema(model)
+
+    def get(self, model: Type[BaseModel]) -> ResponseSchema:
+        schema = self._schemas.get(model)
+        if schema is None:
+            schema = self._schemas[model] = build_response_schema(model)
+        return schema
+
+    def __contains__(self, model: Type[BaseModel]) -> bool:
+        return model in self._schemas
+
+    def names(self) -> List[str]:
+        return [model.__name__ for model in self._schemas]
+
+
+response_schemas = SchemaRegistry()
@@ -0,0 +1,87 @@
+import json
+import os
+from typing import Any, Callable, Dict, Type
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # 선택 의존성: 없으면 표준 json으로
+    orjson = None
+
+# --- Response Serialization Configuration ---
+# 1이면 엔드포인트가 만든 (이미 검증된) 모델을 response_model로 다시 검증하지 않고 바로 JSON으로 쓴다
+FAST_RESPONSES = os.getenv("FAST_RESPONSES", "1") == "1"
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """orjson이 있으면 orjson으로, 없으면 표준 json (UTF-8 그대로, 공백 없이)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode()
+
+
+def loads(data: bytes) -> Any:
+    # orjson.JSONDecodeError는 json.JSONDecodeError의 하위 클래스라 FastAPI의 422 처리가 그대로 동작한다
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+
+class FastJSONRoute(APIRoute):
+    """요청 본문 JSON을 orjson으로 디코딩하는 라우트 (큰 history에서는 디코딩이 검증보다 비싸다)"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def prevalidated(response_model: Type[BaseModel], payload: Dict[str, Any]):
+    """
+    payload가 이미 검증된 모델(Node/Edge 등)로 만든 dict일 때 response_model 재검증을 건너뛴다.
+    model_construct로 감싼 뒤 pydantic-core 직렬화기로 바로 bytes를 만든다.
+    FAST_RESPONSES가 꺼져 있으면 payload를 그대로 돌려줘 FastAPI의 기본 검증/인코딩을 탄다.
+    """
+    if not FAST_RESPONSES:
+        return payload
+    model = response_model.model_construct(**payload)
+    # 중첩 필드에 dict가 섞여 있어도(예: 배치 items) 그대로 직렬화한다
+    body = response_model.__pydantic_serializer__.to_json(model, warnings=False)
+    return Response(content=body, media_type="application/json")
+
+
+def raw_json(payload: Any):
+    """검증할 것이 없는 dict/list 응답 (예: 세션 노드 원본)을 빠른 인코더로"""
+    if not FAST_RESPONSES:
+        return payload
+    return FastJSONResponse(payload)
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from itertools import islice
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from .layout import LayoutEngine
+from .models import Node, Edge
+from .retrieval import SimilarityIndex, estimate_tokens
+
+# --- Session Store Configuration ---
+# memory | sqlite
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+# 마지막으로 쓰인 뒤 메모리에 남겨 두는 시간(초)과 최대 세션 수 (넘치면 오래 안 쓴 것부터 버린다)
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+
+
+def parse_position(position: Any) -> Tuple[Optional[float], Optional[float]]:
+    """{"x", "y"}가 유한한 숫자일 때만 위치로 본다. 아니면 (None, None) — 위치 없이 온 노드처럼 밴드의 빈 자리에 둔다."""
+    if not isinstance(position, dict):
+        return None, None
+    try:
+        x, y = float(position["x"]), float(position["y"])
+    except (KeyError, TypeError, ValueError):
+        return None, None
+    if not (math.isfinite(x) and math.isfinite(y)):
+        return None, None
+    return x, y
+
+
+class HistoryNode:
+    """
+    클라이언트가 보낸 history 노드를 한 번만 파싱해 둔 표현.
+    프롬프트 문맥/인덱스/레이아웃이 쓰는 필드만 꺼내 두고, 원본 dict는 세션 왕복용으로만 들고 있다.
+    """
+    __slots__ = ("id", "title", "content", "category", "phase", "x", "y", "raw")
+
+    def __init__(self, node: Dict[str, Any]):
+        data = node.get("data") or {}
+        title = data.get("title", data.get("label", ""))
+        content = data.get("content", "")
+        self.id = node.get("id")
+        self.title = title if isinstance(title, str) else None
+        self.content = content if isinstance(content, str) else str(content)
+        self.category = data.get("category", "")
+        self.phase = data.get("phase", "")
+        self.x, self.y = parse_position(node.get("position"))
+        self.raw = node
+
+    @property
+    def text(self) -> str:
+        """유사도 인덱스에 넣는 텍스트"""
+        return f"{self.title or ''} {self.content}"
+
+    @property
+    def context_line(self) -> str:
+        return f"- ID: {self.id or 'unknown'} | [{self.phase}/{self.category}] {self.title if self.title is not None else '(unknown)'}"
+
+
+class GraphSession:
+    """
+    한 캔버스의 서버측 그래프 상태.
+    노드가 추가될 때마다 레이아웃 점유, ID 인덱스, 히스토리 문맥을 증분 갱신하므로
+    요청마다 전체 history를 다시 훑을 필요가 없다.
+    """
+
+    def __init__(self, session_id: Optional[str] = None, version: int = 0):
+        self.session_id = session_id
+        self.version = version
+        self.nodes: Dict[str, HistoryNode] = {}      # id → 파싱된 history 노드 (삽입 순서 유지)
+        self.edges: Dict[str, Dict[str, Any]] = {}
+        self.layout = LayoutEngine()                 # 실제 위치 기반 점유 인덱스
+        self.last_id_by_category: Dict[str, str] = {}
+        self._context_lines: Dict[str, str] = {}
+        self._context: Optional[str] = None
+        self._index: Optional[SimilarityIndex] = None
+        # 인덱스 행 순서의 category/phase (로컬 cross-connection 점수용)
+        self._categories: List[str] = []
+        self._phases: List[str] = []
+        self._facets: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @classmethod
+    def from_history(cls, history: List[Dict[str, Any]], edges: Optional[List[Dict[str, Any]]] = None) -> "GraphSession":
+        """요청에 실려 온 history로 일회용 그래프를 만든다 (세션 없이 호출할 때)"""
+        graph = cls()
+        for node in history:
+            graph.add_history_node(node)
+        for edge in edges or []:
+            graph.edges[edge.get("id")] = edge
+        return graph
+
+    # ── 조회 ──
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def existing_ids(self):
+        return self.nodes.keys()
+
+    @property
+    def last_node_id(self) -> Optional[str]:
+        return next(reversed(self.nodes), None)
+
+    def history_context(self) -> str:
+        if not self._context_lines:
+            return "기존 노드 없음."
+        if self._context is None:
+            self._context = "\n".join(self._context_lines.values())
+        return self._context
+
+    @property
+    def similarity_index(self) -> SimilarityIndex:
+        """처음 필요할 때 한 번 만들고, 이후로는 노드 추가 시 증분 갱신"""
+        if self._index is None:
+            self._index = SimilarityIndex()
+            self._index.add_many(list(self.nodes), [node.text for node in self.nodes.values()])
+            self._categories = [node.category for node in self.nodes.values()]
+            self._phases = [node.phase for node in self.nodes.values()]
+            self._facets = None
+        return self._index
+
+    def node_facets(self) -> Tuple[np.ndarray, np.ndarray]:
+        """유사도 인덱스 행 순서의 (category, phase) 배열"""
+        self.similarity_index  # 인덱스가 아직 없으면 만들면서 facet 목록도 채운다
+        if self._facets is None:
+            self._facets = (np.array(self._categories, dtype=str), np.array(self._phases, dtype=str))
+        return self._facets
+
+    def pruned_history_context(self, query: str, top_k: int, recent: int, token_budget: int) -> str:
+        """
+        query와 관련도가 높은 top-k 노드 + 최근 노드만 토큰 예산 안에서 골라 문맥을 만든다.
+        전체 문맥이 예산 안에 들어오면 전체를 그대로 쓴다.
+        """
+        full = self.history_context()
+        if not self._context_lines or estimate_tokens(full) <= token_budget:
+            return full
+
+        index = self.similarity_index
+        candidates = list(islice(reversed(self.nodes), recent))
+        candidates += [node_id for node_id, _ in index.query(query, top_k)]
+
+        selected = []
+        seen = set()
+        used = 0
+        for node_id in candidates:
+            if node_id in seen:
+                continue
+            seen.add(node_id)
+            line = self._context_lines[node_id]
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                break
+            selected.append(node_id)
+            used += cost
+
+        selected.sort(key=index.row)
+        lines = [self._context_lines[node_id] for node_id in selected]
+        omitted = len(self.nodes) - len(selected)
+        if omitted:
+            lines.append(f"(관련도가 낮은 기존 노드 {omitted}개는 생략됨)")
+        return "\n".join(lines)
+
+    # ── 갱신 ──
+    def add_history_node(self, node: Dict[str, Any]) -> None:
+        parsed = HistoryNode(node)
+        node_id = parsed.id
+        self.nodes[node_id] = parsed
+        self._context_lines[node_id] = parsed.context_line
+        self._context = None
+        if parsed.x is not None:
+            self.layout.occupy(node_id, parsed.x, parsed.y)
+        elif parsed.phase and parsed.category:
+            # 위치 없이 온 노드는 밴드의 다음 빈 자리를 차지한 것으로 본다
+            self.layout.place(parsed.phase, parsed.category, node_id)
+        if parsed.category:
+            self.last_id_by_category[parsed.category] = node_id
+        if self._index is not None:
+            self._index.add(node_id, parsed.text)
+            row = self._index.row(node_id)
+            if row == len(self._categories):
+                self._categories.append(parsed.category)
+                self._phases.append(parsed.phase)
+            else:
+                self._categories[row], self._phases[row] = parsed.category, parsed.phase
+            self._facets = None
+
+    def add_nodes(self, nodes: List[Node], edges: List[Edge]) -> None:
+        """
+        서버가 만든 노드/엣지를 그래프에 반영한다.
+        레이아웃 점유는 배치 시점(layout.place)에 이미 등록되어 있다.
+        AI 제안 노드는 캔버스가 아니라 제안 패널로 가므로 그래프에 넣지 않는다.
+        """
+        for node in nodes:
+            if node.data.is_ai_generated:
+                continue
+            self.add_history_node({
+                "id": node.id,
+                "data": {
+                    "title": node.data.label,
+                    "content": node.data.content,
+                    "category": node.data.category,
+                    "phase": node.data.phase,
+                },
+                "position": node.position,
+            })
+        for edge in edges:
+            if edge.id.startswith("e-suggest-"):
+                continue
+            self.edges[edge.id] = edge.model_dump()
+        self.version += 1
+
+    def replace(self, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]) -> None:
+        """클라이언트 캔버스 전체로 상태를 다시 맞춘다 (드래그/삭제 등 동기화)"""
+        self.nodes.clear()
+        self.edges.clear()
+        self.layout = LayoutEngine()
+        self.last_id_by_category.clear()
+        self._context_lines.clear()
+        self._context = None
+        self._index = None
+        self._facets = None
+        for node in nodes:
+            self.add_history_node(node)
+        for edge in edges:
+            self.edges[edge.get("id")] = edge
+        self.version += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "version": self.version,
+            "nodes": [node.raw for node in self.nodes.values()],
+            "edges": list(self.edges.values()),
+        }
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "GraphSession":
+        graph = cls.from_history(payload.get("nodes", []), payload.get("edges", []))
+        graph.session_id = payload["session_id"]
+        graph.version = payload.get("version", 0)
+        return graph
+
+
+class InMemorySessionStore:
+    """세션을 마지막 사용 순서로 들고 있다가 TTL이 지났거나 max_sessions를 넘으면 오래 안 쓴 것부터 버린다."""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Tuple[float, GraphSession]]" = OrderedDict()  # id → (마지막 사용, 세션)
+
+    def _remember(self, session: GraphSession) -> None:
+        self._sessions[session.session_id] = (time.monotonic(), session)
+        self._sessions.move_to_end(session.session_id)
+        self._evict()
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            session_id, (touched, _) = next(iter(self._sessions.items()))
+            if touched > cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def create(self, nodes: Optional[List[Dict[str, Any]]] = None, edges: Optional[List[Dict[str, Any]]] = None) -> GraphSession:
+        """새 세션을 등록한다 (영속 저장은 호출한 쪽이 save/save_async로)"""
+        session = GraphSession.from_history(nodes or [], edges or [])
+        session.session_id = str(uuid.uuid4())
+        self._remember(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[GraphSession]:
+        self._evict()
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        session = entry[1]
+        self._remember(session)
+        return session
+
+    def save(self, session: GraphSession) -> None:
+        pass
+
+    async def save_async(self, session: GraphSession) -> None:
+        """이벤트 루프에서 부르는 save (쓰기가 있는 저장소는 루프를 막지 않도록 스레드에서 쓴다)"""
+        self.save(session)
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+
+class SQLiteSessionStore(InMemorySessionStore):
+    """메모리 캐시 + SQLite write-through. 프로세스를 재시작해도, 메모리에서 밀려나도 세션이 남는다."""
+
+    def __init__(self, path: str = SESSION_DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS graph_sessions ("
+            "session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[GraphSession]:
+        session = super().get(session_id)
+        if session is not None:
+            return session
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM graph_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        session = GraphSession.from_dict(json.loads(row[0]))
+        self._remember(session)
+        return session
+
+    def save(self, session: GraphSession) -> None:
+        self._write(session.to_dict())
+
+    async def save_async(self, session: GraphSession) -> None:
+        # 스냅샷(노드/엣지 목록 복사)만 루프에서 뜨고, 직렬화와 SQLite 쓰기는 스레드에서 한다
+        await asyncio.to_thread(self._write, session.to_dict())
+
+    def _write(self, snapshot: Dict[str, Any]) -> None:
+        payload = json.dumps(snapshot, ensure_ascii=False)
+        with self._lock:
+            # 스레드 쓰기는 순서가 바뀔 수 있으므로 더 오래된 버전이 새 버전을 덮어쓰지 않게 한다
+            self._conn.execute(
+                "INSERT INTO graph_sessions (session_id, version, payload) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET version = excluded.version, payload = excluded.payload "
+                "WHERE excluded.version >= graph_sessions.version",
+                (snapshot["session_id"], snapshot["version"], payload),
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> bool:
+        super().delete(session_id)
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM graph_sessions WHERE session_id = ?", (session_id,)
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+
+def create_session_store() -> InMemorySessionStore:
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore(SESSION_DB_PATH)
+    return InMemorySessionStore()
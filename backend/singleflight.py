@@ -0,0 +1,75 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# --- Single-flight Configuration ---
+# 같은 요청(모델 + 정규화된 프롬프트 + 스키마)이 동시에 들어오면 업스트림 호출을 하나로 합친다
+LLM_SINGLEFLIGHT = os.getenv("LLM_SINGLEFLIGHT", "1") == "1"
+
+
+class SingleFlight:
+    """
+    키별로 진행 중인 업스트림 호출을 하나만 유지한다.
+    같은 키로 뒤늦게 들어온 호출은 새로 요청하지 않고 진행 중인 호출의 결과를 기다린다.
+    업스트림 호출은 별도 태스크로 돌리므로 먼저 온 클라이언트가 끊겨도 기다리는 쪽은 영향받지 않는다.
+    기다리는 쪽이 모두 떠나면(취소되면) 결과를 받을 곳이 없으므로 업스트림 호출도 취소한다.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.leaders = 0     # 실제로 업스트림까지 나간 호출 수
+        self.coalesced = 0   # 진행 중인 호출에 합류한 호출 수
+        self.abandoned = 0   # 기다리는 쪽이 모두 떠나 취소한 업스트림 호출 수
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Optional[str], fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(결과, 다른 호출의 결과를 공유받았는지)"""
+        if key is None:
+            return await fn(), False
+
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await self._wait(key, task), True
+
+        task = asyncio.get_running_loop().create_task(fn())
+        self._calls[key] = task
+        self._waiters[task] = 0
+        self.leaders += 1
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return await self._wait(key, task), False
+
+    async def _wait(self, key: str, task: asyncio.Task) -> Any:
+        self._waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+                if self._waiters[task] == 0 and not task.done():
+                    # 마지막으로 기다리던 쪽이 취소됨: 새 호출이 취소 중인 태스크에 합류하지 않도록 먼저 뺀다
+                    if self._calls.get(key) is task:
+                        del self._calls[key]
+                    task.cancel()
+                    self.abandoned += 1
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        self._waiters.pop(task, None)
+        # 기다리던 쪽이 모두 취소된 경우에도 "exception was never retrieved" 경고가 나지 않도록
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.coalesced
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._calls),
+            "coalesced_rate": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
@@ -0,0 +1,63 @@
+import json
+from typing import Any, Dict, List
+
+
+class JsonArrayItemParser:
+    """
+    스트리밍되는 JSON 텍스트에서 최상위 객체의 특정 배열(key) 안 원소 객체가
+    닫히는 순간 그 객체를 꺼내주는 증분 파서.
+
+    parser = JsonArrayItemParser("user_nodes")
+    for delta in stream:
+        for item in parser.feed(delta):   # {"label": ..., ...}
+            ...
+    parser.text  # 지금까지 받은 전체 JSON 텍스트
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.text = ""
+        self._pos = 0             # 다음에 스캔할 위치
+        self._depth = 0           # 현재 중첩 깊이 ({ 또는 [)
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_top_string = None  # 최상위 객체에서 마지막으로 끝난 문자열 (= 배열 직전의 key)
+        self._in_target = False       # 대상 배열 안에 있는지
+        self._item_start = -1
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        items = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_top_string = text[self._string_start + 1:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._last_top_string == self.key:
+                    self._in_target = True
+                elif ch == "{" and self._depth == 3 and self._in_target:
+                    self._item_start = i
+            elif ch in "}]":
+                if ch == "}" and self._depth == 3 and self._in_target and self._item_start >= 0:
+                    items.append(json.loads(text[self._item_start:i + 1]))
+                    self._item_start = -1
+                elif ch == "]" and self._depth == 2:
+                    self._in_target = False
+                self._depth -= 1
+        self._pos = len(text)
+        return items
@@ -0,0 +1,156 @@
+"""
+API 부하 벤치마크 (완전 오프라인).
+
+fake LLM 프로바이더로 /analyze, /chat, /chat-to-nodes를 동시성·히스토리 크기별로 호출하고
+처리량과 p50/p95/p99 지연을 보고한다. 네트워크 없이 ASGI 앱을 프로세스 안에서 직접 호출한다.
+
+    python -m benchmarks.bench_api --history 10,100,1000,5000 --concurrency 1,16,64
+    python -m benchmarks.bench_api --latency lognormal:800:0.4 --requests 500
+
+--latency 0(기본)이면 순수 백엔드 오버헤드를, 분포를 주면 실제 LLM 지연 아래에서의 동작을 잰다.
+--output-ms는 출력 토큰당 생성 시간을 더한다 (긴 JSON을 한 번에 받는 호출이 느려지는 것을 흉내 낸다).
+--pipeline은 /analyze를 추출 → (제안 ‖ 연결) 단계 호출로 보낸다. 예: 한 번 호출과 파이프라인 비교
+
+    python -m benchmarks.bench_api --endpoints /analyze --latency fixed:300 --output-ms 15 --concurrency 1
+    python -m benchmarks.bench_api --endpoints /analyze --latency fixed:300 --output-ms 15 --concurrency 1 --pipeline
+/chat에는 그래프가 없으므로 히스토리 크기를 이전 대화 메시지 수로 쓴다.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import List, Dict, Any, Callable
+
+os.environ["LLM_PROVIDER"] = "fake"
+
+import httpx
+import numpy as np
+from backend.main import app, agent
+from backend.providers import FakeProvider
+
+PHASES = ["Problem", "Solution"]
+CATEGORIES = ["Why", "Who", "What", "How", "When", "Where"]
+WORDS = ["사용자", "피곤", "아침", "습관", "앱", "알림", "팀", "협업", "비용", "시간", "학생", "공간", "기록", "데이터", "커뮤니티"]
+
+
+def make_history(size: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": f"h{i}",
+            "data": {
+                "title": " ".join(rng.choices(WORDS, k=3)),
+                "content": " ".join(rng.choices(WORDS, k=10)),
+                "category": rng.choice(CATEGORIES),
+                "phase": rng.choice(PHASES),
+            },
+            "position": {"x": rng.uniform(-5000, 5000), "y": rng.uniform(0, 3000)},
+        }
+        for i in range(size)
+    ]
+
+
+def make_messages(size: int, rng: random.Random) -> List[Dict[str, str]]:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": " ".join(rng.choices(WORDS, k=20))}
+        for i in range(size)
+    ]
+
+
+def payload_factory(endpoint: str, size: int, rng: random.Random) -> Callable[[int], Dict[str, Any]]:
+    """요청마다 텍스트를 바꿔 캐시/single-flight에 걸리지 않게 한다"""
+    suggestion = {
+        "suggestion_title": "습관 앱 만들기",
+        "suggestion_content": "아침 습관을 기록하는 앱",
+        "suggestion_category": "How",
+        "suggestion_phase": "Solution",
+    }
+    if endpoint == "/analyze":
+        history = make_history(size, rng)
+        return lambda i: {"text": f"{' '.join(rng.choices(WORDS, k=8))} #{i}", "history": history, "bypass_cache": True}
+    if endpoint == "/chat":
+        messages = make_messages(size, rng)
+        return lambda i: {**suggestion, "messages": messages, "user_message": f"다음 단계는? #{i}", "bypass_cache": True}
+    if endpoint == "/chat-to-nodes":
+        history = make_history(size, rng)
+        messages = make_messages(6, rng)
+        return lambda i: {
+            **suggestion,
+            "messages": messages + [{"role": "user", "content": f"정리해줘 #{i}"}],
+            "existing_nodes": history,
+            "bypass_cache": True,
+        }
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+async def run_scenario(client: httpx.AsyncClient, endpoint: str, make_payload, requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            payload = make_payload(index)
+            started = time.perf_counter()
+            response = await client.post(endpoint, json=payload)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50": p50,
+        "p95": p95,
+        "p99": p99,
+    }
+
+
+async def main_async(args) -> None:
+    agent.provider = FakeProvider(latency=args.latency, seed=args.seed, output_ms=args.output_ms)
+    agent.analysis_pipeline = args.pipeline
+    rng = random.Random(args.seed)
+    transport = httpx.ASGITransport(app=app)
+
+    print(f"latency={args.latency} output_ms={args.output_ms} pipeline={args.pipeline} requests/scenario={args.requests}")
+    print(f"{'endpoint':<15}{'history':>8}{'conc':>6}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for endpoint in args.endpoints.split(","):
+            for size in [int(s) for s in args.history.split(",")]:
+                make_payload = payload_factory(endpoint, size, rng)
+                # 워밍업 (스키마/인덱스 초기화 비용 제외)
+                await client.post(endpoint, json=make_payload(-1))
+                for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                    r = await run_scenario(client, endpoint, make_payload, args.requests, concurrency)
+                    print(
+                        f"{endpoint:<15}{size:>8}{concurrency:>6}{r['errors']:>8}{r['rps']:>10.1f}"
+                        f"{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}"
+                    )
+    if agent.compactor is not None:
+        await agent.compactor.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoints", default="/analyze,/chat,/chat-to-nodes")
+    parser.add_argument("--history", default="10,100,1000,5000", help="히스토리 노드 수 (쉼표 구분)")
+    parser.add_argument("--concurrency", default="1,16,64", help="동시 요청 수 (쉼표 구분)")
+    parser.add_argument("--requests", type=int, default=100, help="시나리오별 요청 수")
+    parser.add_argument("--latency", default="0", help="fake LLM 지연 분포 (예: fixed:500, lognormal:800:0.4)")
+    parser.add_argument("--output-ms", type=float, default=0.0, help="fake LLM 출력 토큰당 생성 시간 (ms)")
+    parser.add_argument("--pipeline", action="store_true", help="/analyze를 추출 → (제안 ‖ 연결) 파이프라인으로")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
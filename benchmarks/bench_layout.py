@@ -0,0 +1,58 @@
+"""
+LayoutEngine 배치 벤치마크.
+
+    python -m benchmarks.bench_layout --nodes 20000
+"""
+import argparse
+import random
+import time
+from backend.layout import LayoutEngine, CELL_W, CELL_H
+
+PHASES = ["Problem", "Solution"]
+CATEGORIES = ["Why", "Who", "What", "How", "When", "Where"]
+
+
+def check_no_overlap(engine: LayoutEngine) -> int:
+    """그리드를 다시 훑어 겹치는 쌍의 수를 센다 (0이어야 함)"""
+    overlaps = 0
+    for node_id, (x, y) in list(engine.positions.items()):
+        engine.release(node_id)
+        if not engine.is_free(x, y):
+            overlaps += 1
+        engine.occupy(node_id, x, y)
+    return overlaps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=10000, help="새로 배치할 노드 수")
+    parser.add_argument("--existing", type=int, default=2000, help="사용자가 임의 위치에 둔 기존 노드 수")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engine = LayoutEngine()
+
+    # 드래그된 노드처럼 임의 위치에 흩어진 기존 노드 (겹치지 않는 것만)
+    started = time.perf_counter()
+    for i in range(args.existing):
+        x = rng.uniform(-20000, 20000)
+        y = rng.uniform(-2000, 6000)
+        if engine.is_free(x, y):
+            engine.occupy(f"existing-{i}", x, y)
+    preload_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(args.nodes):
+        engine.place(rng.choice(PHASES), rng.choice(CATEGORIES), f"new-{i}")
+    place_s = time.perf_counter() - started
+
+    print(f"existing nodes : {len(engine) - args.nodes} (preload {preload_s * 1000:.1f} ms)")
+    print(f"placed nodes   : {args.nodes}")
+    print(f"total          : {place_s * 1000:.1f} ms")
+    print(f"per placement  : {place_s / args.nodes * 1e6:.2f} us")
+    print(f"overlaps       : {check_no_overlap(engine)} (min gap {CELL_W}x{CELL_H})")
+
+
+if __name__ == "__main__":
+    main()
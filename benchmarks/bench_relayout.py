@@ -0,0 +1,129 @@
+"""
+전체 다시 배치(/layout) 벤치마크.
+
+    python -m benchmarks.bench_relayout --nodes 5000 --edges 20000
+    python -m benchmarks.bench_relayout --nodes 5000 --edges 20000 --warm     # 기존 배치에서 시작
+
+합성 그래프는 최근 노드끼리 주로 연결되고(--local 비율) 나머지는 아무 노드와나 연결된다.
+--warm은 한 번 배치한 캔버스에서 일부 노드를 옮기고(--moved) 위치 없는 새 노드를 붙인 뒤(--added) 다시 배치하는
+시간을 잰다 (사용자가 "정리" 버튼을 다시 누르는 경우).
+  total        layout_graph 한 번의 시간 (--repeat번 중 p50 / 최소)
+  edge/random  엣지 길이 중앙값 / 임의 노드 쌍 거리 중앙값 (작을수록 연결된 노드가 가깝다)
+  in-band      phase x 범위 + category y 줄(밴드 좌표) 안에 놓인 노드 비율 / 가장 가까운 밴드가 자기 밴드인 비율
+  row order    category별 평균 y가 CATEGORY_Y_MAP 순서와 같은지
+  overlaps     겹치는 노드 쌍 수 (0이어야 함)
+  kept         --warm: 위치가 있던 노드가 움직인 거리 중앙값 / p90 (기존 모양을 얼마나 유지하는지)
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from backend.layout import CATEGORY_Y_MAP, PROBLEM_X_RANGE, SOLUTION_X_RANGE, NODE_WIDTH, NODE_HEIGHT, MIN_GAP
+from backend.relayout import layout_graph, band_scale, band_targets, neighbor_pairs
+
+PHASES = ["Problem", "Solution"]
+CATEGORIES = list(CATEGORY_Y_MAP)
+
+
+def make_graph(nodes: int, edges: int, local: float, rng: random.Random) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    graph_nodes = [
+        {"id": f"n{i}", "data": {"category": rng.choice(CATEGORIES), "phase": rng.choice(PHASES)}}
+        for i in range(nodes)
+    ]
+    graph_edges = []
+    for _ in range(edges):
+        a = rng.randrange(nodes)
+        b = (a + rng.randint(1, 50)) % nodes if rng.random() < local else rng.randrange(nodes)
+        graph_edges.append({"source": f"n{a}", "target": f"n{b}"})
+    return graph_nodes, graph_edges
+
+
+def perturb(nodes: List[Dict[str, Any]], positions: Dict[str, Dict[str, float]], moved: float, added: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """배치된 캔버스에서 moved 비율의 노드를 임의로 옮기고, 뒤쪽 added개 노드는 위치 없이 (새로 생긴 노드)"""
+    result = []
+    for index, node in enumerate(nodes):
+        node = dict(node)
+        if index < len(nodes) - added:
+            x, y = positions[node["id"]]["x"], positions[node["id"]]["y"]
+            if rng.random() < moved:
+                x, y = x + rng.uniform(-2000, 2000), y + rng.uniform(-2000, 2000)
+            node["position"] = {"x": x, "y": y}
+        result.append(node)
+    return result
+
+
+def quality(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]], positions: Dict[str, Dict[str, float]], rng: np.random.Generator) -> Dict[str, Any]:
+    pos = np.array([[positions[n["id"]]["x"], positions[n["id"]]["y"]] for n in nodes])
+    row = {n["id"]: i for i, n in enumerate(nodes)}
+    pairs = np.array([[row[e["source"]], row[e["target"]]] for e in edges])
+    edge_length = np.linalg.norm(pos[pairs[:, 0]] - pos[pairs[:, 1]], axis=1)
+    random_pairs = rng.integers(0, len(pos), size=(len(pairs), 2))
+    random_length = np.linalg.norm(pos[random_pairs[:, 0]] - pos[random_pairs[:, 1]], axis=1)
+
+    categories = [n["data"]["category"] for n in nodes]
+    low, high = band_targets([n["data"]["phase"] for n in nodes], categories, band_scale(len(nodes)))
+    in_band = np.all((pos >= low) & (pos <= high), axis=1)
+    # 엄격히 안에 있지 않더라도 가장 가까운 밴드가 자기 밴드인지 (화면에서 줄/열로 읽히는지)
+    rows = np.array(sorted(CATEGORY_Y_MAP.values()), dtype=np.float64) * band_scale(len(nodes))
+    nearest_row = np.abs(pos[:, 1:2] - rows[None, :]).argmin(axis=1)
+    own_row = np.searchsorted(rows, (low[:, 1] + high[:, 1]) / 2)
+    middle = (PROBLEM_X_RANGE[1] + SOLUTION_X_RANGE[0]) / 2 * band_scale(len(nodes))
+    problem = np.array([n["data"]["phase"] == "Problem" for n in nodes])
+    nearest = (nearest_row == own_row) & ((pos[:, 0] < middle) == problem)
+    mean_y = {c: pos[[i for i, cat in enumerate(categories) if cat == c], 1].mean() for c in CATEGORIES}
+
+    i, j = neighbor_pairs(pos, max(NODE_WIDTH, NODE_HEIGHT) + MIN_GAP)
+    delta = np.abs(pos[i] - pos[j])
+    overlaps = int(((delta[:, 0] < NODE_WIDTH + MIN_GAP) & (delta[:, 1] < NODE_HEIGHT + MIN_GAP)).sum()) // 2
+    return {
+        "edge_ratio": float(np.median(edge_length) / np.median(random_length)),
+        "in_band": float(in_band.mean()),
+        "nearest_band": float(nearest.mean()),
+        "row_order": sorted(CATEGORIES, key=mean_y.get) == CATEGORIES,
+        "overlaps": overlaps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=5000)
+    parser.add_argument("--edges", type=int, default=20000)
+    parser.add_argument("--local", type=float, default=0.8, help="최근 50개 노드 안에서 이어지는 엣지 비율")
+    parser.add_argument("--warm", action="store_true", help="기존 배치를 조금 바꾼 뒤 warm start")
+    parser.add_argument("--moved", type=float, default=0.05, help="--warm: 사용자가 옮긴 노드 비율")
+    parser.add_argument("--added", type=int, default=250, help="--warm: 위치 없이 새로 붙은 노드 수")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    nodes, edges = make_graph(args.nodes, args.edges, args.local, rng)
+    if args.warm:
+        nodes = perturb(nodes, layout_graph(nodes, edges, warm_start=False), args.moved, args.added, rng)
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        positions = layout_graph(nodes, edges, warm_start=args.warm)
+        timings.append(time.perf_counter() - started)
+    result = quality(nodes, edges, positions, np.random.default_rng(args.seed))
+    moved = [
+        np.hypot(positions[n["id"]]["x"] - n["position"]["x"], positions[n["id"]]["y"] - n["position"]["y"])
+        for n in nodes if "position" in n
+    ]
+
+    print(f"graph          : {args.nodes} nodes, {args.edges} edges ({'warm' if args.warm else 'cold'} start)")
+    print(f"total          : {statistics.median(timings) * 1000:.1f} ms p50 / {min(timings) * 1000:.1f} ms min")
+    print(f"edge/random    : {result['edge_ratio']:.3f}")
+    print(f"in-band        : {result['in_band'] * 100:.1f}% (nearest band {result['nearest_band'] * 100:.1f}%)")
+    print(f"row order      : {'ok' if result['row_order'] else 'broken'}")
+    print(f"overlaps       : {result['overlaps']} (min gap {NODE_WIDTH + MIN_GAP}x{NODE_HEIGHT + MIN_GAP})")
+    if moved:
+        p50, p90 = np.percentile(moved, [50, 90])
+        print(f"kept           : moved {p50:.0f} p50 / {p90:.0f} p90")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+요청 파싱 / 히스토리 처리 / 응답 직렬화 마이크로벤치마크.
+
+    python -m benchmarks.bench_serialization --nodes 1000,10000,50000
+
+노드 수별로 다음을 잰다 (반복 중 최솟값, ms):
+  request    요청 JSON → AnalysisRequest (FastAPI 기본: json.loads + 검증)
+  req-fast   같은 요청을 serialization.loads로 (orjson이 있으면 FastJSONRoute가 쓰는 경로)
+  history    history → GraphSession (노드당 한 번 파싱)
+  index      유사도 인덱스 생성 + pruned 문맥 조립
+  default    AnalysisResponse 응답: response_model 재검증 후 인코딩 (FastAPI 기본 경로, ASGI 왕복 포함)
+  fast       같은 응답을 prevalidated()로 (재검증 없이 pydantic-core로 바로 bytes)
+  sess-def   SessionResponse 응답 (원본 노드 dict): FastAPI 기본 경로
+  sess-fast  같은 응답을 raw_json()으로 (orjson이 있으면 orjson)
+"""
+import argparse
+import asyncio
+import gc
+import json
+import random
+import time
+import uuid
+from typing import Callable, List
+
+import httpx
+from fastapi import FastAPI
+from backend.models import AnalysisRequest, AnalysisResponse, SessionResponse, Node, NodeData, Edge
+from backend.retrieval import HISTORY_TOP_K, HISTORY_RECENT, HISTORY_TOKEN_BUDGET
+from backend.serialization import loads, prevalidated, raw_json, orjson
+from backend.sessions import GraphSession
+from benchmarks.bench_api import make_history, PHASES, CATEGORIES, WORDS
+
+
+def best_ms(fn: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def make_response(size: int, rng: random.Random) -> dict:
+    nodes = [
+        Node(
+            id=str(uuid.uuid4()),
+            data=NodeData(
+                label=" ".join(rng.choices(WORDS, k=3)),
+                content=" ".join(rng.choices(WORDS, k=10)),
+                category=rng.choice(CATEGORIES),
+                phase=rng.choice(PHASES),
+                is_ai_generated=False,
+            ),
+            position={"x": rng.uniform(-5000, 5000), "y": rng.uniform(0, 3000)},
+        )
+        for _ in range(size)
+    ]
+    edges = [
+        Edge(id=f"e{i}", source=nodes[i].id, target=nodes[i - 1].id, label="관련")
+        for i in range(1, size)
+    ]
+    return {"nodes": nodes, "edges": edges, "model": "gpt-4o-2024-08-06"}
+
+
+def response_app(payload: dict, session: dict) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/default", response_model=AnalysisResponse)
+    def default_endpoint():
+        return dict(payload)
+
+    @app.get("/fast", response_model=AnalysisResponse)
+    def fast_endpoint():
+        return prevalidated(AnalysisResponse, dict(payload))
+
+    @app.get("/session-default", response_model=SessionResponse)
+    def session_default_endpoint():
+        return session
+
+    @app.get("/session-fast", response_model=SessionResponse)
+    def session_fast_endpoint():
+        return raw_json(session)
+
+    return app
+
+
+async def time_endpoint(app: FastAPI, path: str, repeat: int) -> float:
+    timings: List[float] = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get(path)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = await client.get(path)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", default="1000,10000,50000", help="노드 수 (쉼표 구분)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"json backend: {'orjson' if orjson is not None else 'stdlib json'}")
+    print(f"{'nodes':>8}{'request':>10}{'req-fast':>10}{'history':>10}{'index':>10}{'default':>10}{'fast':>10}{'sess-def':>10}{'sess-fast':>10}")
+    for size in [int(n) for n in args.nodes.split(",")]:
+        history = make_history(size, rng)
+        body = json.dumps({"text": "습관 앱", "history": history}, ensure_ascii=False)
+        request_ms = best_ms(lambda: AnalysisRequest.model_validate(json.loads(body)), args.repeat)
+        fast_request_ms = best_ms(lambda: AnalysisRequest.model_validate(loads(body.encode())), args.repeat)
+        history_ms = best_ms(lambda: GraphSession.from_history(history), args.repeat)
+
+        def build_context():
+            graph = GraphSession.from_history(history)
+            graph.pruned_history_context("습관 앱 알림", HISTORY_TOP_K, HISTORY_RECENT, HISTORY_TOKEN_BUDGET)
+        index_ms = best_ms(build_context, args.repeat) - history_ms
+
+        session = {"session_id": "bench", "version": 1, "nodes": history, "edges": []}
+        app = response_app(make_response(size, rng), session)
+        endpoints = ["/default", "/fast", "/session-default", "/session-fast"]
+        served = [asyncio.run(time_endpoint(app, path, args.repeat)) for path in endpoints]
+        print(
+            f"{size:>8}{request_ms:>10.1f}{fast_request_ms:>10.1f}{history_ms:>10.1f}{index_ms:>10.1f}"
+            + "".join(f"{ms:>10.1f}" for ms in served)
+        )
+
+
+if __name__ == "__main__":
+    main()
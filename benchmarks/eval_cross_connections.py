@@ -0,0 +1,133 @@
+"""
+로컬 cross-connection 엔진과 LLM이 고른 연결을 비교하는 오프라인 평가.
+
+    python -m benchmarks.eval_cross_connections --history 10,100,1000,5000 --cases 20
+    python -m benchmarks.eval_cross_connections --cases-file cases.jsonl     # 한 줄에 {"text": ..., "history": [...]}
+    python -m benchmarks.eval_cross_connections --provider openai           # 실제 모델의 연결과 비교 (OPENAI_API_KEY 필요)
+
+같은 그래프/인풋을 LLM 모드로 한 번 분석해(user_nodes + cross_connections) 백엔드처럼 존재하지 않는 ID를 걸러 내고,
+같은 user_nodes에 로컬 엔진을 돌려 두 연결 집합을 비교한다. 기본 fake 프로바이더는 문맥에 나온 ID를 무작위로
+고르므로 일치도 기준선으로만 보고, 품질 비교는 --provider openai나 실제 요청을 모은 --cases-file로 한다.
+
+  llm / local  인풋당 평균 연결 수
+  jaccard      (기존 노드, 새 노드 인덱스) 쌍 집합의 Jaccard 평균 (둘 다 비었으면 1)
+  recall       LLM이 연결한 기존 노드 중 로컬도 연결한 비율
+  cat-llm      연결된 기존 노드의 category가 새 노드와 같은 비율 (LLM)
+  cat-local    같은 비율 (로컬)
+  local-ms     로컬 점수 계산 p50 / p95 (ms, 인덱스는 세션처럼 미리 만들어 둔 상태)
+  out-tok      응답 출력 토큰 추정: cross_connections 포함 → 제외 (local 모드에서 생성하지 않는 양)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from benchmarks.bench_api import make_history, WORDS
+from backend.connections import local_cross_connections
+from backend.logic import ThinkingAgent, AIAnalysisResult, ANALYSIS_MODEL
+from backend.models import CrossConnectionResult
+from backend.providers import create_provider
+from backend.retrieval import estimate_tokens
+from backend.sessions import GraphSession
+
+
+def synthetic_cases(sizes: List[int], cases: int, seed: int) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    rng = random.Random(seed)
+    result = []
+    for size in sizes:
+        history = make_history(size, rng)
+        for _ in range(cases):
+            result.append((" ".join(rng.choices(WORDS, k=8)), history))
+    return result
+
+
+def load_cases(path: str) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    with open(path, encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    return [(case["text"], case.get("history", [])) for case in cases]
+
+
+def pairs(connections: List[CrossConnectionResult]) -> set:
+    return {(c.existing_node_id, c.new_node_index) for c in connections}
+
+
+def category_agreement(graph: GraphSession, result: AIAnalysisResult, connections: List[CrossConnectionResult]) -> List[bool]:
+    return [
+        graph.nodes[c.existing_node_id].category == result.user_nodes[min(c.new_node_index, len(result.user_nodes) - 1)].category
+        for c in connections
+    ]
+
+
+async def evaluate(agent: ThinkingAgent, cases: List[Tuple[str, List[Dict[str, Any]]]], repeat: int) -> Dict[str, Any]:
+    stats = {"llm": [], "local": [], "jaccard": [], "recall": [], "cat_llm": [], "cat_local": [],
+             "local_ms": [], "out_full": [], "out_core": []}
+    for text, history in cases:
+        graph = GraphSession.from_history(history)
+        messages = agent.build_analysis_messages(text, graph)
+        result = await agent._parse_completion(
+            model=ANALYSIS_MODEL, messages=messages, response_format=AIAnalysisResult,
+            use_cache=False, operation="analyze",
+        )
+        llm = [c for c in result.cross_connections if c.existing_node_id in graph.existing_ids]
+        graph.similarity_index  # 세션에서는 인덱스가 이미 있으므로 시간 측정에서 뺀다
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            local = local_cross_connections(graph, result.user_nodes)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        llm_pairs, local_pairs = pairs(llm), pairs(local)
+        union = llm_pairs | local_pairs
+        stats["llm"].append(len(llm))
+        stats["local"].append(len(local))
+        stats["jaccard"].append(len(llm_pairs & local_pairs) / len(union) if union else 1.0)
+        llm_ids = {c.existing_node_id for c in llm}
+        if llm_ids:
+            stats["recall"].append(len(llm_ids & {c.existing_node_id for c in local}) / len(llm_ids))
+        stats["cat_llm"] += category_agreement(graph, result, llm)
+        stats["cat_local"] += category_agreement(graph, result, local)
+        stats["local_ms"].append(min(timings))
+        stats["out_full"].append(estimate_tokens(result.model_dump_json()))
+        stats["out_core"].append(estimate_tokens(result.model_dump_json(exclude={"cross_connections"})))
+    return stats
+
+
+def mean(values: List[float]) -> float:
+    return float(np.mean(values)) if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history", default="10,100,1000,5000", help="합성 그래프의 노드 수 (쉼표 구분)")
+    parser.add_argument("--cases", type=int, default=20, help="그래프 크기별 인풋 수")
+    parser.add_argument("--cases-file", default=None, help="JSONL 평가 세트 (있으면 합성 케이스 대신)")
+    parser.add_argument("--provider", default="fake", help="fake | openai")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    agent = ThinkingAgent(provider=create_provider(os.getenv("OPENAI_API_KEY"), args.provider))
+    agent.cross_connections = "llm"
+    if args.cases_file:
+        groups = {"file": load_cases(args.cases_file)}
+    else:
+        groups = {str(size): synthetic_cases([size], args.cases, args.seed) for size in map(int, args.history.split(","))}
+
+    print(f"{'history':>8}{'cases':>7}{'llm':>6}{'local':>7}{'jaccard':>9}{'recall':>8}{'cat-llm':>9}{'cat-local':>10}{'local-ms':>16}{'out-tok':>14}")
+    for name, cases in groups.items():
+        stats = asyncio.run(evaluate(agent, cases, args.repeat))
+        p50, p95 = np.percentile(stats["local_ms"], [50, 95])
+        print(
+            f"{name:>8}{len(cases):>7}{mean(stats['llm']):>6.2f}{mean(stats['local']):>7.2f}"
+            f"{mean(stats['jaccard']):>9.2f}{mean(stats['recall']):>8.2f}"
+            f"{mean(stats['cat_llm']):>9.2f}{mean(stats['cat_local']):>10.2f}"
+            f"{p50:>8.2f} /{p95:>6.2f}{mean(stats['out_full']):>7.0f} →{mean(stats['out_core']):>5.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+녹화한 LLM 트래픽(cassette)으로 API를 다시 돌려 백엔드 오버헤드와 요청당 메모리 회귀를 잡는 러너.
+
+    LLM_CASSETTE=record LLM_CASSETTE_PATH=corpus.jsonl uvicorn backend.main:app    # 실제 사용으로 녹화
+    python -m benchmarks.replay_cassette --cassette corpus.jsonl --save baseline.json
+    python -m benchmarks.replay_cassette --cassette corpus.jsonl --baseline baseline.json   # 회귀면 exit 1
+    python -m benchmarks.replay_cassette --cassette corpus.jsonl --timing                 # 녹화된 업스트림 지연까지 재현
+
+녹화된 http 요청을 녹화 순서대로 ASGI 앱에 직접 보내고, LLM 호출은 요청 해시로 녹화된 응답을 즉시 돌려준다.
+그래서 --timing 없이 잰 시간은 업스트림을 뺀 순수 백엔드 처리 시간이다. 패스마다 새 에이전트(빈 캐시/체크포인트)로
+시작하므로 녹화 때와 같은 프롬프트가 만들어진다. 세션에 묶인 요청은 세션 없이 보낸다 (그래프가 달라 miss가 날 수 있다).
+
+  reqs       경로별 다시 보낸 요청 수 (녹화 때 200이었던 것만)
+  errors     200이 아닌 응답 수 / misses  녹화에 없던 LLM 호출 수 (프롬프트가 바뀌었다는 뜻)
+  p50 / p95  요청 처리 시간 (ms, --repeat번 중 요청별 최소값의 분포)
+  recorded   녹화 때 실제 업스트림을 포함한 처리 시간 p50 (ms)
+  peak KiB   요청 하나가 처리되는 동안 늘어난 할당 최대치 p50 / max (tracemalloc, 별도 패스)
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ["LLM_CASSETTE"] = ""  # 러너가 직접 replay 프로바이더를 붙인다
+
+import httpx
+import numpy as np
+import backend.main as api
+from backend.cassette import CassetteProvider, load_cassette
+from backend.logic import ThinkingAgent
+
+SESSION_FIELDS = ("session_id", "client_version")
+
+
+def recorded_requests(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    requests = []
+    for entry in entries:
+        if entry.get("type") != "http" or entry.get("status") != 200 or not isinstance(entry.get("body"), dict):
+            continue
+        body = {k: v for k, v in entry["body"].items() if k not in SESSION_FIELDS}
+        requests.append({"path": entry["path"], "body": body, "recorded_ms": entry.get("elapsed_ms")})
+    return requests
+
+
+def fresh_agent(entries: List[Dict[str, Any]], timing: bool) -> CassetteProvider:
+    provider = CassetteProvider(None, "replay", timing=timing, entries=entries)
+    api.agent = ThinkingAgent(provider=provider)
+    return provider
+
+
+async def replay_pass(entries, requests, timing: bool, memory: bool = False) -> Dict[str, Any]:
+    provider = fresh_agent(entries, timing)
+    elapsed, peaks, errors = [], [], 0
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=None) as client:
+        for request in requests:
+            if memory:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            response = await client.post(request["path"], json=request["body"])
+            elapsed.append((time.perf_counter() - started) * 1000)
+            if memory:
+                peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+            if response.status_code != 200:
+                errors += 1
+    if api.agent.compactor is not None:
+        await api.agent.compactor.drain()
+    return {"elapsed": elapsed, "peaks": peaks, "errors": errors, "misses": provider.counts["miss"]}
+
+
+def summarize(requests, elapsed: np.ndarray, peaks: List[float]) -> Dict[str, Dict[str, float]]:
+    by_path: Dict[str, List[int]] = defaultdict(list)
+    for index, request in enumerate(requests):
+        by_path[request["path"]].append(index)
+    result = {}
+    for path, indexes in sorted(by_path.items()):
+        times = elapsed[indexes]
+        recorded = [requests[i]["recorded_ms"] for i in indexes if requests[i]["recorded_ms"] is not None]
+        path_peaks = [peaks[i] for i in indexes]
+        result[path] = {
+            "requests": len(indexes),
+            "p50_ms": float(np.percentile(times, 50)),
+            "p95_ms": float(np.percentile(times, 95)),
+            "recorded_ms": float(np.median(recorded)) if recorded else None,
+            "peak_kib": float(np.median(path_peaks)),
+            "max_peak_kib": float(np.max(path_peaks)),
+        }
+    return result
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float, min_ms: float, min_kib: float) -> List[str]:
+    """기준보다 tolerance 비율 이상, 그리고 절대값으로도 min_* 이상 나빠진 항목 (작은 값의 잡음은 무시)"""
+    regressions = []
+    for path, now in current.items():
+        before = baseline.get(path)
+        if before is None:
+            continue
+        for key, floor, unit in (("p50_ms", min_ms, "ms"), ("p95_ms", min_ms, "ms"), ("peak_kib", min_kib, "KiB")):
+            if now[key] > before[key] * (1 + tolerance) and now[key] - before[key] > floor:
+                regressions.append(f"{path} {key}: {before[key]:.2f} → {now[key]:.2f} {unit} (+{(now[key] / before[key] - 1) * 100:.0f}%)")
+    return regressions
+
+
+async def main_async(args) -> int:
+    entries = load_cassette(args.cassette)
+    requests = recorded_requests(entries)
+    if not requests:
+        print(f"no replayable http requests in {args.cassette}")
+        return 1
+
+    # 처음 한 번은 스키마/인덱스/import 초기화가 섞이므로 버린다
+    await replay_pass(entries, requests, args.timing)
+    runs = [await replay_pass(entries, requests, args.timing) for _ in range(args.repeat)]
+    elapsed = np.min([run["elapsed"] for run in runs], axis=0)
+    tracemalloc.start()
+    memory = await replay_pass(entries, requests, False, memory=True)
+    tracemalloc.stop()
+
+    result = summarize(requests, elapsed, memory["peaks"])
+    llm_calls = sum(1 for e in entries if e.get("type") == "llm")
+    print(f"cassette: {args.cassette} ({len(requests)} requests, {llm_calls} llm calls, timing {'on' if args.timing else 'off'})")
+    print(f"errors {runs[-1]['errors']} / misses {runs[-1]['misses']}")
+    print(f"{'path':<24}{'reqs':>6}{'p50 ms':>10}{'p95 ms':>10}{'recorded':>10}{'peak KiB':>18}")
+    for path, r in result.items():
+        recorded = f"{r['recorded_ms']:.1f}" if r["recorded_ms"] is not None else "-"
+        print(
+            f"{path:<24}{r['requests']:>6}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{recorded:>10}"
+            f"{r['peak_kib']:>10.1f} /{r['max_peak_kib']:>6.0f}"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"cassette": args.cassette, "timing": args.timing, "paths": result}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["paths"]
+        regressions = compare(result, baseline, args.tolerance, args.min_ms, args.min_kib)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance * 100:.0f}%)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cassette", default=os.getenv("LLM_CASSETTE_PATH", "llm_cassette.jsonl"))
+    parser.add_argument("--timing", action="store_true", help="녹화된 업스트림 지연을 재현 (기본은 즉시 응답)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", default=None, help="결과를 기준 파일로 저장")
+    parser.add_argument("--baseline", default=None, help="기준 파일과 비교해 회귀면 exit 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="허용하는 상대 증가 (0.2 = 20%%)")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="이보다 작은 시간 증가는 무시")
+    parser.add_argument("--min-kib", type=float, default=64, help="이보다 작은 메모리 증가는 무시")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,9 @@ export default function ChatDialog({ suggestion, onClose, onAddNodes, existingNo
     const [input, setInput] = useState("");
     const [isLoading, setIsLoading] = useState(false);
     const [isConverting, setIsConverting] = useState(false);
+    // 이미 노드로 만든 메시지 수 — 서버는 같은 conversation_id의 다음 변환에 그 이후 턴만 보낸다
+    const [convertedCount, setConvertedCount] = useState(0);
+    const conversationIdRef = useRef(null);
     const bottomRef = useRef(null);
     const inputRef = useRef(null);
 
@@ -29,6 +32,8 @@ export default function ChatDialog({ suggestion, onClose, onAddNodes, existingNo
         if (!suggestion) return;
         setMessages([]);
         setInput("");
+        setConvertedCount(0);
+        conversationIdRef.current = `${suggestion.id}-${Date.now()}`;
         sendMessage("이 제안에 대해 먼저 설명해줘.", true);
         // eslint-disable-next-line react-hooks/exhaustive-deps
     }, [suggestion?.id]);
@@ -55,12 +60,45 @@ export default function ChatDialog({ suggestion, onClose, onAddNodes, existingNo
                 suggestion_phase: suggestion.phase,
                 messages: historyForApi,
                 user_message: text,
+                conversation_id: conversationIdRef.current,
+                // 첫 턴이면 서버가 미리 생성해 둔 답변을 바로 받을 수 있다
+                suggestion_id: isInitial ? suggestion.id : undefined,
             };
-            const res = await axios.post("http://localhost:8000/chat", payload);
-            setMessages((prev) => [...prev, { role: "assistant", content: res.data.reply }]);
+            // SSE 스트림으로 받아서 토큰이 도착하는 대로 마지막 assistant 메시지에 이어 붙인다
+            const res = await fetch("http://localhost:8000/chat/stream", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify(payload),
+            });
+            if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+            setMessages((prev) => [...prev, { role: "assistant", content: "" }]);
+            setIsLoading(false);
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split("\n\n");
+                buffer = events.pop();
+                for (const raw of events) {
+                    const event = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] ?? "{}");
+                    if (event === "error") throw new Error(data.detail);
+                    if (event !== "delta") continue;
+                    setMessages((prev) => {
+                        const last = prev[prev.length - 1];
+                        return [...prev.slice(0, -1), { ...last, content: last.content + data.content }];
+                    });
+                }
+            }
         } catch (err) {
             setMessages((prev) => [
-                ...prev,
+                // 스트림 도중 실패했으면 비어 있는 assistant 말풍선은 버린다
+                ...prev.filter((m, i) => !(i === prev.length - 1 && m.role === "assistant" && !m.content)),
                 { role: "assistant", content: "죄송합니다, 오류가 발생했습니다. 다시 시도해주세요." },
             ]);
         } finally {
@@ -76,7 +114,7 @@ export default function ChatDialog({ suggestion, onClose, onAddNodes, existingNo
     };
 
     const handleConvertToNodes = async () => {
-        if (messages.length === 0 || isConverting) return;
+        if (messages.length <= convertedCount || isConverting) return;
         setIsConverting(true);
         try {
             const payload = {
@@ -94,10 +132,12 @@ export default function ChatDialog({ suggestion, onClose, onAddNodes, existingNo
                     },
                     position: n.position,
                 })),
+                conversation_id: conversationIdRef.current,
             };
             const res = await axios.post("http://localhost:8000/chat-to-nodes", payload);
             onAddNodes(res.data);
-            onClose();
+            // 다이얼로그는 열어 둔다: 대화를 이어 가다 다시 변환하면 새 턴만 노드가 된다
+            setConvertedCount(res.data.converted_messages ?? messages.length);
         } catch (err) {
             alert("노드 변환에 실패했습니다. 백엔드 상태를 확인해주세요.");
         } finally {
@@ -208,7 +248,7 @@ export default function ChatDialog({ suggestion, onClose, onAddNodes, existingNo
                     {messages.length >= 2 && (
                         <button
                             onClick={handleConvertToNodes}
-                            disabled={isConverting}
+                            disabled={isConverting || messages.length <= convertedCount}
                             className="w-full flex items-center justify-center gap-1.5 py-2 rounded-xl 
                                        bg-gradient-to-r from-indigo-500 to-purple-500 hover:from-indigo-600 hover:to-purple-600
                                        text-white text-xs font-semibold transition-all disabled:opacity-50 shadow-sm"
@@ -221,7 +261,7 @@ export default function ChatDialog({ suggestion, onClose, onAddNodes, existingNo
                             ) : (
                                 <>
                                     <GitBranch className="w-3 h-3" />
-                                    대화를 노드로 만들기
+                                    {convertedCount > 0 ? "새 대화를 노드로 추가" : "대화를 노드로 만들기"}
                                 </>
                             )}
                         </button>
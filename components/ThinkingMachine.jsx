@@ -80,6 +80,7 @@ export default function ThinkingMachine() {
     const [nodes, setNodes, onNodesChange] = useNodesState(INITIAL_NODES);
     const [edges, setEdges, onEdgesChange] = useEdgesState(INITIAL_EDGES);
     const [isAnalyzing, setIsAnalyzing] = useState(false);
+    const [isLayouting, setIsLayouting] = useState(false);
 
     // AI 제안 패널
     const [suggestions, setSuggestions] = useState([]);
@@ -171,7 +172,8 @@ export default function ThinkingMachine() {
             // 제안 노드 → SuggestionPanel
             if (suggestionNodeData) {
                 const newSuggestion = {
-                    id: `suggestion-${Date.now()}`,
+                    // 제안 노드 ID (서버가 채팅 첫 턴을 미리 생성해 두는 키)
+                    id: suggestionNodeData.id,
                     title: suggestionNodeData.data.label,
                     content: suggestionNodeData.data.content,
                     category: suggestionNodeData.data.category,
@@ -214,6 +216,28 @@ export default function ThinkingMachine() {
         }
     };
 
+    // 캔버스 전체를 force-directed로 다시 배치 (현재 위치에서 시작해 모양을 유지)
+    const handleRelayout = async () => {
+        if (nodes.length === 0) return;
+        setIsLayouting(true);
+        try {
+            const response = await axios.post("http://localhost:8000/layout", {
+                nodes: nodes.map((n) => ({
+                    id: n.id,
+                    data: { category: n.data.category, phase: n.data.phase },
+                    position: n.position,
+                })),
+                edges: edges.map((e) => ({ id: e.id, source: e.source, target: e.target })),
+            });
+            const positions = response.data.positions;
+            setNodes((nds) => nds.map((n) => (positions[n.id] ? { ...n, position: positions[n.id] } : n)));
+        } catch (error) {
+            console.error("Failed to relayout:", error);
+        } finally {
+            setIsLayouting(false);
+        }
+    };
+
     return (
         <div className="w-full h-screen relative flex flex-col overflow-hidden bg-slate-50">
             <header className="absolute top-0 left-0 right-0 z-50 p-6 flex justify-between items-center bg-transparent pointer-events-none">
@@ -221,6 +245,13 @@ export default function ThinkingMachine() {
                     Visual Thinking Machine
                 </h1>
                 <div className="flex gap-2 pointer-events-auto">
+                    <button
+                        onClick={handleRelayout}
+                        disabled={isLayouting || nodes.length === 0}
+                        className="px-3 py-1 rounded-full bg-white/50 border border-indigo-100 text-xs text-indigo-800 backdrop-blur-sm shadow-sm hover:bg-white disabled:opacity-50"
+                    >
+                        {isLayouting ? "정리 중..." : "자동 정리"}
+                    </button>
                     <div className="px-3 py-1 rounded-full bg-white/50 border border-indigo-100 text-xs text-indigo-800 backdrop-blur-sm shadow-sm flex items-center gap-1">
                         <span className="w-2 h-2 rounded-full bg-indigo-500 animate-pulse"></span>
                         Autonomous Agent Active
@@ -1,19 +1,912 @@
+import os
+os.environ.setdefault("LLM_PROVIDER", "fake")  # 오프라인 결정적 응답
+
 from fastapi.testclient import TestClient
 from backend.main import app
+from backend.layout import LayoutEngine
+from backend.singleflight import SingleFlight
+from backend.providers import FakeProvider
+from backend.resilience import UpstreamPolicy, CircuitBreaker, UpstreamTimeout
+from backend.routing import ModelRouter, ModelRoute
+from backend.schemas import response_schemas
+from backend.retrieval import hashed_ngram_matrix, hashed_ngram_vector, estimate_tokens
+from backend.retrieval import HISTORY_MODE, HISTORY_TOP_K, HISTORY_RECENT, HISTORY_TOKEN_BUDGET
+from backend.serialization import prevalidated
+from backend.models import AnalysisResponse
+from backend.jobs import JobManager, InMemoryJobStore
+from backend.prefetch import ChatPrefetcher, CHAT_OPENING_MESSAGE
+from backend.connections import local_cross_connections
+from backend.admission import AdmissionController, AdmissionRejected, bind as bind_admission
+from backend.sessions import GraphSession, InMemorySessionStore, SQLiteSessionStore
+from backend.compaction import ConversationCompactor
+from backend.streaming import JsonArrayItemParser
+from backend.cache import LLMCache
+from backend.cassette import CassetteProvider, CassetteMiss, load_cassette
+from backend.models import UserNode, ChatMessage
+import json
+import numpy as np
+from backend.logic import AIAnalysisResult, ChatNodeResult, CHAT_MODEL
+import backend.main as main
+import asyncio
+import sqlite3
+import time
+import pytest
 
 client = TestClient(app)
 
+
+@pytest.fixture(autouse=True)
+def api_agent():
+    """엔드포인트가 쓰는 main.agent를 테스트마다 새 에이전트로 바꾸고 끝나면 되돌린다 (캐시/라우터/브레이커 상태가 다음 테스트로 새지 않도록)"""
+    saved = main.agent
+    main.agent = main.ThinkingAgent(provider=FakeProvider())
+    try:
+        yield main.agent
+    finally:
+        main.agent = saved
+
+
 def test_analyze_endpoint():
-    response = client.post("/analyze", json={
+    history = [{"id": "n1", "data": {"title": "Tired people", "category": "Who", "phase": "Problem"}}]
+    request = {"text": "I want to build a better todo app", "history": history, "bypass_cache": True}
+    response = client.post("/analyze", json=request)
+    assert response.status_code == 200
+
+    body = response.json()
+    assert body["nodes"][-1]["data"]["is_ai_generated"]
+    node_ids = {n["id"] for n in body["nodes"]} | {"n1"}
+    assert all(e["source"] in node_ids and e["target"] in node_ids for e in body["edges"])
+
+    # fake 프로바이더는 같은 요청에 같은 내용을, 노드 ID는 매번 새로 만든다
+    again = client.post("/analyze", json=request).json()
+    assert [n["data"]["label"] for n in again["nodes"]] == [n["data"]["label"] for n in body["nodes"]]
+    assert again["nodes"][0]["id"] != body["nodes"][0]["id"]
+
+
+def sse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_chat_stream_sends_deltas_then_done_or_error(api_agent):
+    request = {
+        "suggestion_title": "습관 앱", "suggestion_content": "습관을 기록한다", "suggestion_category": "How",
+        "suggestion_phase": "Solution", "user_message": "알림은 어떻게 보낼까?", "bypass_cache": True,
+    }
+    response = client.post("/chat/stream", json=request)
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response.text)
+    names = [name for name, _ in events]
+    assert names[-1] == "done" and len(names) > 2 and set(names[:-1]) == {"delta"}
+    done = events[-1][1]
+    assert done["reply"] == "".join(data["content"] for _, data in events[:-1]) and not done["cached"]
+
+    # 업스트림이 마감 안에 첫 조각을 못 주면 스트림은 error 이벤트로 끝난다
+    api_agent.provider = FakeProvider(latency="fixed:1000")
+    api_agent.upstream = UpstreamPolicy(deadline=0.05, deadlines={}, retries=0)
+    events = sse_events(client.post("/chat/stream", json=request).text)
+    assert [name for name, _ in events] == ["error"] and events[0][1]["status"] == 504
+
+
+def test_json_array_item_parser_and_incremental_node_events():
+    nodes = [
+        {"label": 'say "hi" {not a node}', "content": "back\\slash ]", "category": "Who", "phase": "Problem"},
+        {"label": "둘째", "content": "[{}]", "category": "How", "phase": "Solution"},
+    ]
+    text = json.dumps({"note": "user_nodes [{", "user_nodes": nodes, "other": [{"x": 1}]}, ensure_ascii=False)
+    # 한 글자씩 쪼개 넣어도 원소가 닫히는 순간 하나씩 나오고, 문자열 안의 따옴표/괄호와 다른 배열은 무시한다
+    parser = JsonArrayItemParser("user_nodes")
+    emitted = [(i, item) for i, ch in enumerate(text) for item in parser.feed(ch)]
+    assert [item for _, item in emitted] == nodes and parser.text == text
+    assert emitted[0][0] < text.index("둘째")
+    # 잘린 꼬리: 닫히지 않은 원소는 내보내지 않는다
+    truncated = JsonArrayItemParser("user_nodes")
+    assert truncated.feed(text[:text.index("둘째")]) == nodes[:1]
+    assert truncated.feed('", "content": "잘림') == []
+
+    async def run(fail: bool):
+        provider = FakeProvider()
+        agent = main.ThinkingAgent(provider=provider)
+        stream, sent = provider.stream_structured, []
+
+        async def tracked(model, messages, response_format):
+            chunks = [chunk async for chunk in stream(model, messages, response_format)]
+            for chunk in chunks[:-1] if fail else chunks:
+                sent.append(chunk)
+                yield chunk
+            if fail:
+                raise RuntimeError("upstream dropped")
+
+        provider.stream_structured = tracked
+        graph = GraphSession.from_history([{"id": "n1", "data": {"title": "Tired people", "category": "Who", "phase": "Problem"}}])
+        events, first_node_chunks = [], None
+        try:
+            async for event in agent.stream_process_idea("I want to build a better todo app", graph=graph, use_cache=False):
+                if event["type"] == "node" and first_node_chunks is None:
+                    first_node_chunks = len(sent)
+                events.append(event)
+        except RuntimeError:
+            assert fail
+        await agent.aclose()
+        return events, first_node_chunks, len(sent), graph
+
+    # node 이벤트는 스트림이 끝나기 전에 나온다
+    events, first_node_chunks, total_chunks, graph = asyncio.run(run(fail=False))
+    assert first_node_chunks < total_chunks and events[-1]["type"] == "done"
+    placed = [e for e in events if e["type"] == "node" and not e["node"]["data"]["is_ai_generated"]]
+    assert len(graph.layout) == len(graph) == 1 + len(placed)
+    # 도중에 끊기면 이미 배치한 노드의 자리를 돌려준다
+    events, _, _, graph = asyncio.run(run(fail=True))
+    assert events and all(e["type"] == "node" for e in events)
+    assert len(graph) == len(graph.layout) == 1
+
+
+def test_chat_to_nodes_stream_failure_releases_slots():
+    async def run():
+        provider = FakeProvider()
+        agent = main.ThinkingAgent(provider=provider)
+        stream = provider.stream_structured
+
+        async def dropped(model, messages, response_format):
+            chunks = [chunk async for chunk in stream(model, messages, response_format)]
+            for chunk in chunks[:-1]:
+                yield chunk
+            raise RuntimeError("upstream dropped")
+
+        provider.stream_structured = dropped
+        graph = GraphSession(session_id="s1")
+        messages = [ChatMessage(role="assistant", content="첫 설명"), ChatMessage(role="user", content="알림 기능")]
+        events = []
+        try:
+            async for event in agent.stream_chat_to_nodes(
+                "습관 앱", "습관을 기록한다", "How", "Solution", messages,
+                graph=graph, use_cache=False, conversation_id="c1",
+            ):
+                events.append(event)
+            assert False, "expected the stream to fail"
+        except RuntimeError:
+            pass
+        # node 이벤트는 나갔지만 그래프에 반영되지 않았으므로 자리와 변환 체크포인트가 남지 않는다
+        assert events and len(graph) == len(graph.layout) == 0
+        assert agent.conversions.stats()["conversations"] == 0
+        await agent.aclose()
+
+    asyncio.run(run())
+
+
+def test_llm_cache_lru_ttl_and_disk_tier(tmp_path):
+    cache = LLMCache(max_entries=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # a를 최근으로 올렸으므로 다음 추가 때 b가 밀려난다
+    cache.set("c", "3")
+    assert cache.get("b") is None and cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+    short = LLMCache(ttl=0.01)
+    short.set("k", "v")
+    time.sleep(0.02)
+    assert short.get("k") is None and short.stats()["size"] == 0
+
+    # 디스크 계층은 재시작 뒤에도 읽히고, 만료되었거나 깨진 행은 miss로 보고 지운다
+    path = str(tmp_path / "cache.db")
+    LLMCache(db_path=path).set("k", "v")
+    restarted = LLMCache(db_path=path)
+    assert restarted.get("k") == "v" and restarted.stats()["disk_hits"] == 1
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO llm_cache VALUES ('expired', 'v', ?)", (time.time() - 1,))
+    conn.execute("INSERT INTO llm_cache VALUES ('corrupt', 'v', 'not a time')")
+    conn.commit()
+    assert restarted.get("expired") is None and restarted.get("corrupt") is None
+    assert [row[0] for row in conn.execute("SELECT key FROM llm_cache")] == ["k"]
+    conn.close()
+
+    async def run():
+        agent = main.ThinkingAgent(provider=FakeProvider())
+        agent.cache = LLMCache(db_path=path)
+        first = await agent.process_idea("I want to build a better todo app")
+        calls = agent.provider.calls
+        # 파싱할 수 없는 캐시 값은 지우고 업스트림에서 다시 받는다
+        for key in list(agent.cache._entries):
+            agent.cache.set(key, "{not json")
+        again = await agent.process_idea("I want to build a better todo app")
+        assert agent.provider.calls == calls + 1
+        assert [n.data.label for n in again["nodes"]] == [n.data.label for n in first["nodes"]]
+        # 스트리밍 경로도 깨진 캐시 값을 흘려보내지 않고 다시 받는다
+        for key in list(agent.cache._entries):
+            agent.cache.set(key, "{not json")
+        events = [e async for e in agent.stream_process_idea("I want to build a better todo app")]
+        assert agent.provider.calls == calls + 2 and events[-1]["type"] == "done"
+        await agent.aclose()
+
+    asyncio.run(run())
+
+
+def test_pruned_history_budget_order_and_fallback():
+    # 전체 문맥이 예산 안이면 pruned도 전체를 그대로 쓴다
+    small = GraphSession.from_history([{"id": "s1", "data": {"title": "Tired people", "category": "Who", "phase": "Problem"}}])
+    assert small.pruned_history_context("anything", HISTORY_TOP_K, HISTORY_RECENT, HISTORY_TOKEN_BUDGET) == small.history_context()
+
+    history = [
+        {"id": f"n{i}", "data": {"title": f"filler topic {i} " + "lorem ipsum " * 6, "category": "What", "phase": "Problem"}}
+        for i in range(300)
+    ]
+    history[50]["data"]["title"] = "habit tracker reminders"
+    graph = GraphSession.from_history(history)
+    query = "habit tracker reminders"
+    assert estimate_tokens(graph.history_context()) > HISTORY_TOKEN_BUDGET
+    *lines, omitted = graph.pruned_history_context(query, HISTORY_TOP_K, HISTORY_RECENT, HISTORY_TOKEN_BUDGET).split("\n")
+    assert estimate_tokens("\n".join(lines)) <= HISTORY_TOKEN_BUDGET
+    assert omitted == f"(관련도가 낮은 기존 노드 {300 - len(lines)}개는 생략됨)"
+    ids = [line.split(" | ")[0].removeprefix("- ID: ") for line in lines]
+    assert "n50" in ids and {f"n{i}" for i in range(300 - HISTORY_RECENT, 300)} <= set(ids)
+
+    # 예산이 빠듯하면 최근 노드가 먼저, 그다음 관련도 순으로 채우고 출력은 그래프 순서를 따른다
+    line_cost = max(estimate_tokens(line) for line in graph.history_context().split("\n"))
+    tight = graph.pruned_history_context(query, top_k=5, recent=2, token_budget=3 * line_cost).split("\n")
+    assert [line.split(" | ")[0] for line in tight[:-1]] == ["- ID: n50", "- ID: n298", "- ID: n299"]
+
+    # 기본 모드(HISTORY_MODE)는 pruned이고, 요청에서 full을 고르면 전체 문맥
+    agent = main.ThinkingAgent(provider=FakeProvider())
+    assert HISTORY_MODE == "pruned"
+    assert agent.history_context_for(graph, query) == graph.pruned_history_context(query, HISTORY_TOP_K, HISTORY_RECENT, HISTORY_TOKEN_BUDGET)
+    assert agent.history_context_for(graph, query, "full") == graph.history_context()
+
+
+def test_session_roundtrip():
+    history = [{"id": "n1", "data": {"title": "Tired people", "category": "Who", "phase": "Problem"}}]
+    created = client.post("/sessions", json={"nodes": history}).json()
+    assert created["version"] == 0
+
+    fetched = client.get(f"/sessions/{created['session_id']}").json()
+    assert fetched["nodes"] == history
+
+    synced = client.put(f"/sessions/{created['session_id']}", json={"nodes": []}).json()
+    assert synced["version"] == 1 and synced["nodes"] == []
+
+    stale = client.post("/analyze", json={
         "text": "I want to build a better todo app",
-        "history": []
+        "session_id": created["session_id"],
+        "client_version": 0,
     })
-    
-    # We expect 500 if NO API KEY, or 200 if API KEY is present
-    # Since we can't easily mock env vars in this simple script without potentially breaking things or needing pytest-mock
-    # We will just print the status and response
-    print(f"Status: {response.status_code}")
-    print(f"Response: {response.json()}")
+    assert stale.status_code == 409
+
+    # 숫자가 아닌 위치는 위치 없는 노드로 받고, id 없는 노드는 422
+    odd = [{"id": "n2", "data": {"title": "B", "category": "Who", "phase": "Problem"}, "position": {"x": None, "y": "top"}}]
+    assert client.put(f"/sessions/{created['session_id']}", json={"nodes": odd}).status_code == 200
+    assert client.post("/layout", json={"nodes": odd}).status_code == 200
+    assert client.post("/sessions", json={"nodes": [{"data": {"title": "C"}}]}).status_code == 422
+    assert client.post("/analyze", json={"text": "x", "history": [{"id": None}]}).status_code == 422
+
+
+def test_session_store_eviction_and_sqlite_writes(tmp_path):
+    store = InMemorySessionStore(max_sessions=2)
+    first, second, third = (store.create() for _ in range(3))
+    assert store.get(first.session_id) is None  # 오래 안 쓴 것부터 밀려난다
+    assert store.get(second.session_id) is second and store.get(third.session_id) is third
+    assert store.get(InMemorySessionStore(ttl=0).create().session_id) is None
+
+    async def run():
+        store = SQLiteSessionStore(str(tmp_path / "sessions.db"), max_sessions=1)
+        session = store.create([{"id": "n1", "data": {"title": "A", "category": "Who", "phase": "Problem"}}])
+        stale = session.to_dict()
+        session.replace([], [])
+        await store.save_async(session)
+        store._write(stale)  # 늦게 도착한 옛 버전 쓰기는 무시된다
+        store.create()       # 메모리에서 밀려나도 디스크에서 다시 읽는다
+        loaded = store.get(session.session_id)
+        assert loaded is not session and loaded.version == 1 and len(loaded) == 0
+
+    asyncio.run(run())
+
+
+def test_layout_skips_occupied_positions():
+    engine = LayoutEngine()
+    engine.occupy("dragged", 205, 155)  # Problem/Who 첫 슬롯(200, 150) 근처로 옮겨진 노드
+    first = engine.place("Problem", "Who", "a")
+    second = engine.place("Problem", "Who", "b")
+    assert first == {"x": 430, "y": 150}
+    assert second == {"x": -30, "y": 150}
+    assert engine.peek("Problem", "Who") == {"x": 660, "y": 150}
+
+    # 해제는 그 자리가 막고 있던 밴드의 커서만 그 슬롯까지 되돌린다
+    for i in range(6):
+        engine.place("Solution", "How", f"s{i}")
+    engine.release("a")
+    assert engine.peek("Problem", "Who") == first
+    assert engine.peek("Solution", "How") == engine.place("Solution", "How", "s6") and engine._cursors[("Solution", "How")] == 7
+    engine.release("s2")
+    assert engine._cursors[("Solution", "How")] == 2 and engine._cursors[("Problem", "Who")] == 1
+
+
+def test_batch_dedups_identical_items_and_keeps_distinct_nodes():
+    history = [{"id": "n1", "data": {"title": "Tired people", "category": "Who", "phase": "Problem"}}]
+    texts = ["I want to build a better todo app", " I want to build  a better todo app", "Habit tracker for runners"]
+
+    async def run():
+        agent = main.ThinkingAgent(provider=FakeProvider())
+        result = await agent.process_batch(texts, history=history, use_cache=False)
+        await agent.aclose()
+        return result
+
+    body = asyncio.run(run())
+    items = sorted(body["items"], key=lambda item: item["index"])
+    # 공백만 다른 인풋은 한 번만 분석하고 앞 항목의 노드를 가리킨다
+    assert [item["duplicate_of"] for item in items] == [None, 0, None]
+    assert items[1]["node_ids"] == items[0]["node_ids"]
+    # 서로 다른 항목은 제목이 같아도 각자의 노드를 만든다
+    ids = [n["id"] for n in body["nodes"]]
+    assert len(ids) == len(set(ids)) and not set(items[0]["node_ids"]) & set(items[2]["node_ids"])
+    assert sum(n["data"]["is_ai_generated"] for n in body["nodes"]) == 2
+    pairs = [(e["source"], e["target"]) for e in body["edges"]]
+    assert len(set(pairs)) == len(pairs) and all(s != t for s, t in pairs)
+
+    async def disconnect():
+        agent = main.ThinkingAgent(provider=FakeProvider(latency="fixed:5000"))
+        events = agent.stream_process_batch(["a", "b", "c"], use_cache=False)
+        before = asyncio.all_tasks()
+        consumer = asyncio.create_task(events.__anext__())
+        await asyncio.sleep(0.05)
+        items = asyncio.all_tasks() - before - {consumer}
+        consumer.cancel()  # 클라이언트가 끊긴 경우
+        await asyncio.gather(consumer, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        assert items and all(task.done() for task in items)
+        await agent.aclose()
+
+    asyncio.run(disconnect())
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "reply"
+
+    async def run():
+        return await asyncio.gather(*[flight.do("same", upstream) for _ in range(3)])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True]
+    assert flight.stats()["coalesced"] == 2 and flight.stats()["in_flight"] == 0
+
+    async def abandon():
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def slow():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flight.do("slow", slow)) for _ in range(2)]
+        await started.wait()
+        # 한쪽이 떠나도 남은 쪽이 있으면 업스트림 호출은 계속된다
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set() and flight.stats()["in_flight"] == 1
+        waiters[1].cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert flight.stats()["abandoned"] == 1 and flight.stats()["in_flight"] == 0
+
+    asyncio.run(abandon())
+
+
+def test_metrics_endpoint():
+    client.post("/analyze", json={"text": "metrics probe", "history": []})
+    body = client.get("/metrics").text
+    assert 'thinking_requests_total{endpoint="/analyze",method="POST",status="200"}' in body
+    assert 'thinking_stage_seconds_count{endpoint="/analyze",stage="llm"}' in body
+    assert "thinking_llm_tokens_total" in body
+
+
+def test_compaction_threshold_and_conversation_isolation():
+    async def run():
+        folded = []
+
+        async def summarize(previous, messages):
+            folded.append(len(messages))
+            return f"요약 {len(messages)}"
+
+        compactor = ConversationCompactor(summarize, keep_messages=2, token_budget=100)
+        short = [ChatMessage(role="user", content="짧은 질문")] * 4
+        assert compactor.compact("s\0a", short) == (None, short)  # 예산 안이면 그대로, 요약도 예약하지 않는다
+        long = [ChatMessage(role="user", content=f"긴 메시지 {i} " + "idea " * 20) for i in range(6)]
+        # 첫 요청은 요약을 기다리지 않고 예산 안의 최근 메시지만 보낸다
+        assert compactor.compact("s\0a", long) == (None, long[-2:])
+        await compactor.drain()
+        assert folded == [4]
+        assert compactor.compact("s\0a", long) == ("요약 4", long[-2:])
+
+        # 같은 메시지여도 다른 대화(또는 다른 세션)는 그 요약을 쓰지 않고, 대화 키가 없으면 요약하지 않는다
+        assert compactor.compact("s\0b", long)[0] is None
+        assert compactor.compact("t\0a", long)[0] is None
+        assert compactor.compact(None, long) == (None, long[-2:])
+        await compactor.drain()
+        assert folded == [4, 4, 4]
+
+    asyncio.run(run())
+
+
+def test_circuit_breaker_fails_fast_with_503(api_agent):
+    api_agent.provider = FakeProvider(error_rate=1.0)
+    api_agent.upstream = UpstreamPolicy(retries=1, backoff_base=0.001, breaker=CircuitBreaker(threshold=2, cooldown=60))
+    statuses = [
+        client.post("/analyze", json={"text": f"failing {i}", "history": []}).status_code
+        for i in range(3)
+    ]
+    assert statuses == [502, 502, 503]
+    assert api_agent.provider.calls == 4  # 열린 뒤에는 업스트림을 부르지 않는다
+
+
+def test_stream_deadline_and_hedge_admission():
+    async def chunks(delay):
+        for i in range(3):
+            await asyncio.sleep(delay)
+            yield i
+
+    async def run():
+        policy = UpstreamPolicy(deadline=0.05, deadlines={}, retries=0)
+        # 소비자가 조각을 붙잡고 있던 시간은 마감에 세지 않는다
+        received = []
+        async for item in policy.stream("chat", lambda: chunks(0.01)):
+            received.append(item)
+            await asyncio.sleep(0.05)
+        assert received == [0, 1, 2]
+        # 업스트림이 늦으면 소비자 쪽의 취소가 아니라 스트림에서 UpstreamTimeout
+        try:
+            async for _ in policy.stream("chat", lambda: chunks(0.2)):
+                pass
+            assert False, "expected a stream timeout"
+        except UpstreamTimeout:
+            pass
+
+        calls, admitted = [], []
+
+        async def attempt():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async def reject():
+            raise AdmissionRejected("saturated", retry_after=1)
+
+        async def admit():
+            admitted.append(1)
+
+        # 헤지도 입장 제어를 거친다: 거절되면 첫 요청만 기다린다
+        for admit_hedge, expected_calls in ((reject, 1), (admit, 2)):
+            calls.clear()
+            policy = UpstreamPolicy(hedge=True, hedge_min_samples=1, retries=0, deadlines={})
+            policy.latency.record("analyze", 0.001)
+            assert await policy.call("analyze", attempt, admit_hedge) == "ok"
+            assert len(calls) == expected_calls
+        assert admitted == [1]
+
+    asyncio.run(run())
+
+
+def test_model_router_budget_and_degraded_fallback():
+    router = ModelRouter({"analyze": [
+        ModelRoute(model="big", expected_ms=6000),
+        ModelRoute(model="small", expected_ms=2000),
+    ]}, min_samples=3)
+    assert router.route("analyze", "big") == ("big", "primary")
+    assert router.route("analyze", "big", budget_ms=3000) == ("small", "budget")
+    for _ in range(3):
+        router.record("big", 1.0, ok=False)
+    assert router.route("analyze", "big") == ("small", "degraded")
+
+    response = client.post("/analyze", json={"text": "budget probe", "history": [], "latency_budget_ms": 3500})
+    assert response.json()["model"] == "gpt-4o-mini"
+
+    async def queued():
+        # 동시 호출 슬롯이 하나면 뒤 호출은 앞 호출만큼 기다리지만, 그 대기는 업스트림 지연으로 세지 않는다
+        agent = main.ThinkingAgent(provider=FakeProvider(latency="fixed:100"), max_concurrency=1)
+        await asyncio.gather(*(
+            agent._create_completion("m", [{"role": "user", "content": f"q{i}"}], use_cache=False) for i in range(3)
+        ))
+        assert agent.router.stats["m"].percentile_ms(100) < 180
+        assert agent.upstream.latency.percentile("default", 100) < 0.18
+        await agent.aclose()
+
+    asyncio.run(queued())
+
+
+def test_schema_registry_prebuilt_and_warm_up(api_agent):
+    assert AIAnalysisResult in response_schemas and ChatNodeResult in response_schemas
+    schema = response_schemas.get(ChatNodeResult)
+    assert schema is response_schemas.get(ChatNodeResult)  # 호출마다 다시 만들지 않는다
+    assert schema.response_format["json_schema"]["strict"] is True
+    assert schema.response_format["json_schema"]["schema"]["additionalProperties"] is False
+
+    report = asyncio.run(api_agent.warm_up())
+    assert report["error"] is None and "ChatNodeResult" in report["schemas"]
+
+
+def test_fast_paths_match_reference():
+    texts = ["습관 앱 알림", "", "Habit   TRACKER app"]
+    matrix = hashed_ngram_matrix(texts)
+    assert np.allclose(matrix[2], hashed_ngram_vector("habit tracker app"))
+    assert matrix[1].sum() == 0 and np.isclose(np.linalg.norm(matrix[0]), 1.0)
+
+    payload = client.post("/analyze", json={"text": "fast path probe", "history": []}).json()
+    validated = AnalysisResponse.model_validate(payload)
+    body = prevalidated(AnalysisResponse, dict(validated)).body
+    assert json.loads(body) == json.loads(validated.model_dump_json())
+
+
+def test_job_lanes_keep_interactive_capacity():
+    async def run():
+        gate = asyncio.Event()
+
+        async def slow(payload):
+            await gate.wait()
+            return {"value": payload["value"]}
+
+        manager = JobManager({"slow": slow}, store=InMemoryJobStore(), workers=2, bulk_workers=1)
+        bulk = [manager.submit("slow", {"value": i}, "bulk") for i in range(3)]
+        interactive = manager.submit("slow", {"value": "now"}, "interactive")
+        await asyncio.sleep(0.01)
+        assert manager.running() == {"interactive": 1, "bulk": 1}
+        assert manager.queue_depth()["bulk"] == 2
+        assert manager.cancel(bulk[2].job_id).status == "cancelled"
+
+        gate.set()
+        done = await manager.wait(interactive.job_id, 1)
+        assert done.status == "succeeded" and done.result == {"value": "now"}
+        assert (await manager.wait(bulk[1].job_id, 1)).status == "succeeded"
+        await manager.stop()
+
+        # 요청이 없어도 워커 쪽에서 만료된 결과를 지운다
+        store = InMemoryJobStore()
+        idle = JobManager({"slow": slow}, store=store, workers=1, ttl=0.01, purge_interval=0.01)
+        finished = idle.submit("slow", {"value": 1})
+        await asyncio.sleep(0.1)
+        assert store.get(finished.job_id) is None
+        await idle.stop()
+
+    asyncio.run(run())
+
+
+def test_job_cancel_cancels_upstream_call():
+    async def run():
+        provider = FakeProvider(latency="fixed:5000")
+        agent = main.ThinkingAgent(provider=provider)
+        cancelled = asyncio.Event()
+        wait = provider._wait
+
+        async def tracked(output):
+            try:
+                return await wait(output)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        provider._wait = tracked
+
+        async def analyze(payload):
+            return await agent.process_idea(payload["text"])
+
+        manager = JobManager({"analyze": analyze}, store=InMemoryJobStore())
+        job = manager.submit("analyze", {"text": "I want to build a better todo app"})
+        while not provider.calls:
+            await asyncio.sleep(0.01)
+        manager.cancel(job.job_id)
+        # 캐시 키가 있는 호출은 single-flight 태스크에서 돈다: 잡이 마지막 대기자였으므로 업스트림 호출도 끊긴다
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert (await manager.wait(job.job_id, 1)).status == "cancelled"
+        assert agent.singleflight.stats()["abandoned"] == 1
+        await manager.stop()
+        await agent.aclose()
+
+    asyncio.run(run())
+
+
+def test_session_channel_multiplexes_and_pushes_graph():
+    history = [{"id": "n1", "data": {"title": "Tired people", "category": "Who", "phase": "Problem"}}]
+    sid = client.post("/sessions", json={"nodes": history}).json()["session_id"]
+    with TestClient(main.app) as c, c.websocket_connect(f"/ws/sessions/{sid}") as ws, c.websocket_connect(f"/ws/sessions/{sid}") as other:
+        assert ws.receive_json()["type"] == other.receive_json()["type"] == "hello"
+        ws.send_json({"id": "a1", "op": "analyze", "payload": {"text": "I want to build a better todo app", "bypass_cache": True}})
+        ws.send_json({"id": "p1", "op": "ping"})
+        events, pongs = [], []
+        # pong과 분석 이벤트는 서로 다른 태스크가 보내므로 순서가 정해져 있지 않다
+        while not pongs or not events or events[-1]["type"] not in ("done", "error"):
+            message = ws.receive_json()
+            (pongs if message["type"] == "pong" else events).append(message)
+        assert all(e["id"] == "a1" for e in events) and events[-1]["type"] == "done"
+        pushed = other.receive_json()
+        assert pushed["type"] == "graph" and pushed["origin"] == "a1"
+        assert {n["id"] for n in pushed["nodes"]} == {e["node"]["id"] for e in events if e["type"] == "node"}
+
+        ws.send_json({"id": "x", "op": "nope"})
+        assert ws.receive_json() == {"id": "x", "type": "error", "status": 400, "detail": "Unknown op: nope"}
+        # 객체가 아닌 JSON도 연결을 끊지 않고 400 오류 프레임으로 답한다
+        for frame in ("[]", "1", '"x"', "{not json"):
+            ws.send_text(frame)
+            assert ws.receive_json() == {"id": None, "type": "error", "status": 400, "detail": "Invalid JSON message."}
+        ws.send_json({"id": "p2", "op": "ping"})
+        assert ws.receive_json() == {"id": "p2", "type": "pong"}
+
+
+def test_opening_turn_prefetch_serves_first_chat():
+    async def run():
+        agent = main.ThinkingAgent(provider=FakeProvider())
+        agent.prefetcher = ChatPrefetcher(agent.chat_with_suggestion, token_budget=10_000)
+        result = await agent.process_idea("I want to build a better todo app", use_cache=False)
+        suggestion = result["nodes"][-1]
+        await asyncio.sleep(0.05)
+        opening = dict(
+            suggestion_title=suggestion.data.label, suggestion_content=suggestion.data.content,
+            suggestion_category=suggestion.data.category, suggestion_phase=suggestion.data.phase,
+            messages=[], user_message=CHAT_OPENING_MESSAGE,
+        )
+        served = await agent.chat_with_suggestion(**opening, suggestion_id=suggestion.id)
+        assert served["prefetched"] and served["reply"]
+        # 다른 첫 메시지는 미리 만든 답변을 쓰지 않는다
+        other = await agent.chat_with_suggestion(**{**opening, "user_message": "다른 질문"}, suggestion_id=suggestion.id)
+        assert not other["prefetched"]
+        stats = agent.prefetcher.stats()
+        assert stats["counts"]["scheduled"] == 1 and stats["counts"]["hit"] == 1 and stats["use_rate"] == 1.0
+
+        # 예산을 넘는 추측 생성은 예약하지 않는다
+        agent.prefetcher.token_budget = 0
+        await agent.process_idea("Another idea", use_cache=False)
+        assert agent.prefetcher.stats()["counts"]["skipped_budget"] == 1
+        await agent.aclose()
+
+    asyncio.run(run())
+
+
+def test_local_cross_connections_replace_llm_field():
+    history = [
+        {"id": "n1", "data": {"title": "아침 습관 기록", "content": "아침마다 습관을 기록한다", "category": "How", "phase": "Solution"}},
+        {"id": "n2", "data": {"title": "팀 협업 비용", "content": "팀 협업 도구 비용이 크다", "category": "Why", "phase": "Problem"}},
+    ]
+    graph = GraphSession.from_history(history)
+    new = [UserNode(label="습관 기록 앱", content="아침 습관을 기록하는 앱", category="How", phase="Solution")]
+    connections = local_cross_connections(graph, new, max_edges=1)
+    assert [(c.existing_node_id, c.new_node_index) for c in connections] == [("n1", 0)]
+
+    async def run():
+        agent = main.ThinkingAgent(provider=FakeProvider())
+        agent.cross_connections = "local"
+        assert "cross_connections" not in json.dumps(response_schemas.get(agent.analysis_schema).response_format)
+        result = await agent.process_idea("I want to build a better todo app", history=history, use_cache=False)
+        cross = [e for e in result["edges"] if e.id.startswith("e-cross-")]
+        assert cross and all(e.source in {"n1", "n2"} for e in cross)
+        await agent.aclose()
+
+    asyncio.run(run())
+
+
+def test_admission_round_robin_and_shedding(api_agent):
+    async def run():
+        # 초당 100토큰, 버킷을 비운 뒤 A가 3개, B가 1개를 줄 세운다
+        admission = AdmissionController(tpm=6000, rpm=0, headroom=1.0, max_wait={"interactive": 2, "speculative": 0})
+        await admission.admit(6000)
+        order = []
+
+        async def request(client, name, cost=10):
+            bind_admission(client, "interactive")
+            await admission.admit(cost)
+            order.append(name)
+
+        tasks = [asyncio.create_task(request("A", f"a{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("B", "b0")))
+        await asyncio.sleep(0)
+        assert admission.stats()["queue_depth"]["interactive"] == 4
+        await asyncio.gather(*tasks)
+        assert order == ["a0", "b0", "a1", "a2"]
+
+        # 예상 대기가 max_wait를 넘거나, 기다리지 않는 우선순위면 바로 거절
+        for priority, cost in (("interactive", 1000), ("speculative", 10)):
+            bind_admission("C", priority)
+            try:
+                await admission.admit(cost)
+                assert False, "should shed"
+            except AdmissionRejected as e:
+                assert e.status_code == 429 and e.retry_after >= 1
+
+    asyncio.run(run())
+
+    api_agent.admission = AdmissionController(tpm=600, rpm=0)
+    api_agent.admission.tokens.take(600)  # 한도를 다 쓴 상태: 다음 요청은 10초 안에 못 나간다
+    response = client.post("/analyze", json={"text": "I want to build a better todo app", "bypass_cache": True})
+    assert response.status_code == 429 and int(response.headers["retry-after"]) >= 1
+
+
+def test_relayout_respects_bands_and_updates_session(monkeypatch):
+    from backend.relayout import layout_graph, overlapping
+    categories = ["Why", "Who", "What", "How", "When", "Where"]
+    nodes = [
+        {"id": f"n{i}", "data": {"category": categories[i % 6], "phase": "Problem" if i % 2 else "Solution"}}
+        for i in range(120)
+    ]
+    edges = [{"id": f"e{i}", "source": f"n{i}", "target": f"n{(i + 7) % 120}"} for i in range(120)]
+    positions = layout_graph(nodes, edges, warm_start=False)
+    pos = np.array([[positions[n["id"]]["x"], positions[n["id"]]["y"]] for n in nodes])
+    assert not overlapping(pos).any()
+    # category 줄 순서와 Problem(왼쪽)/Solution(오른쪽) 배치가 유지된다
+    mean_y = [pos[i::6, 1].mean() for i in range(6)]
+    assert mean_y == sorted(mean_y)
+    assert pos[1::2, 0].mean() < pos[0::2, 0].mean()
+
+    created = client.post("/sessions", json={"nodes": [{**n, "position": positions[n["id"]]} for n in nodes], "edges": edges}).json()
+    response = client.post("/layout", json={"session_id": created["session_id"], "client_version": created["version"]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["version"] == created["version"] + 1 and set(body["positions"]) == {n["id"] for n in nodes}
+    # warm start는 이미 정리된 배치를 크게 흩뜨리지 않는다
+    moved = [np.hypot(body["positions"][k]["x"] - v["x"], body["positions"][k]["y"] - v["y"]) for k, v in positions.items()]
+    assert np.median(moved) < 230
+    stored = client.get(f"/sessions/{created['session_id']}").json()
+    assert stored["nodes"][0]["position"] == body["positions"][stored["nodes"][0]["id"]]
+
+    # 계산하는 동안 다른 요청이 세션을 바꾸면 덮어쓰지 않고 409
+    def racing(*args, **kwargs):
+        main.session_store.get(created["session_id"]).version += 1
+        return layout_graph(*args, **kwargs)
+
+    monkeypatch.setattr(main, "layout_graph", racing)
+    response = client.post("/layout", json={"session_id": created["session_id"]})
+    assert response.status_code == 409
+    assert client.get(f"/sessions/{created['session_id']}").json()["nodes"] == stored["nodes"]
+
+
+def test_chat_to_nodes_converts_only_new_turns():
+    async def run():
+        agent = main.ThinkingAgent(provider=FakeProvider())
+        prompts = []
+        build = agent.build_chat_to_nodes_messages
+        agent.build_chat_to_nodes_messages = lambda *a, **k: prompts.append(build(*a, **k)) or prompts[-1]
+        card = dict(suggestion_title="습관 앱", suggestion_content="습관을 기록한다",
+                    suggestion_category="How", suggestion_phase="Solution", use_cache=False, conversation_id="c1")
+        turns = [ChatMessage(role=r, content=c) for r, c in [
+            ("assistant", "첫 설명"), ("user", "알림 기능"), ("assistant", "알림 좋네요"), ("user", "친구 공유 기능"),
+        ]]
+        graph = GraphSession.from_history([])
+
+        first = await agent.chat_to_nodes(messages=turns[:2], graph=graph, **card)
+        assert first["nodes"] and first["converted_messages"] == 2
+        # 새 턴이 없으면 LLM을 부르지 않는다
+        calls = agent.provider.calls
+        same = await agent.chat_to_nodes(messages=turns[:2], graph=graph, **card)
+        assert same["nodes"] == [] and same["model"] is None and agent.provider.calls == calls
+
+        second = await agent.chat_to_nodes(messages=turns, graph=graph, **card)
+        prompt = prompts[-1][0]["content"]
+        assert "친구 공유 기능" in prompt and "첫 설명" not in prompt and first["nodes"][0].id in prompt
+        assert second["converted_messages"] == 4
+        old_labels = {n.data.label for n in first["nodes"]}
+        assert not old_labels & {n.data.label for n in second["nodes"]}
+
+        # 앞부분이 바뀐 대화는 처음부터 다시 변환한다
+        edited = [ChatMessage(role="assistant", content="다른 설명"), *turns[1:]]
+        await agent.chat_to_nodes(messages=edited, graph=graph, **card)
+        assert "다른 설명" in prompts[-1][0]["content"]
+        assert agent.conversions.stats()["counts"] == {"full": 2, "incremental": 1, "unchanged": 1, "reset": 1}
+
+        # 노드가 그래프에 들어간 뒤 done 전에 끊겨도 체크포인트가 남아 다시 만들지 않는다
+        other = {**card, "conversation_id": "c2"}
+        stream = agent.stream_chat_to_nodes(messages=turns[:2], graph=graph, **other)
+        types = []
+        async for event in stream:
+            types.append(event["type"])
+            if event["type"] == "edge":
+                break
+        await stream.aclose()
+        assert "node" in types and types[-1] == "edge"
+        calls = agent.provider.calls
+        again = await agent.chat_to_nodes(messages=turns[:2], graph=graph, **other)
+        assert again["nodes"] == [] and again["converted_messages"] == 2 and agent.provider.calls == calls
+        await agent.aclose()
+
+    asyncio.run(run())
+
+
+def test_chat_conversion_checkpoints_stay_within_conversation():
+    async def run():
+        agent = main.ThinkingAgent(provider=FakeProvider())
+        prompts = []
+        build = agent.build_chat_to_nodes_messages
+        agent.build_chat_to_nodes_messages = lambda *a, **k: prompts.append(build(*a, **k)) or prompts[-1]
+        card = dict(suggestion_title="습관 앱", suggestion_content="습관을 기록한다",
+                    suggestion_category="How", suggestion_phase="Solution", use_cache=False)
+        opening = [ChatMessage(role="assistant", content="첫 설명"), ChatMessage(role="user", content="알림 기능")]
+        first = await agent.chat_to_nodes(messages=opening, graph=GraphSession(session_id="s1"), conversation_id="c1", **card)
+        # 같은 카드, 같은 첫 턴이어도 다른 대화(또는 다른 세션의 같은 ID)는 처음부터 변환하고 노드를 나누지 않는다
+        for session_id, conversation_id in (("s1", "c2"), ("s2", "c1")):
+            graph = GraphSession(session_id=session_id)
+            other = await agent.chat_to_nodes(messages=opening, graph=graph, conversation_id=conversation_id, **card)
+            prompt = prompts[-1][0]["content"]
+            assert other["nodes"] and other["converted_messages"] == 2
+            assert "[이미 만든 노드]" not in prompt and not any(n.id in prompt for n in first["nodes"])
+
+        # 대화 ID가 없으면 체크포인트 없이 매번 대화 전체를 변환한다
+        for _ in range(2):
+            anonymous = await agent.chat_to_nodes(messages=opening, graph=graph, **card)
+            assert anonymous["nodes"] and anonymous["converted_messages"] is None
+            assert "[이미 만든 노드]" not in prompts[-1][0]["content"]
+        assert agent.conversions.stats() == {"conversations": 3, "counts": {"full": 3, "incremental": 0, "unchanged": 0, "reset": 0}}
+        await agent.aclose()
+
+    asyncio.run(run())
+
+
+def test_cassette_records_and_replays_by_request_hash(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    history = [{"id": "n1", "data": {"title": "Tired people", "category": "Who", "phase": "Problem"}}]
+
+    async def run():
+        recorder = CassetteProvider(FakeProvider(), "record", path=path)
+        agent = main.ThinkingAgent(provider=recorder)
+        recorded = await agent.process_idea("I want to build a better todo app", history=history, use_cache=False)
+        events = [e async for e in agent.stream_chat_with_suggestion("t", "c", "How", "Solution", [], "hi", use_cache=False)]
+        await agent.aclose()
+        entries = load_cassette(path)
+        assert [e["call"] for e in entries] == ["parse", "stream"]
+        assert entries[0]["history_nodes"] == 1 and entries[1]["chunks"] > 1 and entries[1]["ttft_ms"] is not None
+
+        player = CassetteProvider(None, "replay", path=path)
+        agent = main.ThinkingAgent(provider=player)
+        replayed = await agent.process_idea("I want to build a better todo app", history=history, use_cache=False)
+        assert [n.data.label for n in replayed["nodes"]] == [n.data.label for n in recorded["nodes"]]
+        # 녹화 때 스트리밍이었던 응답도 한 번에 받는 호출로 쓸 수 있다
+        reply = await agent.chat_with_suggestion("t", "c", "How", "Solution", [], "hi", use_cache=False)
+        assert reply["reply"] == events[-1]["reply"]
+        try:
+            await agent.process_idea("never recorded", use_cache=False)
+            assert False, "expected a cassette miss"
+        except CassetteMiss:
+            pass
+        assert player.counts == {"recorded": 0, "hit": 2, "miss": 1}
+        await agent.aclose()
+
+    asyncio.run(run())
+
+
+def test_pipelined_analysis_matches_single_call_shape():
+    history = [
+        {"id": "n1", "data": {"title": "Tired people", "category": "Who", "phase": "Problem"}},
+        {"id": "n2", "data": {"title": "Rest plaza", "category": "What", "phase": "Solution"}},
+    ]
+
+    async def run():
+        agent = main.ThinkingAgent(provider=FakeProvider())
+        result = await agent.process_idea("I want to build a better todo app", history=history, use_cache=False, pipeline=True)
+        stages = result["stages"]
+        assert set(stages) == {"extract", "suggest", "connect", "total_ms"}
+        # 추출은 한 번 호출과 같은 모델, 제안/연결은 더 작은 기본 모델
+        assert stages["extract"]["model"] == result["model"] and stages["suggest"]["model"] == CHAT_MODEL
+        *user_nodes, suggestion = result["nodes"]
+        assert user_nodes and suggestion.data.is_ai_generated
+        edges = {(e.source, e.target) for e in result["edges"]}
+        assert any(target == suggestion.id for _, target in edges)
+        assert any(source in {"n1", "n2"} for source, _ in edges)
+
+        # 스트리밍도 같은 순서의 이벤트와 done의 stages
+        events = [e async for e in agent.stream_process_idea("Another idea", history=history, use_cache=False, pipeline=True)]
+        assert [e["type"] for e in events][-1] == "done" and "suggest" in events[-1]["stages"]
+        # 기존 노드가 없으면 연결 호출은 생략한다
+        empty = await agent.process_idea("Fresh canvas", use_cache=False, pipeline=True)
+        assert "connect" not in empty["stages"]
+        await agent.aclose()
+
+    asyncio.run(run())
+
 
 if __name__ == "__main__":
     test_analyze_endpoint()